@@ -0,0 +1,404 @@
+import os
+import json
+import base64
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from read_cache import VersionedCache
+
+# ------------------- Configuration -------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(BASE_DIR, "appointments.db")
+LEGACY_JSON_FILE = os.path.join(BASE_DIR, "appointments.json")
+
+APPOINTMENT_FIELDS = [
+    "name", "age", "location", "symptoms", "preferred_hospital", "urgency_score",
+    "time_recommendation", "key_symptoms", "notes", "booking_time", "status", "specialist",
+    "patient_id",
+]
+
+# Urgency bands as shown in the UI (see get_urgency_color in pages/main.py)
+URGENCY_BANDS = {"high": (8, 10), "medium": (5, 7), "low": (0, 4)}
+DEFAULT_PAGE_SIZE = 20
+
+# Every write stamps the row with the next revision, so readers can ask for
+# "everything that changed since revision N" with one indexed range scan
+NEXT_REVISION = "(SELECT COALESCE(MAX(revision), 0) + 1 FROM appointments)"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    age TEXT,
+    location TEXT,
+    symptoms TEXT,
+    preferred_hospital TEXT,
+    urgency_score INTEGER,
+    time_recommendation TEXT,
+    key_symptoms TEXT,
+    notes TEXT,
+    booking_time TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Pending',
+    specialist TEXT,
+    revision INTEGER,
+    patient_id TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Columns added after the first release; existing databases get them via ALTER TABLE
+ADDED_COLUMNS = {"specialist": "TEXT", "revision": "INTEGER", "patient_id": "TEXT"}
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments(status);
+CREATE INDEX IF NOT EXISTS idx_appointments_name ON appointments(name);
+CREATE INDEX IF NOT EXISTS idx_appointments_booking_time ON appointments(booking_time);
+CREATE INDEX IF NOT EXISTS idx_appointments_queue
+    ON appointments(status, COALESCE(urgency_score, 0) DESC, booking_time, id);
+CREATE INDEX IF NOT EXISTS idx_appointments_revision ON appointments(revision);
+CREATE INDEX IF NOT EXISTS idx_appointments_patient ON appointments(patient_id);
+"""
+
+# Reads keyed on the store revision; reruns cost one MAX(revision) lookup
+_read_cache = VersionedCache("appointments")
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+# ------------------- Connection -------------------
+def _open(db_file: str) -> sqlite3.Connection:
+    # Autocommit mode; multi-statement writes use explicit BEGIN IMMEDIATE
+    conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+# One connection per thread (Streamlit runs each session in its own thread)
+def get_connection(db_file: str = DB_FILE) -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_file)
+    if conn is None:
+        conn = conns[db_file] = _open(db_file)
+        init_db(conn, db_file)
+    return conn
+
+
+def init_db(conn: sqlite3.Connection, db_file: str = DB_FILE):
+    with _init_lock:
+        if db_file in _initialized:
+            return
+        create_schema(conn)
+        # First start against an existing appointments.json imports it once
+        if db_file == DB_FILE and os.path.exists(LEGACY_JSON_FILE):
+            migrate_from_json(LEGACY_JSON_FILE, conn)
+        _initialized.add(db_file)
+
+
+def create_schema(conn: sqlite3.Connection):
+    conn.executescript(SCHEMA)
+    _add_missing_columns(conn)
+    conn.executescript(INDEXES)
+
+
+def _add_missing_columns(conn: sqlite3.Connection):
+    existing = {row["name"] for row in conn.execute("PRAGMA table_info(appointments)")}
+    for column, column_type in ADDED_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE appointments ADD COLUMN {column} {column_type}")
+    conn.execute("UPDATE appointments SET revision = id WHERE revision IS NULL")
+
+
+# ------------------- Rows -------------------
+def _to_dict(row: sqlite3.Row) -> Dict:
+    record = dict(row)
+    record.pop("revision", None)
+    # Keep the shape the JSON file had: urgency_score was stored as a string
+    if record.get("urgency_score") is not None:
+        record["urgency_score"] = str(record["urgency_score"])
+    return record
+
+
+def _urgency(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ------------------- Migration -------------------
+def migration_count(conn: sqlite3.Connection, key: str) -> Optional[int]:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return int(row[0]) if row else None
+
+
+def migrate_from_json(path: str = LEGACY_JSON_FILE, conn: Optional[sqlite3.Connection] = None) -> int:
+    conn = conn or get_connection()
+    try:
+        with open(path, "r") as f:
+            records = json.load(f)
+    except (OSError, ValueError):
+        records = []
+
+    migrated = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Checked under the write lock, so of two processes starting at once
+        # only the first imports the file
+        if migration_count(conn, "json_migrated") is not None:
+            conn.execute("ROLLBACK")
+            return 0
+        for record in records:
+            values = {field: record.get(field) for field in APPOINTMENT_FIELDS}
+            values["urgency_score"] = _urgency(values["urgency_score"])
+            values["status"] = values["status"] or "Pending"
+            values["booking_time"] = values["booking_time"] or ""
+            values["name"] = values["name"] or ""
+            # The JSON store could hand out duplicate IDs; later duplicates get fresh ones
+            legacy_id = record.get("id")
+            taken = isinstance(legacy_id, int) and conn.execute(
+                "SELECT 1 FROM appointments WHERE id = ?", (legacy_id,)
+            ).fetchone()
+            if isinstance(legacy_id, int) and not taken:
+                values["id"] = legacy_id
+            columns = ", ".join(values)
+            placeholders = ", ".join("?" for _ in values)
+            conn.execute(
+                f"INSERT INTO appointments ({columns}, revision) VALUES ({placeholders}, {NEXT_REVISION})",
+                list(values.values()),
+            )
+            migrated += 1
+        conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (str(migrated),))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _read_cache.invalidate()
+    return migrated
+
+
+# ------------------- Appointments -------------------
+def add_appointment(record: Dict, db_file: str = DB_FILE) -> int:
+    conn = get_connection(db_file)
+    values = {field: record.get(field) for field in APPOINTMENT_FIELDS}
+    values["urgency_score"] = _urgency(values["urgency_score"])
+    values["status"] = values["status"] or "Pending"
+    columns = ", ".join(values)
+    placeholders = ", ".join("?" for _ in values)
+    cursor = conn.execute(
+        f"INSERT INTO appointments ({columns}, revision) VALUES ({placeholders}, {NEXT_REVISION})",
+        list(values.values()),
+    )
+    _read_cache.invalidate()
+    return cursor.lastrowid
+
+
+def get_appointment(appointment_id: int, db_file: str = DB_FILE) -> Optional[Dict]:
+    row = get_connection(db_file).execute("SELECT * FROM appointments WHERE id = ?", (appointment_id,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+# IDs of the appointments booked by a logged-in patient; bookings made
+# without a login (patient_id NULL) belong to nobody
+def appointment_ids_for(patient_id: str, db_file: str = DB_FILE) -> List[int]:
+    rows = get_connection(db_file).execute(
+        "SELECT id FROM appointments WHERE patient_id = ? ORDER BY id", (str(patient_id),)
+    )
+    return [row[0] for row in rows]
+
+
+def list_appointments(status: Optional[str] = None, name: Optional[str] = None, db_file: str = DB_FILE) -> List[Dict]:
+    def load():
+        query = "SELECT * FROM appointments"
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if name:
+            clauses.append("name = ?")
+            params.append(name)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY id"
+        return [_to_dict(row) for row in get_connection(db_file).execute(query, params)]
+
+    rows = _read_cache.get(("list", status, name, db_file), current_revision(db_file), load)
+    # Callers get their own dicts; the cached ones stay untouched
+    return [dict(row) for row in rows]
+
+
+# Atomic status transition: only applies if the row is still in expected_status.
+# Returns False when someone else already moved it (or the ID does not exist).
+def set_status(appointment_id: int, new_status: str, expected_status: Optional[str] = "Pending", db_file: str = DB_FILE) -> bool:
+    conn = get_connection(db_file)
+    if expected_status is None:
+        cursor = conn.execute(
+            f"UPDATE appointments SET status = ?, revision = {NEXT_REVISION} WHERE id = ?",
+            (new_status, appointment_id),
+        )
+    else:
+        cursor = conn.execute(
+            f"UPDATE appointments SET status = ?, revision = {NEXT_REVISION} WHERE id = ? AND status = ?",
+            (new_status, appointment_id, expected_status),
+        )
+    if cursor.rowcount:
+        _read_cache.invalidate()
+    return cursor.rowcount == 1
+
+
+# ------------------- Bulk access -------------------
+# Streams appointments in id order, one page at a time, so memory stays flat
+def iter_appointments(status: Optional[str] = None, batch_size: int = 500, db_file: str = DB_FILE) -> Iterator[Dict]:
+    conn = get_connection(db_file)
+    last_id = 0
+    while True:
+        query = "SELECT * FROM appointments WHERE id > ?"
+        params: List = [last_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        rows = conn.execute(query + " ORDER BY id LIMIT ?", params + [batch_size]).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield _to_dict(row)
+        last_id = rows[-1]["id"]
+
+
+TRIAGE_FIELDS = ["urgency_score", "time_recommendation", "key_symptoms", "notes", "specialist"]
+
+
+# Writes re-scored triage fields for many appointments in one transaction
+def update_triage_bulk(updates: List[Dict], db_file: str = DB_FILE) -> int:
+    if not updates:
+        return 0
+    conn = get_connection(db_file)
+    assignments = ", ".join(f"{field} = ?" for field in TRIAGE_FIELDS)
+    rows = [
+        [_urgency(u["urgency_score"])] + [u.get(field) for field in TRIAGE_FIELDS[1:]] + [u["id"]]
+        for u in updates
+    ]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(f"UPDATE appointments SET {assignments}, revision = {NEXT_REVISION} WHERE id = ?", rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _read_cache.invalidate()
+    return len(rows)
+
+
+# ------------------- Doctor queue -------------------
+def _encode_cursor(record: Dict) -> str:
+    key = json.dumps([int(record["urgency_score"] or 0), record["booking_time"], record["id"]])
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[int, str, int]:
+    urgency, booking_time, appointment_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return int(urgency), str(booking_time), int(appointment_id)
+
+
+# Keyset-paginated queue, most urgent first and oldest first within an urgency.
+# Returns (page, next_cursor); next_cursor is None on the last page.
+def query_queue(
+    status: str = "Pending",
+    specialist: Optional[str] = None,
+    urgency_band: Optional[str] = None,
+    booked_from: Optional[str] = None,
+    booked_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db_file: str = DB_FILE,
+) -> Tuple[List[Dict], Optional[str]]:
+    clauses, params = ["status = ?"], [status]
+    if specialist:
+        clauses.append("specialist = ?")
+        params.append(specialist)
+    if urgency_band:
+        low, high = URGENCY_BANDS[urgency_band]
+        clauses.append("COALESCE(urgency_score, 0) BETWEEN ? AND ?")
+        params += [low, high]
+    # booking_time is an ISO timestamp, so string comparison orders correctly
+    if booked_from:
+        clauses.append("booking_time >= ?")
+        params.append(booked_from)
+    if booked_to:
+        clauses.append("booking_time < ?")
+        params.append(booked_to)
+    if cursor:
+        urgency, booking_time, appointment_id = _decode_cursor(cursor)
+        clauses.append(
+            "(COALESCE(urgency_score, 0) < ? OR (COALESCE(urgency_score, 0) = ? AND "
+            "(booking_time > ? OR (booking_time = ? AND id > ?))))"
+        )
+        params += [urgency, urgency, booking_time, booking_time, appointment_id]
+
+    query = (
+        "SELECT * FROM appointments WHERE " + " AND ".join(clauses)
+        + " ORDER BY COALESCE(urgency_score, 0) DESC, booking_time, id LIMIT ?"
+    )
+
+    def load():
+        # Fetch one extra row to know whether another page exists
+        rows = get_connection(db_file).execute(query, params + [limit + 1]).fetchall()
+        page = [_to_dict(row) for row in rows[:limit]]
+        return page, _encode_cursor(page[-1]) if len(rows) > limit else None
+
+    key = ("queue", query, tuple(params), limit, db_file)
+    page, next_cursor = _read_cache.get(key, current_revision(db_file), load)
+    return [dict(row) for row in page], next_cursor
+
+
+def current_revision(db_file: str = DB_FILE) -> int:
+    row = get_connection(db_file).execute("SELECT COALESCE(MAX(revision), 0) FROM appointments").fetchone()
+    return row[0]
+
+
+# Appointments inserted or updated after `revision`, plus the revision to pass next time
+def changes_since(revision: int, db_file: str = DB_FILE) -> Tuple[List[Dict], int]:
+    rows = get_connection(db_file).execute(
+        "SELECT * FROM appointments WHERE revision > ? ORDER BY revision", (revision,)
+    ).fetchall()
+    latest = rows[-1]["revision"] if rows else revision
+    return [_to_dict(row) for row in rows], latest
+
+
+def list_specialists(db_file: str = DB_FILE) -> List[str]:
+    def load():
+        rows = get_connection(db_file).execute(
+            "SELECT DISTINCT specialist FROM appointments WHERE specialist IS NOT NULL ORDER BY specialist"
+        )
+        return [row[0] for row in rows]
+
+    return list(_read_cache.get(("specialists", db_file), current_revision(db_file), load))
+
+
+def cache_stats() -> Dict:
+    return _read_cache.stats()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import appointments.json into the SQLite store")
+    parser.add_argument("json_file", nargs="?", default=LEGACY_JSON_FILE)
+    args = parser.parse_args()
+    # A plain connection: get_connection() would auto-import the default file first
+    conn = _open(DB_FILE)
+    create_schema(conn)
+    previous = migration_count(conn, "json_migrated")
+    if previous is not None:
+        print(f"{DB_FILE} already holds {previous} imported appointment(s); nothing to do")
+    else:
+        print(f"Migrated {migrate_from_json(args.json_file, conn)} appointment(s) into {DB_FILE}")
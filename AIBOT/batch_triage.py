@@ -0,0 +1,165 @@
+# Re-scores stored appointments with the current triage rules.
+#
+# Run from AIBOT/:
+#   python batch_triage.py --dry-run                 # report what would change in the store
+#   python batch_triage.py --status Pending          # re-score and write back pending bookings
+#   python batch_triage.py --json-file old.json --output rescored.json
+#
+# Records are streamed and scored in fixed-size windows across a process pool,
+# so memory use does not depend on the size of the backlog.
+import argparse
+import json
+import os
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from appointment_store import TRIAGE_FIELDS, iter_appointments, update_triage_bulk
+from triage_rules import RULES_FILE, get_rule_engine
+
+WINDOW = 2000
+CHUNKSIZE = 100
+
+
+# ------------------- Sources -------------------
+# Yields the objects of a top-level JSON array without loading the whole file
+def iter_json_array(path: str, read_size: int = 1 << 16) -> Iterator[Dict]:
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(read_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(read_size)
+                eof = not more
+                buffer += more
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+def windows(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    iterator = iter(records)
+    while True:
+        window = list(islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+
+# ------------------- Scoring -------------------
+def _init_worker(rules_file: str):
+    get_rule_engine(rules_file)
+
+
+def score_record(args) -> Dict:
+    appointment_id, symptoms, rules_file = args
+    engine = get_rule_engine(rules_file)
+    keywords = engine.keywords_in(symptoms)
+    result = engine.triage(symptoms, keywords)
+    result["specialist"] = engine.specialist(symptoms, keywords)
+    result["id"] = appointment_id
+    return result
+
+
+def _urgency(record: Dict) -> Optional[int]:
+    try:
+        return int(record.get("urgency_score"))
+    except (TypeError, ValueError):
+        return None
+
+
+def rescore(records: Iterable[Dict], workers: int = 0, window: int = WINDOW, rules_file: str = RULES_FILE,
+            write_back=None, on_result=None) -> Dict:
+    stats = {"scored": 0, "changed": 0, "written": 0}
+    transitions: Counter = Counter()
+    deltas: Counter = Counter()
+    specialist_changes = 0
+
+    with Pool(processes=workers or None, initializer=_init_worker, initargs=(rules_file,)) as pool:
+        for batch in windows(records, window):
+            jobs = [(r.get("id"), r.get("symptoms") or "", rules_file) for r in batch]
+            results = pool.map(score_record, jobs, chunksize=CHUNKSIZE)
+
+            changed = []
+            for old, new in zip(batch, results):
+                stats["scored"] += 1
+                before, after = _urgency(old), _urgency(new)
+                transitions[(before, after)] += 1
+                if before is not None:
+                    deltas[after - before] += 1
+                if old.get("specialist") != new["specialist"]:
+                    specialist_changes += 1
+                if any(old.get(field) != new[field] for field in TRIAGE_FIELDS):
+                    changed.append(new)
+                if on_result:
+                    on_result(dict(old, **{k: v for k, v in new.items() if k != "id"}))
+
+            stats["changed"] += len(changed)
+            if write_back and changed:
+                stats["written"] += write_back(changed)
+
+    stats["specialist_changes"] = specialist_changes
+    stats["transitions"] = transitions
+    stats["deltas"] = deltas
+    return stats
+
+
+def print_report(stats: Dict):
+    print(f"scored: {stats['scored']}  changed: {stats['changed']}  written: {stats['written']}  "
+          f"specialist changes: {stats['specialist_changes']}")
+    if stats["deltas"]:
+        print("urgency delta (new - old):")
+        for delta in sorted(stats["deltas"]):
+            print(f"  {delta:+d}: {stats['deltas'][delta]}")
+    moved = {k: v for k, v in stats["transitions"].items() if k[0] != k[1]}
+    if moved:
+        print("urgency changes (old -> new):")
+        for (before, after), count in sorted(moved.items(), key=lambda kv: -kv[1]):
+            print(f"  {before if before is not None else '-'} -> {after}: {count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score appointments with the current triage rules")
+    parser.add_argument("--json-file", help="read a legacy appointments JSON array instead of the store")
+    parser.add_argument("--output", help="with --json-file: write the re-scored records to this JSON file")
+    parser.add_argument("--status", help="only re-score appointments in this status (store only)")
+    parser.add_argument("--workers", type=int, default=0, help="process pool size (default: CPU count)")
+    parser.add_argument("--window", type=int, default=WINDOW, help="records held in memory at once")
+    parser.add_argument("--rules", default=RULES_FILE)
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing to the store")
+    args = parser.parse_args()
+
+    if args.json_file:
+        records = iter_json_array(args.json_file)
+        out = open(args.output + ".tmp", "w", encoding="utf-8") if args.output else None
+        first = [True]
+
+        def emit(record):
+            # Streamed out as a JSON array, one record at a time
+            out.write(("[\n" if first[0] else ",\n") + json.dumps(record))
+            first[0] = False
+
+        stats = rescore(records, args.workers, args.window, args.rules, on_result=emit if out else None)
+        if out:
+            out.write("[]\n" if first[0] else "\n]\n")
+            out.close()
+            os.replace(args.output + ".tmp", args.output)
+    else:
+        stats = rescore(
+            iter_appointments(status=args.status),
+            args.workers, args.window, args.rules,
+            write_back=None if args.dry_run else update_triage_bulk,
+        )
+    print_report(stats)
@@ -0,0 +1,83 @@
+# Compares an ONNX inference backend against the PyTorch path on the fixed
+# question set: retrieval rankings (same top-k chunk IDs, same order) and
+# extracted answers. Exits non-zero when agreement drops below the thresholds.
+#
+# Run from AIBOT/:
+#   python -m bench.backend_accuracy --backend onnx-int8
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from inference_backend import BACKENDS, load_embedder, load_qa_pipeline
+from qa_batcher import run_qa_batch
+from rag_engine import MIN_ANSWER_SCORE, normalize_question
+from rag_index import load_or_ingest_index
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions_v1.json")
+
+
+def load_questions(path: str = QUESTIONS_FILE) -> List[Dict]:
+    with open(path, "r") as f:
+        return json.load(f)["questions"]
+
+
+def run_backend(backend: str, questions: List[str], chunks: Dict[int, str], index, k: int) -> Dict:
+    embedder = load_embedder(backend, cached=False)
+    qa_pipeline = load_qa_pipeline(backend)
+
+    start = time.perf_counter()
+    embeddings = np.asarray(embedder.encode(questions), dtype="float32")
+    _, ids = index.search(embeddings, k)
+    answers = []
+    for question, row in zip(questions, ids):
+        contexts = [chunks[i] for i in row if i in chunks]
+        results = [r for r in run_qa_batch(qa_pipeline, [question] * len(contexts), contexts) if r["score"] > MIN_ANSWER_SCORE]
+        answers.append(max(results, key=lambda r: r["score"])["answer"] if results else None)
+    elapsed = time.perf_counter() - start
+    return {"embeddings": embeddings, "ids": ids, "answers": answers, "seconds": elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check an ONNX backend against the PyTorch reference")
+    parser.add_argument("--backend", default="onnx-int8", choices=[b for b in BACKENDS if b != "torch"])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--min-ranking-agreement", type=float, default=0.95)
+    parser.add_argument("--min-answer-agreement", type=float, default=0.9)
+    args = parser.parse_args()
+
+    entries = load_questions()
+    questions = [normalize_question(e["question"]) for e in entries]
+    chunks, index = load_or_ingest_index(load_embedder("torch", cached=False), backend="torch")
+
+    reference = run_backend("torch", questions, chunks, index, args.k)
+    candidate = run_backend(args.backend, questions, chunks, index, args.k)
+
+    ref_unit = reference["embeddings"] / np.linalg.norm(reference["embeddings"], axis=1, keepdims=True)
+    cand_unit = candidate["embeddings"] / np.linalg.norm(candidate["embeddings"], axis=1, keepdims=True)
+    cosine = (ref_unit * cand_unit).sum(axis=1)
+    same_ranking = [list(a) == list(b) for a, b in zip(reference["ids"], candidate["ids"])]
+    same_answer = [
+        (a or "").strip().lower() == (b or "").strip().lower()
+        for a, b in zip(reference["answers"], candidate["answers"])
+    ]
+
+    for entry, ranked, answered, ref_answer, cand_answer in zip(entries, same_ranking, same_answer, reference["answers"], candidate["answers"]):
+        if not (ranked and answered):
+            print(f"{entry['id']}: ranking {'ok' if ranked else 'DIFF'}, answer torch={ref_answer!r} {args.backend}={cand_answer!r}")
+
+    ranking_agreement = sum(same_ranking) / len(entries)
+    answer_agreement = sum(same_answer) / len(entries)
+    print(f"questions:           {len(entries)}")
+    print(f"embedding cosine:    min={cosine.min():.4f} mean={cosine.mean():.4f}")
+    print(f"ranking agreement:   {ranking_agreement:.2%}")
+    print(f"answer agreement:    {answer_agreement:.2%}")
+    print(f"time torch:          {reference['seconds']:.2f}s")
+    print(f"time {args.backend}:{' ' * max(1, 15 - len(args.backend))}{candidate['seconds']:.2f}s")
+
+    if ranking_agreement < args.min_ranking_agreement or answer_agreement < args.min_answer_agreement:
+        sys.exit(1)
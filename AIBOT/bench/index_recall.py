@@ -0,0 +1,162 @@
+# Recall vs latency benchmark for the FAISS index modes in rag_index.
+#
+# Run from AIBOT/:
+#   python -m bench.index_recall                      # synthetic 100k x 384 corpus
+#   python -m bench.index_recall --from-index         # vectors of the saved faiss_index/
+#   python -m bench.index_recall --nprobe 1,8,32 --ef-search 32,128 --json out.json
+#   python -m bench.index_recall --check-removal      # ids stay right across repeated removals
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from rag_index import (INDEX_CONFIG, INDEX_TYPES, apply_search_params, load_state, make_index,
+                       remove_from_index, stored_vectors)
+
+
+# ------------------- Data -------------------
+def synthetic_vectors(n: int, dim: int, clusters: int, rng) -> np.ndarray:
+    # Gaussian mixture on the unit sphere, roughly how sentence embeddings clump
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def saved_index_vectors() -> np.ndarray:
+    state = load_state(mmap=False)
+    if state is None:
+        raise SystemExit("No usable faiss_index/ found; run python rag_index.py first")
+    return stored_vectors(state[2])[1]
+
+
+# ------------------- Measurement -------------------
+def search_latencies(index: faiss.Index, queries: np.ndarray, k: int):
+    # One query at a time, matching the per-request pattern in answer_with_llm
+    latencies = np.empty(len(queries))
+    found = np.empty((len(queries), k), dtype="int64")
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies[i] = time.perf_counter() - start
+        found[i] = ids[0]
+    return found, latencies
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def index_megabytes(index: faiss.Index) -> float:
+    return len(faiss.serialize_index(index)) / (1 << 20)
+
+
+def run(vectors: np.ndarray, queries: np.ndarray, k: int, types: List[str], nprobes: List[int], ef_searches: List[int]) -> List[Dict]:
+    ids = np.arange(len(vectors), dtype="int64")
+    rows = []
+    truth = None
+    for kind in ["flat"] + [t for t in types if t != "flat"]:
+        start = time.perf_counter()
+        index, spec = make_index(vectors.shape[1], vectors, dict(INDEX_CONFIG, type=kind))
+        index.add_with_ids(vectors, ids)
+        build_s = time.perf_counter() - start
+
+        if kind.startswith("ivf"):
+            sweep = [{"nprobe": p, "efSearch": 0} for p in nprobes]
+        elif kind == "hnsw":
+            sweep = [{"nprobe": 0, "efSearch": ef} for ef in ef_searches]
+        else:
+            sweep = [{"nprobe": 0, "efSearch": 0}]
+
+        for params in sweep:
+            apply_search_params(index, params)
+            found, latencies = search_latencies(index, queries, k)
+            if truth is None:
+                truth = found
+            rows.append({
+                "type": kind,
+                "spec": spec,
+                "nprobe": params["nprobe"],
+                "efSearch": params["efSearch"],
+                "build_s": round(build_s, 3),
+                f"recall@{k}": round(recall_at_k(found, truth), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 4),
+                "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 4),
+                "memory_mb": round(index_megabytes(index), 2),
+            })
+    return rows
+
+
+# Removes two batches of ids from each index type and checks that searches for
+# the remaining vectors still return their own ids, and never a removed one
+def removal_check(vectors: np.ndarray, types: List[str]) -> List[str]:
+    ids = np.arange(len(vectors), dtype="int64") * 7
+    batches = [ids[:len(ids) // 10], ids[len(ids) // 2:len(ids) // 2 + len(ids) // 10]]
+    removed = np.concatenate(batches)
+    kept = np.flatnonzero(~np.isin(ids, removed))[:500]
+    failures = []
+    for kind in types:
+        index, spec = make_index(vectors.shape[1], vectors, dict(INDEX_CONFIG, type=kind))
+        index.add_with_ids(vectors, ids)
+        for batch in batches:
+            index = remove_from_index(index, batch.tolist(), spec)
+        apply_search_params(index, {"nprobe": 1 << 16, "efSearch": 256})
+        _, found = index.search(vectors[kept], 1)
+        self_hits = float(np.mean(found[:, 0] == ids[kept]))
+        print(f"{kind:<10} {spec:<16} ntotal={index.ntotal} self-hit={self_hits:.3f}")
+        if index.ntotal != len(ids) - len(removed) or np.isin(found, removed).any() or self_hits < 0.9:
+            failures.append(kind)
+    return failures
+
+
+def print_table(rows: List[Dict]):
+    headers = list(rows[0])
+    widths = [max(len(h), *(len(str(r[h])) for r in rows)) for h in headers]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for r in rows:
+        print("  ".join(str(r[h]).ljust(w) for h, w in zip(headers, widths)))
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k and search latency of the FAISS index modes against Flat")
+    parser.add_argument("--from-index", action="store_true", help="benchmark the vectors stored in faiss_index/")
+    parser.add_argument("--n", type=int, default=100000, help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int_list, default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int_list, default=[16, 64, 256])
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--check-removal", action="store_true", help="only check ids after repeated removals")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.from_index:
+        vectors = saved_index_vectors()
+        picks = rng.integers(0, len(vectors), args.queries)
+        queries = vectors[picks] + 0.05 * rng.standard_normal((args.queries, vectors.shape[1])).astype("float32")
+    else:
+        data = synthetic_vectors(args.n + args.queries, args.dim, args.clusters, rng)
+        vectors, queries = data[:args.n], data[args.n:]
+
+    if args.check_removal:
+        failed = removal_check(vectors[:20000], args.types.split(","))
+        raise SystemExit(f"Wrong ids after removal: {', '.join(failed)}" if failed else 0)
+
+    k = min(args.k, len(vectors))
+    rows = run(vectors, np.ascontiguousarray(queries, dtype="float32"), k, args.types.split(","), args.nprobe, args.ef_search)
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"n": len(vectors), "dim": int(vectors.shape[1]), "k": k, "results": rows}, f, indent=2)
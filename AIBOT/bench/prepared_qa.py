@@ -0,0 +1,53 @@
+# Checks the prepared-context QA path (contexts tokenized at ingest, spans
+# decoded in qa_batcher) against the transformers pipeline on the same
+# contexts: same answer text and scores within a tolerance for every
+# (question, context) pair. Exits non-zero on any disagreement.
+#
+# Run from AIBOT/:
+#   python -m bench.prepared_qa --k 3
+import argparse
+import sys
+
+import numpy as np
+
+from bench.backend_accuracy import load_questions
+from inference_backend import load_embedder, load_qa_pipeline
+from qa_batcher import PreparedContext, run_prepared_qa_batch
+from rag_engine import normalize_question
+from rag_index import load_or_ingest_index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare prepared-context QA with the transformers pipeline")
+    parser.add_argument("--backend", default="torch", help="prepared contexts need a PyTorch QA model")
+    parser.add_argument("--k", type=int, default=3, help="contexts per question")
+    parser.add_argument("--score-tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    entries = load_questions()
+    questions = [normalize_question(e["question"]) for e in entries]
+    embedder = load_embedder(args.backend)
+    chunks, index = load_or_ingest_index(embedder, backend=args.backend)
+    qa_pipeline = load_qa_pipeline(args.backend)
+
+    _, ids = index.search(np.asarray(embedder.encode(questions), dtype="float32"), args.k)
+    pairs = [(entry, question, int(i)) for entry, question, row in zip(entries, questions, ids) for i in row if i in chunks]
+    prepared = run_prepared_qa_batch(
+        qa_pipeline, [q for _, q, _ in pairs], [PreparedContext(chunks[i], chunks.tokens(i)) for _, _, i in pairs]
+    )
+
+    mismatches = 0
+    worst = 0.0
+    for (entry, question, chunk_id), fast in zip(pairs, prepared):
+        reference = qa_pipeline(question=question, context=chunks[chunk_id])
+        delta = abs(fast["score"] - reference["score"])
+        worst = max(worst, delta)
+        if fast["answer"].strip() != reference["answer"].strip() or delta > args.score_tolerance:
+            mismatches += 1
+            print(f"{entry['id']} chunk {chunk_id}: pipeline {reference['answer']!r} ({reference['score']:.4f}) "
+                  f"prepared {fast['answer']!r} ({fast['score']:.4f})")
+
+    print(f"pairs:            {len(pairs)}")
+    print(f"agreement:        {1 - mismatches / max(len(pairs), 1):.2%}")
+    print(f"max score delta:  {worst:.6f}")
+    if mismatches:
+        sys.exit(1)
@@ -0,0 +1,296 @@
+# End-to-end RAG benchmark on the fixed question set: cold start, per-query
+# latency percentiles, throughput under concurrent simulated users, peak RSS,
+# retrieval recall and answer/specialist accuracy. Results are written as JSON
+# so runs from two commits can be diffed with --baseline.
+#
+# Run from AIBOT/:
+#   python -m bench.rag_bench --json bench_results.json
+#   python -m bench.rag_bench --users 1,4,16 --duration 30 --baseline old.json
+#   python -m bench.rag_bench --url http://127.0.0.1:8765    # load-test a running rag_service.py
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+from bench.backend_accuracy import QUESTIONS_FILE, load_questions
+
+BENCH_VERSION = 1
+AIBOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ------------------- Helpers -------------------
+def percentiles_ms(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    values = np.asarray(latencies) * 1000
+    return {
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p90": round(float(np.percentile(values, 90)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=AIBOT_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def contains_any(text: str, needles: List[str]) -> bool:
+    text = text.lower()
+    return any(n.lower() in text for n in needles)
+
+
+# ------------------- Cold start -------------------
+def cold_start_child():
+    # Runs in a fresh interpreter: imports and model loads both count
+    start = time.perf_counter()
+    from metrics import MODEL_LOAD_SECONDS
+    from rag_engine import RAGEngine
+
+    RAGEngine()
+    seconds = time.perf_counter() - start
+    loads = {key[0]: round(value, 3) for key, value in MODEL_LOAD_SECONDS.snapshot().items()}
+    print(json.dumps({"seconds": round(seconds, 3), "load_seconds": loads, "peak_rss_mb": peak_rss_mb()}))
+
+
+def measure_cold_start(runs: int) -> Dict:
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.rag_bench", "--cold-start-child"],
+            cwd=AIBOT_DIR, capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    seconds = [s["seconds"] for s in samples]
+    return {
+        "runs": runs,
+        "seconds_min": min(seconds),
+        "seconds_median": round(float(np.median(seconds)), 3),
+        "load_seconds": samples[-1]["load_seconds"],
+        "peak_rss_mb": samples[-1]["peak_rss_mb"],
+    }
+
+
+# ------------------- Latency and load -------------------
+def sequential_latency(ask: Callable[[str], Optional[str]], questions: List[str], repeat: int) -> Dict:
+    latencies = []
+    for _ in range(repeat):
+        for question in questions:
+            start = time.perf_counter()
+            ask(question)
+            latencies.append(time.perf_counter() - start)
+    return dict(percentiles_ms(latencies), queries=len(latencies))
+
+
+def concurrent_load(ask: Callable[[str], Optional[str]], questions: List[str], users: int, duration: float) -> Dict:
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user(offset: int):
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ask(questions[i % len(questions)])
+            except Exception:
+                with lock:
+                    errors[0] += 1
+            else:
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            i += 1
+
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return dict(
+        users=users,
+        completed=len(latencies),
+        errors=errors[0],
+        qps=round(len(latencies) / elapsed, 2),
+        latency_ms=percentiles_ms(latencies),
+    )
+
+
+# ------------------- Quality -------------------
+# Corpus specialist names -> the rule engine's labels
+SPECIALIST_SYNONYMS = {
+    "general physician": "general practitioner",
+    "orthopedic specialist": "orthopedic",
+    "rheumatologist": "orthopedic",
+    "hepatologist": "gastroenterologist",
+}
+
+
+# Engine labels that count as a correct pick for a question. Expected values
+# may name several specialists ("Endocrinologist / Urologist"); specialties
+# the engine has no label for are correctly sent to its fallback.
+def accepted_specialists(expected: str, rules) -> Set[str]:
+    known = {s.lower() for s in rules.specialists}
+    accepted = set()
+    for name in expected.split("/"):
+        name = SPECIALIST_SYNONYMS.get(name.strip().lower(), name.strip().lower())
+        accepted.add(name if name in known else rules.fallback_specialist.lower())
+    return accepted
+
+
+def retrieval_quality(engine, entries: List[Dict]) -> Dict:
+    from rag_engine import QA_TOP_K, RETRIEVE_K, normalize_question
+    from triage_rules import get_rule_engine
+
+    candidate_hits = context_hits = answer_hits = specialist_hits = expected = 0
+    for entry in entries:
+        question = normalize_question(entry["question"])
+        conditions = entry["expected_conditions"]
+        candidates = " ".join(engine.chunks[i] for i in engine.retrieve_ids(question, RETRIEVE_K)).lower()
+        contexts = " ".join(text for _, text in engine.select_contexts(question, QA_TOP_K)).lower()
+        candidate_hits += sum(c.lower() in candidates for c in conditions)
+        context_hits += sum(c.lower() in contexts for c in conditions)
+        expected += len(conditions)
+        answer = engine.answer_with_llm(question)
+        answer_hits += bool(answer) and contains_any(answer, conditions)
+        rules = get_rule_engine()
+        specialist_hits += rules.specialist(entry["symptom"]).lower() in accepted_specialists(entry["expected_specialist"], rules)
+    n = len(entries)
+    return {
+        f"recall@{RETRIEVE_K}": round(candidate_hits / expected, 4),
+        f"recall@{QA_TOP_K}": round(context_hits / expected, 4),
+        "answer_accuracy": round(answer_hits / n, 4),
+        "specialist_accuracy": round(specialist_hits / n, 4),
+    }
+
+
+# ------------------- Reporting -------------------
+def flatten(data: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "users" in item:
+                    flat.update(flatten(item, f"{name}[users={item['users']}]."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def print_diff(baseline: Dict, results: Dict):
+    old, new = flatten(baseline), flatten(results)
+    print(f"\nvs baseline {baseline.get('git_commit')} -> {results.get('git_commit')}:")
+    for name in sorted(set(old) & set(new)):
+        if old[name] == new[name]:
+            continue
+        change = f" ({(new[name] - old[name]) / old[name]:+.1%})" if old[name] else ""
+        print(f"  {name}: {old[name]} -> {new[name]}{change}")
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproducible end-to-end RAG benchmark")
+    parser.add_argument("--questions", default=QUESTIONS_FILE)
+    parser.add_argument("--url", help="load-test a running rag_service.py instead of an in-process engine")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the question set for sequential latency")
+    parser.add_argument("--users", type=int_list, default=[1, 4, 8], help="concurrent simulated users to sweep")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level")
+    parser.add_argument("--cold-start-runs", type=int, default=1, help="0 skips the cold-start measurement")
+    parser.add_argument("--with-cache", action="store_true", help="leave the query cache on (off by default)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    parser.add_argument("--cold-start-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start_child:
+        cold_start_child()
+        sys.exit(0)
+
+    with open(args.questions, "r") as f:
+        question_set = json.load(f)
+    entries = load_questions(args.questions)
+    questions = [e["question"] for e in entries]
+
+    results: Dict = {
+        "bench_version": BENCH_VERSION,
+        "questions_version": question_set["version"],
+        "git_commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "env": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+    }
+
+    if args.url:
+        from rag_client import RAGClient
+
+        client = RAGClient(args.url)
+        ask = client.ask
+        results["target"] = args.url
+        results["service"] = client.health()
+    else:
+        from inference_backend import BACKEND
+        from rag_engine import QA_TOP_K, RERANK, RETRIEVE_K, RAGEngine, normalize_question
+        from rag_index import INDEX_CONFIG, SEARCH_PARAMS
+
+        results["config"] = dict(
+            backend=BACKEND, rerank=RERANK, retrieve_k=RETRIEVE_K, qa_top_k=QA_TOP_K,
+            index=INDEX_CONFIG, search=SEARCH_PARAMS, query_cache=args.with_cache,
+        )
+        if args.cold_start_runs:
+            print("Measuring cold start...")
+            results["cold_start"] = measure_cold_start(args.cold_start_runs)
+        engine = RAGEngine()
+        # The query cache would turn repeated questions into dictionary lookups
+        ask = engine.ask if args.with_cache else (lambda q: engine.answer_with_llm(normalize_question(q)))
+
+    print("Warming up...")
+    for question in questions:
+        ask(question)
+    print("Sequential latency...")
+    results["latency_ms"] = sequential_latency(ask, questions, args.repeat)
+    results["throughput"] = []
+    for users in args.users:
+        print(f"{users} concurrent user(s) for {args.duration:g}s...")
+        results["throughput"].append(concurrent_load(ask, questions, users, args.duration))
+    if not args.url:
+        print("Retrieval quality...")
+        results["quality"] = retrieval_quality(engine, entries)
+        results["engine"] = engine.stats()
+        results["peak_rss_mb"] = peak_rss_mb()
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            print_diff(json.load(f), results)
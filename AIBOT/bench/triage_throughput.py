@@ -0,0 +1,132 @@
+# Throughput of the compiled triage matcher against the original per-call
+# keyword scans, on long synthetic symptom narratives.
+#
+# Run from AIBOT/:
+#   python -m bench.triage_throughput --narratives 2000 --words 400
+import argparse
+import random
+import time
+from typing import Callable, Dict, List
+
+from triage_rules import RuleEngine, load_rules
+
+FILLER = (
+    "i have been feeling this since last week and it gets worse at night my family doctor "
+    "said to wait but now it is affecting work and sleep also noticed some changes after meals "
+    "no history of allergies taking vitamins daily walked more than usual recently"
+).split()
+
+
+# Patient-style wording: keywords inflected the way people write them. The
+# synthetic narratives only use exact keywords, so they cannot show drift here.
+INFLECTED_NARRATIVES = [
+    "I have been coughing for 3 days",
+    "painful swelling in my ankle",
+    "I feel severely dizzy when I stand up",
+    "feverish and shivering since last night",
+    "stressed out and anxious all the time",
+    "stomachache after every meal",
+    "headaches and rashes on both arms",
+    "mild coughs in the morning",
+    "vomited twice and feeling nauseated",
+    "itching skin with small blisters",
+    "my joints are swollen and painful",
+    "persistent wheezing and coughing fits",
+    "severely bleeding from a cut on my hand",
+    "tiredness and frequent headaches",
+    "chest pains when climbing stairs",
+    "was diagnosed with asthma, now breathing is harder",
+    "my back pains are getting worse",
+    "feeling depressed and stressed at work",
+    "constipated for a week with abdominal pains",
+    "a sprained wrist from falling",
+]
+
+
+def make_narratives(count: int, words: int, keywords: List[str], density: float, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    narratives = []
+    for _ in range(count):
+        tokens = [rng.choice(keywords) if rng.random() < density else rng.choice(FILLER) for _ in range(words)]
+        narratives.append(" ".join(tokens))
+    return narratives
+
+
+# ------------------- Original implementation (baseline) -------------------
+def legacy_triage(symptoms: str, rules: Dict) -> str:
+    symptoms_lower = symptoms.lower().strip()
+    score = rules["default"]["score"]
+    for rule in rules["urgency"]:
+        # The original rebuilt these lists on every call
+        keywords = list(rule["keywords"])
+        if any(keyword in symptoms_lower for keyword in keywords):
+            score = rule["score"]
+            break
+    if "severe" in symptoms_lower:
+        score = min(score + 2, 10)
+    if "mild" in symptoms_lower:
+        score = max(score - 1, 1)
+    return str(score)
+
+
+def legacy_specialist(symptoms: str, rules: Dict) -> str:
+    symptoms_lower = symptoms.lower()
+    specialist_keywords = {name: list(kws) for name, kws in rules["specialists"].items()}
+    scores = {specialist: 0 for specialist in specialist_keywords}
+    for specialist, keywords in specialist_keywords.items():
+        for keyword in keywords:
+            if keyword in symptoms_lower:
+                scores[specialist] += 1
+    best = max(scores, key=scores.get)
+    return rules["fallback_specialist"] if scores[best] == 0 else best.capitalize()
+
+
+def timed(fn: Callable[[str], object], narratives: List[str]):
+    start = time.perf_counter()
+    results = [fn(text) for text in narratives]
+    return results, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Triage matcher throughput on long symptom narratives")
+    parser.add_argument("--narratives", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--density", type=float, default=0.02, help="fraction of tokens that are rule keywords")
+    parser.add_argument("--extra-keywords", type=int, default=0,
+                        help="add N synthetic specialist keywords to model a larger rule set")
+    args = parser.parse_args()
+
+    rules = load_rules()
+    if args.extra_keywords:
+        rng = random.Random(1)
+        letters = "abcdefghijklmnopqrstuvwxyz"
+        extra = {"".join(rng.choice(letters) for _ in range(rng.randint(5, 12))) for _ in range(args.extra_keywords)}
+        rules["specialists"]["synthetic"] = sorted(extra)
+    engine = RuleEngine(rules)
+    keywords = sorted(engine.categories)
+    narratives = make_narratives(args.narratives, args.words, keywords, args.density)
+    megabytes = sum(len(t) for t in narratives) / (1 << 20)
+
+    def legacy(text):
+        return legacy_triage(text, rules), legacy_specialist(text, rules)
+
+    def compiled(text):
+        # One scan feeds both decisions
+        keywords = engine.keywords_in(text)
+        return engine.triage(text, keywords)["urgency_score"], engine.specialist(text, keywords)
+
+    legacy_results, legacy_s = timed(legacy, narratives)
+    compiled_results, compiled_s = timed(compiled, narratives)
+    agree = sum(a == b for a, b in zip(legacy_results, compiled_results)) / len(narratives)
+
+    print(f"narratives: {len(narratives)} x {args.words} words ({megabytes:.1f} MB), {len(keywords)} keywords")
+    for name, seconds in (("legacy substring scans", legacy_s), ("compiled matcher", compiled_s)):
+        print(f"{name:24s} {seconds:8.3f}s  {len(narratives) / seconds:10.1f} narratives/s  {megabytes / seconds:7.2f} MB/s")
+    print(f"speedup: {legacy_s / compiled_s:.2f}x")
+    # Differences come from word-boundary matching ("flu" no longer matches "fluid")
+    print(f"identical (urgency, specialist) decisions: {agree:.2%}")
+
+    differing = [(text, legacy(text), compiled(text)) for text in INFLECTED_NARRATIVES if legacy(text) != compiled(text)]
+    print(f"identical decisions on inflected narratives: {1 - len(differing) / len(INFLECTED_NARRATIVES):.2%}")
+    for text, old, new in differing:
+        print(f"  {text!r}: legacy {old} -> compiled {new}")
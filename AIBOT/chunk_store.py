@@ -0,0 +1,226 @@
+import json
+import mmap
+import os
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# ------------------- Layout -------------------
+# chunks-<generation>.bin              one record per chunk, 4-byte aligned:
+#                                      UTF-8 text, padding, int32 token matrix, JSON entity tags
+# chunks-<generation>-<revision>.idx.npy  one ROW_DTYPE row per live chunk, sorted by id
+# Every commit writes a new index file and nothing is replaced in place; the
+# manifest names the current data and index files, so swapping it in is the
+# single commit point. The source list lives in the manifest too.
+ROW_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("offset", "<i8"),
+    ("length", "<i4"),   # text bytes
+    ("source", "<i4"),   # index into the store's source list
+    ("page", "<i4"),
+    ("start", "<i4"),    # character offset of the chunk within its page, -1 if unknown
+    ("tokens", "<i4"),   # rows of the precomputed token matrix
+    ("extra", "<i4"),    # bytes after the padded text: token matrix + tags
+])
+TOKEN_COLUMNS = 4
+# Index file of stores committed before indexes were versioned
+LEGACY_INDEX_FILE = "chunks.idx.npy"
+# Rewrite the text file once more than this share of it belongs to removed chunks
+COMPACT_DEAD_RATIO = 0.5
+
+
+def data_file_name(generation: int) -> str:
+    return f"chunks-{generation}.bin"
+
+
+def index_file_name(generation: int, revision: int) -> str:
+    return f"chunks-{generation}-{revision}.idx.npy"
+
+
+def _align(n: int) -> int:
+    return (n + 3) & ~3
+
+
+# Bytes a record occupies in the data file
+def _record_size(row) -> int:
+    return _align(int(row["length"])) + int(row["extra"])
+
+
+class ChunkStore(Mapping):
+    # Read-only {chunk id: text} view over the memory-mapped store. Texts are
+    # decoded on access, so every process serving the same index shares one
+    # copy of the corpus through the page cache instead of holding its own.
+
+    def __init__(self, index_dir: str, info: Dict):
+        self.index_dir = index_dir
+        self.info = info
+        self.sources: List[str] = info["sources"]
+        self.rows = np.load(os.path.join(index_dir, info.get("index", LEGACY_INDEX_FILE)), mmap_mode="r")
+        self._ids = self.rows["id"]
+        path = os.path.join(index_dir, info["file"])
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def _position(self, chunk_id) -> int:
+        pos = int(np.searchsorted(self._ids, chunk_id))
+        if pos >= len(self._ids) or self._ids[pos] != chunk_id:
+            raise KeyError(chunk_id)
+        return pos
+
+    def __getitem__(self, chunk_id) -> str:
+        row = self.rows[self._position(chunk_id)]
+        offset, length = int(row["offset"]), int(row["length"])
+        return self._data[offset:offset + length].decode("utf-8")
+
+    def __contains__(self, chunk_id) -> bool:
+        try:
+            self._position(chunk_id)
+            return True
+        except (KeyError, TypeError):
+            return False
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(i) for i in self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # Precomputed (n, TOKEN_COLUMNS) token matrix of a chunk, read straight
+    # from the mapped file without copying
+    def tokens(self, chunk_id) -> np.ndarray:
+        row = self.rows[self._position(chunk_id)]
+        offset = int(row["offset"]) + _align(int(row["length"]))
+        count = int(row["tokens"]) * TOKEN_COLUMNS
+        return np.frombuffer(self._data, dtype="<i4", count=count, offset=offset).reshape(-1, TOKEN_COLUMNS)
+
+    def tags(self, chunk_id) -> Dict[str, List[str]]:
+        row = self.rows[self._position(chunk_id)]
+        start = int(row["offset"]) + _align(int(row["length"])) + int(row["tokens"]) * TOKEN_COLUMNS * 4
+        end = int(row["offset"]) + _record_size(row)
+        return json.loads(self._data[start:end].decode("utf-8")) if end > start else {}
+
+    # Source file, page, in-page offset and entity tags of a chunk
+    def meta(self, chunk_id) -> Dict:
+        row = self.rows[self._position(chunk_id)]
+        return {
+            "source": self.sources[row["source"]], "page": int(row["page"]), "start": int(row["start"]),
+            "tags": self.tags(chunk_id),
+        }
+
+
+class ChunkStoreWriter:
+    # Builds the next version of a store. New texts are appended to the
+    # current data file (readers never look past the offsets in their own
+    # index, so appends are invisible to them); removals only drop index rows.
+    # commit() publishes a new index, compacting into a fresh generation when
+    # the data file is mostly dead bytes.
+
+    def __init__(self, index_dir: str, base: Optional[ChunkStore] = None):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        if base is not None:
+            self.generation = base.info["generation"]
+            self.revision = base.info.get("revision", 0)
+            self.sources = list(base.sources)
+            self._rows = np.array(base.rows)
+        else:
+            # A fresh store never writes into a file a reader may have mapped
+            self.generation = _next_generation(index_dir)
+            self.revision = 0
+            self.sources = []
+            self._rows = np.zeros(0, dtype=ROW_DTYPE)
+        self._source_ids = {s: i for i, s in enumerate(self.sources)}
+        self._added: List[tuple] = []
+        self._removed = set()
+        self._file = open(os.path.join(index_dir, data_file_name(self.generation)), "ab")
+
+    def add(self, chunk_id: int, text: str, source: str = "", page: int = -1, start: int = -1,
+            tokens: Optional[np.ndarray] = None, tags: Optional[Dict] = None):
+        data = text.encode("utf-8")
+        tokens = np.zeros((0, TOKEN_COLUMNS), dtype="<i4") if tokens is None else np.ascontiguousarray(tokens, dtype="<i4")
+        extra = tokens.tobytes() + (json.dumps(tags).encode("utf-8") if tags else b"")
+        offset = self._file.tell()
+        self._file.write(data + b"\0" * (_align(len(data)) - len(data)) + extra)
+        # Keep every record 4-byte aligned so token matrices map as int32
+        self._file.write(b"\0" * (_align(self._file.tell()) - self._file.tell()))
+        if source not in self._source_ids:
+            self._source_ids[source] = len(self.sources)
+            self.sources.append(source)
+        self._added.append((chunk_id, offset, len(data), self._source_ids[source], page, start, len(tokens), len(extra)))
+        self._removed.discard(chunk_id)
+
+    def remove(self, ids: Iterable[int]):
+        self._removed.update(int(i) for i in ids)
+
+    def live_rows(self) -> np.ndarray:
+        rows = np.concatenate([self._rows, np.array(self._added, dtype=ROW_DTYPE)])
+        if self._removed:
+            rows = rows[~np.isin(rows["id"], np.fromiter(self._removed, dtype="int64"))]
+        return np.sort(rows, order="id")
+
+    def __len__(self) -> int:
+        return len(self.live_rows())
+
+    def _compact(self, rows: np.ndarray) -> np.ndarray:
+        old_path = os.path.join(self.index_dir, data_file_name(self.generation))
+        self.generation = _next_generation(self.index_dir)
+        rows = rows.copy()
+        with open(old_path, "rb") as src, open(os.path.join(self.index_dir, data_file_name(self.generation)), "wb") as dst:
+            for row in rows:
+                src.seek(int(row["offset"]))
+                row["offset"] = dst.tell()
+                size = _record_size(row)
+                dst.write(src.read(size) + b"\0" * (_align(size) - size))
+        self._file.close()
+        self._file = open(os.path.join(self.index_dir, data_file_name(self.generation)), "ab")
+        return rows
+
+    # Writes a new index file and returns the manifest entry naming it; the
+    # store only changes for readers once that entry is in the manifest
+    def commit(self) -> Dict:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        rows = self.live_rows()
+        size = self._file.tell()
+        live = int(((rows["length"].astype("int64") + 3) & ~3).sum() + rows["extra"].sum())
+        if size and live < (1 - COMPACT_DEAD_RATIO) * size:
+            rows = self._compact(rows)
+        self.revision += 1
+        index = index_file_name(self.generation, self.revision)
+        with open(os.path.join(self.index_dir, index), "wb") as f:
+            np.save(f, rows)
+            f.flush()
+            os.fsync(f.fileno())
+        self._rows, self._added, self._removed = rows, [], set()
+        return {
+            "generation": self.generation, "revision": self.revision, "file": data_file_name(self.generation),
+            "index": index, "sources": list(self.sources),
+        }
+
+    def close(self):
+        self._file.close()
+
+
+def _next_generation(index_dir: str) -> int:
+    generations = [
+        int(name[len("chunks-"):-len(".bin")])
+        for name in os.listdir(index_dir)
+        if name.startswith("chunks-") and name.endswith(".bin") and name[len("chunks-"):-len(".bin")].isdigit()
+    ] if os.path.isdir(index_dir) else []
+    return max(generations, default=0) + 1
+
+
+# Deletes data and index files the committed store no longer uses; processes
+# that still map one keep reading it (POSIX), and on Windows the file is simply
+# left for the next run
+def remove_stale_generations(index_dir: str, keep: Dict):
+    for name in os.listdir(index_dir):
+        stale_data = name.startswith("chunks-") and name.endswith(".bin") and name != keep["file"]
+        stale_index = name.endswith(".idx.npy") and name != keep["index"]
+        if stale_data or stale_index:
+            try:
+                os.remove(os.path.join(index_dir, name))
+            except OSError:
+                pass
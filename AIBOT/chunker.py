@@ -0,0 +1,214 @@
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# ------------------- Configuration -------------------
+# Context tokens per chunk, counted with the QA model's tokenizer. The QA
+# pipeline reads max_seq_len=384 tokens per window; a question of up to
+# MAX_QUESTION_TOKENS plus the special tokens leaves room for this much context,
+# so every chunk is answered in a single window with no stride pass.
+CHUNK_TOKENS = int(os.environ.get("RAG_CHUNK_TOKENS", "300"))
+MAX_QUESTION_TOKENS = 64
+# The retrieval embedder (all-MiniLM-L6-v2) truncates at 256 word pieces
+# including [CLS] and [SEP]; chunks are also counted with its tokenizer so
+# dense retrieval sees every chunk whole
+EMBED_MAX_TOKENS = 256 - 2
+# Token overlap between the pieces of a single record too long for one chunk
+SPLIT_OVERLAP_TOKENS = 32
+CHUNKER_VERSION = 2
+
+# Our PDFs are lists of symptom records in one of two layouts:
+#   Symptom: fever / Possible Conditions: ... / Suggested Specialist(s): ...
+#   If a person experiences fever, it could be due to .... They should consult a ...
+RECORD_START = re.compile(r"^(Symptom:|If a person experiences\b)", re.MULTILINE)
+SUMMARY_FIELDS = {
+    "symptoms": re.compile(r"Symptom:\s*(.+)"),
+    "conditions": re.compile(r"Possible Conditions:\s*(.+)"),
+    "specialists": re.compile(r"Suggested Specialist\(s\):\s*(.+)"),
+}
+STATEMENT = re.compile(
+    r"If a person experiences (?P<symptoms>.+?), it could be due to (?P<conditions>.+?)\."
+    r" They should consult an? (?P<specialists>.+?)\.",
+)
+TAG_KINDS = ("symptoms", "conditions", "specialists")
+
+
+# Columns of a chunk's precomputed token matrix (int32, one row per token,
+# special tokens excluded). The QA path builds model inputs from TOKEN_ID and
+# maps answer spans back to text with the char and word columns.
+TOKEN_ID, CHAR_START, CHAR_END, WORD = range(4)
+TOKEN_COLUMNS = 4
+
+
+class Chunk(NamedTuple):
+    text: str
+    page: int
+    start: int              # character offset within the page
+    tokens: np.ndarray      # (n, TOKEN_COLUMNS) int32
+    tags: Dict[str, List[str]]
+
+
+# ------------------- Entity tags -------------------
+# "Oncologist / General Physician" names two specialists; "yellow skin/eyes" is one symptom
+def _split_names(value: str, kind: str) -> List[str]:
+    separators = r"[,/]" if kind == "specialists" else r","
+    return [name.strip() for name in re.split(separators, value) if name.strip()]
+
+
+# Symptoms, conditions and specialists named by the records in a chunk
+def entity_tags(text: str) -> Dict[str, List[str]]:
+    tags: Dict[str, List[str]] = {kind: [] for kind in TAG_KINDS}
+    for kind, pattern in SUMMARY_FIELDS.items():
+        for match in pattern.finditer(text):
+            tags[kind].extend(_split_names(match.group(1), kind))
+    # Statements wrap across lines in the PDFs
+    for match in STATEMENT.finditer(" ".join(text.split())):
+        for kind in TAG_KINDS:
+            tags[kind].extend(_split_names(match.group(kind), kind))
+    return {kind: list(dict.fromkeys(names)) for kind, names in tags.items()}
+
+
+# ------------------- Chunking -------------------
+# (start, end) character spans of the structural units of a page: one per
+# symptom record, with any heading before the first record as its own unit.
+# Pages without records fall back to paragraphs.
+def record_spans(text: str) -> List[Tuple[int, int]]:
+    starts = [m.start() for m in RECORD_START.finditer(text)]
+    if not starts:
+        starts = [0] + [m.end() for m in re.finditer(r"\n\s*\n", text)]
+    elif starts[0] > 0:
+        starts.insert(0, 0)
+    ends = starts[1:] + [len(text)]
+    spans = []
+    for start, end in zip(starts, ends):
+        # Trim surrounding whitespace so chunk texts start and end on content
+        segment = text[start:end]
+        lead = len(segment) - len(segment.lstrip())
+        trail = len(segment.rstrip())
+        if trail > lead:
+            spans.append((start + lead, start + trail))
+    return spans
+
+
+class TokenChunker:
+    # Packs whole records into chunks of at most max_tokens QA tokens (and,
+    # with an embed tokenizer, embed_max_tokens embedder tokens), so a symptom
+    # is never separated from its conditions and specialist. Only a record
+    # that alone exceeds a budget is cut, on QA token boundaries.
+
+    def __init__(self, tokenizer, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = SPLIT_OVERLAP_TOKENS,
+                 embed_tokenizer=None, embed_max_tokens: int = EMBED_MAX_TOKENS):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.embed_tokenizer = embed_tokenizer
+        self.embed_max_tokens = embed_max_tokens
+
+    # Token matrix for text, tokenized on its own exactly as the QA pipeline
+    # tokenizes a context
+    def encode(self, text: str) -> np.ndarray:
+        encoded = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        tokens = np.zeros((len(encoded["input_ids"]), TOKEN_COLUMNS), dtype="int32")
+        tokens[:, TOKEN_ID] = encoded["input_ids"]
+        if len(tokens):
+            tokens[:, CHAR_START:CHAR_END + 1] = encoded["offset_mapping"]
+            tokens[:, WORD] = encoded.word_ids()
+        return tokens
+
+    def embed_length(self, text: str) -> int:
+        if self.embed_tokenizer is None:
+            return 0
+        return len(self.embed_tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def _make(self, page_text: str, page: int, start: int, end: int) -> Chunk:
+        text = page_text[start:end]
+        return Chunk(text, page, start, self.encode(text), entity_tags(text))
+
+    def _fits(self, chunk: Chunk) -> bool:
+        return len(chunk.tokens) <= self.max_tokens and self.embed_length(chunk.text) <= self.embed_max_tokens
+
+    # Cuts a span into overlapping pieces of `budget` QA tokens; a piece still
+    # too long for the embedder is cut again with a proportionally smaller budget
+    def _split_long(self, page_text: str, page: int, start: int, end: int, budget: Optional[int] = None) -> List[Chunk]:
+        budget = budget or self.max_tokens
+        tokens = self.encode(page_text[start:end])
+        step = max(budget - self.overlap_tokens, 1)
+        pieces = []
+        for first in range(0, len(tokens), step):
+            last = min(first + budget, len(tokens)) - 1
+            piece = self._make(page_text, page, start + int(tokens[first, CHAR_START]), start + int(tokens[last, CHAR_END]))
+            embed_tokens = self.embed_length(piece.text)
+            if embed_tokens > self.embed_max_tokens and budget > self.overlap_tokens + 1:
+                smaller = max(int(budget * self.embed_max_tokens / embed_tokens) - 1, self.overlap_tokens + 1)
+                pieces.extend(self._split_long(page_text, page, piece.start, piece.start + len(piece.text), smaller))
+            else:
+                pieces.append(piece)
+            if last == len(tokens) - 1:
+                break
+        return pieces
+
+    def split_page(self, page_text: str, page: int = -1) -> List[Chunk]:
+        chunks: List[Chunk] = []
+        group: Optional[Tuple[int, int]] = None
+        # (QA tokens, embedder tokens) of the current group
+        group_tokens = (0, 0)
+        for start, end in record_spans(page_text):
+            text = page_text[start:end]
+            tokens = (len(self.encode(text)), self.embed_length(text))
+            if tokens[0] > self.max_tokens or tokens[1] > self.embed_max_tokens:
+                if group:
+                    chunks.append(self._make(page_text, page, *group))
+                    group, group_tokens = None, (0, 0)
+                chunks.extend(self._split_long(page_text, page, start, end))
+                continue
+            # +1 for the newline token joining two records
+            joined = (group_tokens[0] + 1 + tokens[0], group_tokens[1] + 1 + tokens[1])
+            if group and joined[0] <= self.max_tokens and joined[1] <= self.embed_max_tokens:
+                group, group_tokens = (group[0], end), joined
+                continue
+            if group:
+                chunks.append(self._make(page_text, page, *group))
+            group, group_tokens = (start, end), tokens
+        if group:
+            chunks.append(self._make(page_text, page, *group))
+        # Joining records can merge tokens at the seams; re-split any chunk
+        # that ended up over budget
+        return [piece for chunk in chunks for piece in (
+            [chunk] if self._fits(chunk)
+            else self._split_long(page_text, page, chunk.start, chunk.start + len(chunk.text))
+        )]
+
+
+_chunker: Optional[TokenChunker] = None
+
+
+def _embed_tokenizer_name() -> str:
+    from rag_index import EMBED_MODEL
+
+    # SentenceTransformer resolves bare names under the sentence-transformers org
+    return EMBED_MODEL if "/" in EMBED_MODEL else f"sentence-transformers/{EMBED_MODEL}"
+
+
+# One chunker per process (ingest workers each load their own tokenizers)
+def get_chunker() -> TokenChunker:
+    global _chunker
+    if _chunker is None:
+        from transformers import AutoTokenizer
+        from inference_backend import QA_MODEL
+
+        _chunker = TokenChunker(
+            AutoTokenizer.from_pretrained(QA_MODEL), embed_tokenizer=AutoTokenizer.from_pretrained(_embed_tokenizer_name())
+        )
+    return _chunker
+
+
+# Recorded in the index manifest; a change triggers a full re-chunk
+def chunker_config() -> Dict:
+    from inference_backend import QA_MODEL
+
+    return {
+        "type": "TokenChunker", "version": CHUNKER_VERSION, "tokenizer": QA_MODEL, "max_tokens": CHUNK_TOKENS,
+        "embed_tokenizer": _embed_tokenizer_name(), "embed_max_tokens": EMBED_MAX_TOKENS,
+    }
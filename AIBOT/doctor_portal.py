@@ -1,8 +1,11 @@
 import os
-import json
-from datetime import datetime
-from typing import List, Dict
+from datetime import timedelta
 import streamlit as st
+from appointment_store import (
+    URGENCY_BANDS, changes_since, current_revision, list_specialists, query_queue, set_status,
+)
+from suggestion_store import add_suggestion
+from upload_store import list_uploads, object_path, open_upload
 # Inject background image using inline CSS
 
 
@@ -18,78 +21,135 @@ if os.path.exists("style.css"):
 
 
 
-UPLOAD_DIR = "uploads"
-SUGGESTIONS_FILE = "suggestions.txt"
-BOOKED_FILE = "appointments.json"
+PAGE_SIZE = 20
+# st.download_button reads the whole file into server memory and sends it in
+# one response, so larger uploads are not offered for download here
+MAX_DOWNLOAD_MB = float(os.environ.get("RAG_MAX_DOWNLOAD_MB", "50"))
 
-# Load appointment records
-def load_appointments() -> List[Dict]:
-    try:
-        with open(BOOKED_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-
-# Save updated appointments
-def save_appointments(data: List[Dict]):
-    with open(BOOKED_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+# Keeps one page of a status queue in session state. Reruns only ask the store
+# for changes since the last refresh and re-query the page when something moved.
+def load_queue_page(status: str, filters: dict) -> dict:
+    key = f"queue_{status}"
+    state = st.session_state.get(key)
+    if state is None or state["filters"] != filters:
+        state = st.session_state[key] = {
+            "filters": filters, "cursors": [None], "revision": current_revision(),
+            "page": None, "next": None, "updates": 0,
+        }
+    else:
+        changes, state["revision"] = changes_since(state["revision"])
+        state["updates"] = len(changes)
+        if changes:
+            state["page"] = None
+    if state["page"] is None:
+        state["page"], state["next"] = query_queue(
+            status=status, cursor=state["cursors"][-1], limit=PAGE_SIZE, **filters
+        )
+    return state
+
+def next_page(status: str):
+    state = st.session_state[f"queue_{status}"]
+    state["cursors"].append(state["next"])
+    state["page"] = None
+
+def previous_page(status: str):
+    state = st.session_state[f"queue_{status}"]
+    state["cursors"].pop()
+    state["page"] = None
+
+def render_pager(status: str, state: dict):
+    col1, col2, col3 = st.columns([1, 2, 1])
+    col1.button("⬅️ Previous", key=f"prev_{status}", disabled=len(state["cursors"]) == 1,
+                on_click=previous_page, args=(status,))
+    col2.caption(f"Page {len(state['cursors'])}")
+    col3.button("Next ➡️", key=f"next_{status}", disabled=state["next"] is None,
+                on_click=next_page, args=(status,))
+
+# Downloads are prepared on request and released once taken
+def set_download_ready(key: str, ready: bool):
+    st.session_state[key] = ready
 
 # MAIN APP
 st.title("🩺 Doctor Portal - Manage Appointments & Prescriptions")
 
-appointments = load_appointments()
-pending_appointments = [a for a in appointments if a.get("status") == "Pending"]
-accepted_appointments = [a for a in appointments if a.get("status") == "Accepted"]
-
 # SECTION 1: Accept/Reject Appointments
 st.header("📋 Appointment Management")
 
-if not pending_appointments and not accepted_appointments:
+f1, f2, f3 = st.columns(3)
+specialist = f1.selectbox("Specialist", ["All"] + list_specialists(), key="q_specialist")
+urgency_band = f2.selectbox("Urgency", ["All"] + list(URGENCY_BANDS), key="q_urgency")
+date_range = f3.date_input("Booked between", value=(), key="q_dates")
+filters = {
+    "specialist": None if specialist == "All" else specialist,
+    "urgency_band": None if urgency_band == "All" else urgency_band,
+    "booked_from": date_range[0].isoformat() if len(date_range) > 0 else None,
+    # booking_time is a full timestamp, so the end date is exclusive of the next day
+    "booked_to": (date_range[1] + timedelta(days=1)).isoformat() if len(date_range) > 1 else None,
+}
+
+pending = load_queue_page("Pending", filters)
+accepted = load_queue_page("Accepted", filters)
+if pending["updates"]:
+    st.caption(f"🔄 {pending['updates']} appointment update(s) since the last refresh")
+
+if not pending["page"] and not accepted["page"] and len(pending["cursors"]) == 1 and len(accepted["cursors"]) == 1:
     st.info("No pending or accepted appointments at the moment.")
 else:
-    if pending_appointments:
+    if pending["page"] or len(pending["cursors"]) > 1:
         st.subheader("🕒 Pending Appointments")
-        for app in pending_appointments:
+        for app in pending["page"]:
             st.write(f"*ID:* {app['id']}")
             st.write(f"*Patient Name:* {app['name']}")
             st.write(f"*Symptoms:* {app['symptoms']}")
             st.write(f"*Urgency Score:* {app['urgency_score']}")
             st.write(f"*Time Recommendation:* {app['time_recommendation']}")
             col1, col2 = st.columns(2)
+            # Transitions only apply while the appointment is still Pending
             if col1.button(f"✅ Accept {app['id']}", key=f"accept_{app['id']}"):
-                app['status'] = "Accepted"
-                save_appointments(appointments)
-                st.success(f"Appointment {app['id']} accepted.")
+                if set_status(app['id'], "Accepted", expected_status="Pending"):
+                    st.success(f"Appointment {app['id']} accepted.")
+                else:
+                    st.warning(f"Appointment {app['id']} was already handled.")
                 st.rerun()
             if col2.button(f"❌ Reject {app['id']}", key=f"reject_{app['id']}"):
-                app['status'] = "Rejected"
-                save_appointments(appointments)
-                st.warning(f"Appointment {app['id']} rejected.")
+                if set_status(app['id'], "Rejected", expected_status="Pending"):
+                    st.warning(f"Appointment {app['id']} rejected.")
+                else:
+                    st.warning(f"Appointment {app['id']} was already handled.")
                 st.rerun()
+        render_pager("Pending", pending)
 
-    if accepted_appointments:
+    if accepted["page"] or len(accepted["cursors"]) > 1:
         st.subheader("✅ Accepted Appointments & Patient Info")
-        for app in accepted_appointments:
+        for app in accepted["page"]:
             with st.expander(f"Appointment ID: {app['id']} - Patient: {app['name']}"):
                 for key, value in app.items():
                     st.write(f"*{key.capitalize().replace('_', ' ')}:* {value}")
+        render_pager("Accepted", accepted)
 
 # SECTION 2: Prescription Suggestion Tool
 st.header("📁 Prescription Viewer & Suggestions")
 
 patient_id = st.text_input("🔍 Enter Patient ID to View Prescriptions", key="dpid")
 if patient_id:
-    pid_folder = os.path.join(UPLOAD_DIR, patient_id)
-    if os.path.isdir(pid_folder):
-        files = sorted(os.listdir(pid_folder))
-        if not files:
-            st.warning("No uploaded files found for this patient.")
-        for fname in files:
+    # Listing reads only the metadata index; file bodies stay on disk
+    uploads = list_uploads(patient_id)
+    if uploads:
+        for upload in uploads:
+            fname = upload["file_name"]
             st.write(f"*📄 File:* {fname}")
-            path = os.path.join(pid_folder, fname)
-            with open(path, "rb") as f:
-                st.download_button("⬇️ Download", f.read(), file_name=fname)
+            st.caption(f"{upload['size'] / 1024:.1f} KB · {upload['mime'] or 'unknown type'} · uploaded {upload['uploaded_at'][:16]}")
+            # Only the file the doctor asked for is opened and sent
+            ready_key = f"dl_{upload['id']}"
+            if upload["size"] > MAX_DOWNLOAD_MB * (1 << 20):
+                st.info(f"Over the {MAX_DOWNLOAD_MB:g} MB portal download limit; stored at {object_path(upload['sha256'])}")
+            elif st.session_state.get(ready_key):
+                with open_upload(upload) as f:
+                    st.download_button("⬇️ Download", f, file_name=fname, mime=upload["mime"], key=f"dlb_{upload['id']}",
+                                       on_click=set_download_ready, args=(ready_key, False))
+            else:
+                st.button("📥 Prepare download", key=f"prep_{upload['id']}",
+                          on_click=set_download_ready, args=(ready_key, True))
 
             key_text = f"sugg_{patient_id}_{fname}"
             key_btn = f"btn_{patient_id}_{fname}"
@@ -102,13 +162,11 @@ if patient_id:
             def save(pid=patient_id, fn=fname, key=key_text):
                 sugg = st.session_state[key].strip()
                 if sugg:
-                    entry = f"{datetime.now()},{pid},{fn},{sugg}\n"
-                    with open(SUGGESTIONS_FILE, "a") as sf:
-                        sf.write(entry)
+                    add_suggestion(pid, fn, sugg)
                     st.session_state[f"saved_{key}"] = True
 
             st.button("📤 Submit Suggestion", key=key_btn, on_click=save)
             if st.session_state.get(f"saved_{key_btn}".replace("btn_", "sugg_"), False):
                 st.success("Suggestion recorded ✅")
     else:
-        st.warning("Patient folder not found. Please check Patient ID.")
\ No newline at end of file
+        st.warning("No uploaded files found for this patient. Please check Patient ID.")
\ No newline at end of file
@@ -0,0 +1,204 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# ------------------- Configuration -------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.environ.get("RAG_EMBED_CACHE_FILE", os.path.join(BASE_DIR, "embedding_cache.db"))
+# Vector bytes kept on disk; least recently used entries go first. 0 disables the cache.
+MAX_MB = float(os.environ.get("RAG_EMBED_CACHE_MB", "512"))
+# Eviction trims to this share of the limit so it does not run on every insert
+EVICT_TO = 0.9
+# Bytes written between size checks
+CHECK_EVERY_BYTES = 1 << 20
+# Hits note last_used in memory and write it back in one transaction once this
+# many keys or seconds have built up, so lookups are not a write each. Touches
+# lost with the process only make eviction order slightly less exact.
+TOUCH_FLUSH_KEYS = 1000
+TOUCH_FLUSH_SECONDS = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    model TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used);
+"""
+
+
+# Whitespace only: case and punctuation can change the embedding
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    # Content-addressed store of embeddings keyed by (model, normalized text).
+    # SQLite in WAL mode with one connection per thread, like the appointment
+    # store, so Streamlit sessions and the ingest CLI can share one file.
+
+    def __init__(self, path: str = CACHE_FILE, max_mb: float = MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * (1 << 20))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._written = 0
+        self._touched: Dict[bytes, float] = {}
+        self._next_touch_flush = time.monotonic() + TOUCH_FLUSH_SECONDS
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        keys = [cache_key(model, t) for t in texts]
+        positions: Dict[bytes, List[int]] = {}
+        for i, key in enumerate(keys):
+            positions.setdefault(key, []).append(i)
+        found: Dict[int, np.ndarray] = {}
+        hit_keys: List[bytes] = []
+        conn = self._conn()
+        unique = list(positions)
+        # SQLite caps bound parameters; look up in slices
+        for start in range(0, len(unique), 500):
+            part = unique[start:start + 500]
+            marks = ",".join("?" * len(part))
+            rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part).fetchall()
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype="float32")
+                for i in positions[key]:
+                    found[i] = vector
+                hit_keys.append(key)
+        now = time.time()
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+            self._touched.update(dict.fromkeys(hit_keys, now))
+            flush = len(self._touched) >= TOUCH_FLUSH_KEYS or time.monotonic() >= self._next_touch_flush
+        if flush:
+            self.flush_touches()
+        return found
+
+    # Writes the buffered last_used times of cache hits
+    def flush_touches(self):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._next_touch_flush = time.monotonic() + TOUCH_FLUSH_SECONDS
+        if not touched:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(t, k) for k, t in touched.items()])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype="float32")
+        now = time.time()
+        rows = [(cache_key(model, t), model, int(v.shape[0]), v.tobytes(), now) for t, v in zip(texts, vectors)]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, model, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._written += vectors.nbytes
+            check = self._written >= CHECK_EVERY_BYTES
+            if check:
+                self._written = 0
+        if check:
+            self.evict()
+
+    def size_bytes(self) -> int:
+        return self._conn().execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    # Drops least recently used entries until the cache is under EVICT_TO of its limit
+    def evict(self) -> int:
+        excess = self.size_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+        # Recent hits must count before choosing what to drop
+        self.flush_touches()
+        excess += int(self.max_bytes * (1 - EVICT_TO))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = freed = 0
+            for key, size in conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used").fetchall():
+                if freed >= excess:
+                    break
+                conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                freed += size
+                removed += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+class CachedEmbedder:
+    # Drop-in for a SentenceTransformer on the encode() paths used here
+    # (ingestion batches and query embeddings): cached texts skip the model.
+
+    def __init__(self, model, model_key: str, cache: Optional[EmbeddingCache] = None):
+        self.model = model
+        self.model_key = model_key
+        self.cache = cache or EmbeddingCache()
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        found = self.cache.get_many(self.model_key, texts)
+        missing = [i for i in range(len(texts)) if i not in found]
+        if missing:
+            fresh = np.asarray(self.model.encode([texts[i] for i in missing], batch_size=batch_size, **kwargs), dtype="float32")
+            self.cache.put_many(self.model_key, [texts[i] for i in missing], fresh)
+            found.update(zip(missing, fresh))
+        dim = self.get_sentence_embedding_dimension()
+        vectors = np.stack([found[i] for i in range(len(texts))]) if texts else np.zeros((0, dim), dtype="float32")
+        return vectors[0] if single else vectors
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
@@ -0,0 +1,150 @@
+import os
+from typing import Optional
+
+from rag_index import BASE_DIR, EMBED_MODEL
+
+# ------------------- Configuration -------------------
+QA_MODEL = "deepset/roberta-base-squad2"
+# Small CPU cross-encoder that picks which retrieved chunks reach the QA model
+RERANK_MODEL = os.environ.get("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+MODEL_DIR = os.path.join(BASE_DIR, "onnx_models")
+EMBED_DIR = os.path.join(MODEL_DIR, "embedder")
+QA_DIR = os.path.join(MODEL_DIR, "qa")
+
+# torch | onnx | onnx-int8
+BACKEND = os.environ.get("RAG_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# Intra-op threads per model; 0 leaves the runtime default (all cores)
+INTRA_OP_THREADS = int(os.environ.get("RAG_INTRA_OP_THREADS", "0"))
+# Target instruction set for dynamic int8 quantization (avx2 | avx512 | avx512_vnni | arm64)
+QUANT_ARCH = os.environ.get("RAG_QUANT_ARCH", "avx2")
+
+EMBED_INT8_FILE = f"onnx/model_qint8_{QUANT_ARCH}.onnx"
+QA_INT8_FILE = "model_quantized.onnx"
+
+
+def check_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; expected one of {BACKENDS}")
+
+
+def session_options(threads: int = INTRA_OP_THREADS):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+# ------------------- Export -------------------
+def export_models(quantize: bool = True, out_dir: str = MODEL_DIR):
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+    from optimum.onnxruntime import ORTModelForQuestionAnswering, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    embed_dir = os.path.join(out_dir, "embedder")
+    qa_dir = os.path.join(out_dir, "qa")
+
+    # sentence-transformers exports to ONNX on load with backend="onnx"
+    embedder = SentenceTransformer(EMBED_MODEL, backend="onnx")
+    embedder.save_pretrained(embed_dir)
+    if quantize:
+        export_dynamic_quantized_onnx_model(embedder, QUANT_ARCH, embed_dir)
+
+    qa_model = ORTModelForQuestionAnswering.from_pretrained(QA_MODEL, export=True)
+    qa_model.save_pretrained(qa_dir)
+    AutoTokenizer.from_pretrained(QA_MODEL).save_pretrained(qa_dir)
+    if quantize:
+        quant_config = getattr(AutoQuantizationConfig, QUANT_ARCH)(is_static=False, per_channel=False)
+        ORTQuantizer.from_pretrained(qa_model).quantize(save_dir=qa_dir, quantization_config=quant_config)
+
+
+def ensure_exported(backend: str):
+    needed = [os.path.join(EMBED_DIR, "onnx", "model.onnx"), os.path.join(QA_DIR, "model.onnx")]
+    if backend == "onnx-int8":
+        needed += [os.path.join(EMBED_DIR, EMBED_INT8_FILE), os.path.join(QA_DIR, QA_INT8_FILE)]
+    if not all(os.path.exists(p) for p in needed):
+        export_models(quantize=backend == "onnx-int8")
+
+
+# ------------------- Loading -------------------
+def set_torch_threads(threads: int = INTRA_OP_THREADS):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+
+# Both loaders return drop-in objects: a SentenceTransformer with .encode()
+# and a transformers question-answering pipeline, whatever the backend.
+# Identifies the vectors an embedder produces; quantized exports embed differently
+def embedder_key(backend: str) -> str:
+    return f"{EMBED_MODEL}:{backend}" + (f":{QUANT_ARCH}" if backend == "onnx-int8" else "")
+
+
+# cached=True puts the on-disk embedding cache in front of the model (shared by
+# ingestion and queries); benches comparing raw backends pass cached=False
+def load_embedder(backend: Optional[str] = None, cached: bool = True):
+    from sentence_transformers import SentenceTransformer
+    from embedding_cache import MAX_MB, CachedEmbedder
+
+    backend = backend or BACKEND
+    check_backend(backend)
+    if backend == "torch":
+        set_torch_threads()
+        model = SentenceTransformer(EMBED_MODEL)
+    else:
+        ensure_exported(backend)
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options()}
+        if backend == "onnx-int8":
+            model_kwargs["file_name"] = EMBED_INT8_FILE
+        model = SentenceTransformer(EMBED_DIR, backend="onnx", model_kwargs=model_kwargs)
+    return CachedEmbedder(model, embedder_key(backend)) if cached and MAX_MB > 0 else model
+
+
+def load_reranker(backend: Optional[str] = None):
+    from sentence_transformers import CrossEncoder
+
+    backend = backend or BACKEND
+    check_backend(backend)
+    if backend == "torch":
+        set_torch_threads()
+        return CrossEncoder(RERANK_MODEL)
+    # Exported on first load; the model is small enough that no cache dir is needed
+    model_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options()}
+    return CrossEncoder(RERANK_MODEL, backend="onnx", model_kwargs=model_kwargs)
+
+
+def load_qa_pipeline(backend: Optional[str] = None):
+    from transformers import pipeline
+
+    backend = backend or BACKEND
+    check_backend(backend)
+    if backend == "torch":
+        set_torch_threads()
+        return pipeline("question-answering", model=QA_MODEL)
+
+    from optimum.onnxruntime import ORTModelForQuestionAnswering
+    from transformers import AutoTokenizer
+
+    ensure_exported(backend)
+    model = ORTModelForQuestionAnswering.from_pretrained(
+        QA_DIR,
+        file_name=QA_INT8_FILE if backend == "onnx-int8" else "model.onnx",
+        provider="CPUExecutionProvider",
+        session_options=session_options(),
+    )
+    return pipeline("question-answering", model=model, tokenizer=AutoTokenizer.from_pretrained(QA_DIR))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the embedder and QA model to ONNX")
+    parser.add_argument("--no-quantize", action="store_true", help="skip the int8 variants")
+    args = parser.parse_args()
+    export_models(quantize=not args.no_quantize)
+    print(f"Exported ONNX models to {MODEL_DIR}")
@@ -1,5 +1,6 @@
 import urllib.parse
 import streamlit as st
+from triage_rules import get_rule_engine
 # Inject background image using inline CSS
 
 
@@ -14,34 +15,9 @@ if os.path.exists("style.css"):
 
 
 
-# Map some keywords to specialists
-SPECIALIST_KEYWORDS = {
-    "cardiologist": ["chest pain", "heart", "cardiac", "palpitations", "blood pressure", "cardiovascular"],
-    "dermatologist": ["rash", "skin", "acne", "eczema", "psoriasis", "itching", "blister"],
-    "neurologist": ["headache", "migraine", "seizure", "dizziness", "numbness", "stroke", "neuropathy"],
-    "orthopedic": ["bone", "fracture", "joint", "arthritis", "sprain", "back pain"],
-    "pulmonologist": ["breathing", "asthma", "cough", "lung", "bronchitis", "shortness of breath"],
-    "gastroenterologist": ["stomach", "abdominal pain", "diarrhea", "constipation", "nausea", "vomiting", "liver"],
-    "psychiatrist": ["depression", "anxiety", "suicide", "mental health", "stress"],
-    "general practitioner": []  # fallback if no match
-}
-
+# Specialist keywords live in triage_rules.json, shared with the urgency triage
 def infer_specialist(symptoms: str) -> str:
-    symptoms_lower = symptoms.lower()
-    scores = {specialist: 0 for specialist in SPECIALIST_KEYWORDS}
-
-    for specialist, keywords in SPECIALIST_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword in symptoms_lower:
-                scores[specialist] += 1
-
-    # Pick the specialist with the highest keyword match count
-    best_specialist = max(scores, key=scores.get)
-
-    # If no keyword matched (all zero), fallback to General Practitioner
-    if scores[best_specialist] == 0:
-        return "General Practitioner"
-    return best_specialist.capitalize()
+    return get_rule_engine().specialist(symptoms)
 
 def generate_google_maps_link(location: str, specialist: str) -> str:
     base_url = "https://www.google.com/maps/search/"
@@ -0,0 +1,243 @@
+# Latency spans, Prometheus-style metrics and the sampled trace log for the RAG path.
+#
+#   RAG_METRICS_PORT=9464 streamlit run web.py    # in-process engine, scrape :9464/metrics
+#   python rag_service.py                         # service exposes GET /metrics itself
+#   RAG_TRACE_LEVEL=DEBUG RAG_TRACE_SAMPLE=1 ...  # trace every query, chunk previews included
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# ------------------- Configuration -------------------
+METRICS_HOST = os.environ.get("RAG_METRICS_HOST", "127.0.0.1")
+# 0 disables the standalone metrics server
+METRICS_PORT = int(os.environ.get("RAG_METRICS_PORT", "0"))
+# Level of the rag.trace logger: INFO logs span timings, DEBUG adds chunk text and raw QA output
+TRACE_LEVEL = os.environ.get("RAG_TRACE_LEVEL", "WARNING").upper()
+# Fraction of queries that get traced at all
+TRACE_SAMPLE = float(os.environ.get("RAG_TRACE_SAMPLE", "0.01"))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[str, ...]
+
+
+# Label values escape backslash, double quote and newline, per the text format
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: Tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_text(self.labelnames, k)} {v:g}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        # label key -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def summary(self) -> Dict[LabelKey, Tuple[int, float]]:
+        with self._lock:
+            return {key: (sum(counts), total[0]) for key, (counts, total) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            series = sorted((k, list(c), t[0]) for k, (c, t) in self._series.items())
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        # Collectors report point-in-time values (queue depth, cache stats) at scrape time
+        self._collectors: Dict[str, Callable[[], List[Tuple[str, str, Dict[str, str], float]]]] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    # fn returns (name, help, labels, value) tuples, all exposed as gauges
+    def add_collector(self, key: str, fn: Callable[[], List[Tuple[str, str, Dict[str, str], float]]]):
+        self._collectors[key] = fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        collected: Dict[str, Tuple[str, List[str]]] = {}
+        for fn in list(self._collectors.values()):
+            for name, help_text, labels, value in fn():
+                names = tuple(sorted(labels))
+                sample = f"{name}{_label_text(names, tuple(labels[n] for n in names))} {float(value):g}"
+                collected.setdefault(name, (help_text, []))[1].append(sample)
+        for name, (help_text, samples) in collected.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"] + samples
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Latency of each stage of the RAG path", ("stage",))
+MODEL_LOAD_SECONDS = REGISTRY.gauge("rag_model_load_seconds", "Time taken to load each model or index", ("component",))
+
+
+# ------------------- Trace log -------------------
+trace_log = logging.getLogger("rag.trace")
+if not trace_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    trace_log.addHandler(_handler)
+    trace_log.setLevel(getattr(logging, TRACE_LEVEL, logging.WARNING))
+    trace_log.propagate = False
+
+_sampled: ContextVar[bool] = ContextVar("rag_trace_sampled", default=False)
+
+
+# Decides once per query whether its spans and details are logged
+def start_trace(sample: float = TRACE_SAMPLE) -> bool:
+    sampled = trace_log.isEnabledFor(logging.INFO) and random.random() < sample
+    _sampled.set(sampled)
+    return sampled
+
+
+def trace(level: int, message: str, *args):
+    # Formatting is deferred, so unsampled queries pay one ContextVar lookup
+    if _sampled.get() and trace_log.isEnabledFor(level):
+        trace_log.log(level, message, *args)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace(logging.INFO, "span stage=%s ms=%.2f", stage, elapsed * 1000)
+
+
+@contextmanager
+def timed_load(component: str) -> Iterator[None]:
+    start = time.perf_counter()
+    yield
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - start, component=component)
+
+
+# Mean latency per stage in milliseconds, for JSON health/stats payloads
+def stage_means_ms() -> Dict[str, float]:
+    return {key[0]: round(total / count * 1000, 2) for key, (count, total) in STAGE_SECONDS.summary().items() if count}
+
+
+# ------------------- Standalone endpoint -------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+# For processes without their own HTTP surface (the in-process Streamlit engine)
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    global _server
+    if _server is None and port:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    return _server
@@ -2,11 +2,13 @@ import streamlit as st
 # Inject background image using inline CSS
 
 
-import json
 import os
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 from prescription_portal import run_prescription_module
+from appointment_store import add_appointment, list_appointments
+from suggestion_store import suggestions_for_many
+from triage_rules import get_rule_engine
 
 
 
@@ -15,73 +17,12 @@ if os.path.exists("style.css"):
     with open("style.css") as f:
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
-# ------------------- Configuration -------------------
-BOOKED_FILE = "appointments.json"
-
 # ------------------- Offline Symptom Analysis -------------------
+# Keywords live in triage_rules.json and are compiled once into a single matcher
 def analyze_symptoms_offline(symptoms: str) -> Dict[str, str]:
-    symptoms_lower = symptoms.lower().strip()
-
-    emergency_keywords = [
-        'chest pain', 'heart attack', 'difficulty breathing', 'can\'t breathe',
-        'severe bleeding', 'unconscious', 'suicide', 'overdose', 'stroke',
-        'severe head injury', 'broken bone', 'severe burn'
-    ]
-    high_urgency_keywords = [
-        'high fever', 'severe pain', 'intense pain', 'can\'t walk',
-        'severe headache', 'vomiting blood', 'severe nausea', 'dehydrated',
-        'severe diarrhea', 'severe allergic reaction', 'swollen', 'infection'
-    ]
-    medium_urgency_keywords = [
-        'fever', 'headache', 'nausea', 'vomiting', 'diarrhea', 'pain',
-        'cough', 'cold', 'flu', 'sore throat', 'earache', 'rash',
-        'tired', 'fatigue', 'dizzy', 'stomach ache'
-    ]
-    low_urgency_keywords = [
-        'checkup', 'routine', 'physical', 'vaccination', 'prescription',
-        'mild pain', 'slight discomfort', 'general consultation'
-    ]
-
-    urgency_score = 5
-    time_recommendation = "Next day"
-    notes = "Please consult with healthcare provider for proper diagnosis"
-    key_symptoms = symptoms[:50] + "..." if len(symptoms) > 50 else symptoms
-
-    if any(keyword in symptoms_lower for keyword in emergency_keywords):
-        urgency_score = 9
-        time_recommendation = "IMMEDIATE - Go to Emergency Room"
-        notes = "⚠️ EMERGENCY: Seek immediate medical attention or call emergency services!"
-    elif any(keyword in symptoms_lower for keyword in high_urgency_keywords):
-        urgency_score = 8
-        time_recommendation = "Same-day"
-        notes = "High priority - Schedule appointment today or visit urgent care"
-    elif any(keyword in symptoms_lower for keyword in medium_urgency_keywords):
-        urgency_score = 6
-        time_recommendation = "Within 1-2 days"
-        notes = "Schedule appointment soon for evaluation and treatment"
-    elif any(keyword in symptoms_lower for keyword in low_urgency_keywords):
-        urgency_score = 3
-        time_recommendation = "Within 1-2 weeks"
-        notes = "Routine consultation - schedule at your convenience"
-
-    if 'severe' in symptoms_lower:
-        urgency_score = min(urgency_score + 2, 10)
-    if 'mild' in symptoms_lower:
-        urgency_score = max(urgency_score - 1, 1)
-
-    return {
-        "urgency_score": str(urgency_score),
-        "time_recommendation": time_recommendation,
-        "key_symptoms": key_symptoms,
-        "notes": f"{notes} (AI-powered assessment)"
-    }
+    return get_rule_engine().triage(symptoms)
 
 # ------------------- Utility Functions -------------------
-def ensure_data_file():
-    if not os.path.exists(BOOKED_FILE):
-        with open(BOOKED_FILE, "w") as f:
-            json.dump([], f)
-
 def get_urgency_color(score: int) -> str:
     if score >= 8:
         return "🔴"
@@ -90,14 +31,10 @@ def get_urgency_color(score: int) -> str:
     else:
         return "🟢"
 
-def book_appointment(name: str, age: str, location: str, symptoms: str, hospital: str, suggestion: Dict[str, str]) -> bool:
+# Returns the new appointment ID, or None if booking failed
+def book_appointment(name: str, age: str, location: str, symptoms: str, hospital: str, suggestion: Dict[str, str]) -> Optional[int]:
     try:
-        ensure_data_file()
-        with open(BOOKED_FILE, "r") as f:
-            data = json.load(f)
-
         appointment = {
-            "id": len(data) + 1,
             "name": name,
             "age": age,
             "location": location,
@@ -108,24 +45,22 @@ def book_appointment(name: str, age: str, location: str, symptoms: str, hospital
             "key_symptoms": suggestion["key_symptoms"],
             "notes": suggestion["notes"],
             "booking_time": datetime.now().isoformat(),
-            "status": "Pending"
+            "status": "Pending",
+            # Stored so the doctor queue can filter by specialist server-side
+            "specialist": infer_specialist(symptoms),
+            # Login that booked it; the chatbot only reads prescriptions of its own appointments
+            "patient_id": st.session_state.get("patient_id") or None,
         }
 
-        data.append(appointment)
-
-        with open(BOOKED_FILE, "w") as f:
-            json.dump(data, f, indent=2)
-
-        return True
+        # The store assigns the ID inside the insert, so concurrent bookings never collide
+        return add_appointment(appointment)
     except Exception as e:
         st.error(f"❌ Failed to book appointment: {str(e)}")
-        return False
+        return None
 
 def load_appointments() -> List[Dict]:
     try:
-        ensure_data_file()
-        with open(BOOKED_FILE, "r") as f:
-            return json.load(f)
+        return list_appointments()
     except Exception as e:
         st.error(f"❌ Failed to load appointments: {str(e)}")
         return []
@@ -244,14 +179,13 @@ def book_appointment_tab():
         col1, col2 = st.columns([3, 1])
         col1.write("Ready to confirm booking?")
         if col2.button("📅 Book Appointment", use_container_width=True, disabled=st.session_state.appointment_booked):
-            if book_appointment(name, age, location, symptoms, hospital, suggestion):
+            appointment_id = book_appointment(name, age, location, symptoms, hospital, suggestion)
+            if appointment_id:
                 st.session_state.appointment_booked = True
                 st.success("🎉 Appointment successfully booked!")
                 st.balloons()
 
-                appointments = load_appointments()
-                if appointments:
-                    st.session_state.last_patient_id = str(appointments[-1]["id"])  # Save for upload module
+                st.session_state.last_patient_id = str(appointment_id)  # Save for upload module
 
                 # Reset form state
                 for key in ['form_name', 'form_age', 'form_location', 'form_symptoms', 'form_hospital']:
@@ -280,7 +214,7 @@ def view_appointments_tab():
         st.info("📝 No appointments booked yet.")
         return
 
-    valid_appointments = [a for a in appointments if "urgency_score" in a]
+    valid_appointments = [a for a in appointments if a.get("urgency_score") is not None]
     if not valid_appointments:
         st.warning("No appointments with urgency data available.")
         return
@@ -292,6 +226,9 @@ def view_appointments_tab():
         elif appt["status"] == "Rejected":
             st.error(f"❌ Your appointment with ID #{appt['id']} has been rejected.")
 
+    # One bulk lookup for every appointment's doctor suggestions
+    suggestions_by_id = suggestions_for_many(str(a["id"]) for a in valid_appointments)
+
     # Group by appointment for display
     for appt in valid_appointments:
         with st.expander(f"📄 Appointment #{appt['id']} - {appt['name']} ({appt['status']})"):
@@ -304,29 +241,14 @@ def view_appointments_tab():
             st.write(f"**Booked On:** {appt['booking_time']}")
             st.write(f"**AI Notes:** {appt['notes']}")
 
-            # 👉 NEW: Load doctor suggestions from file
-            suggestions = []
-            SUGGESTIONS_FILE = "suggestions.txt"
-            patient_id = str(appt["id"])
-            if os.path.exists(SUGGESTIONS_FILE):
-                with open(SUGGESTIONS_FILE, "r") as f:
-                    for line in f:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        parts = line.split(",", 3)
-                        if len(parts) == 4:
-                            ts, pid, fname, sugg = parts
-                            if pid == patient_id:
-                                suggestions.append((ts, fname, sugg))
-
+            suggestions = suggestions_by_id.get(str(appt["id"]), [])
             if suggestions:
                 st.markdown("---")
                 st.subheader("🧑‍⚕️ Suggestions from Doctor")
-                for ts, fname, sugg in suggestions:
-                    st.write(f"📄 **File:** {fname}")
-                    st.write(f"💬 **Suggestion:** {sugg}")
-                    st.caption(f"🕒 Submitted at {ts}")
+                for sugg in suggestions:
+                    st.write(f"📄 **File:** {sugg['file_name']}")
+                    st.write(f"💬 **Suggestion:** {sugg['suggestion']}")
+                    st.caption(f"🕒 Submitted at {sugg['created_at']}")
             else:
                 st.info("No suggestions from the doctor yet.")
 
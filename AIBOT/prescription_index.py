@@ -0,0 +1,369 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from appointment_store import appointment_ids_for
+from read_cache import VersionedCache
+from upload_store import _connection as _uploads_connection, get_upload, list_uploads, object_path
+
+# ------------------- Configuration -------------------
+# Extraction threads per process; OCR runs in tesseract subprocesses and the
+# embedder releases the GIL, so a couple of threads keep a core busy
+EXTRACT_WORKERS = int(os.environ.get("RAG_EXTRACT_WORKERS", "2"))
+MAX_ATTEMPTS = 3
+# Seconds before the first retry; doubles with each attempt
+RETRY_BACKOFF = 10.0
+# How often idle workers look for jobs queued by other processes
+POLL_SECONDS = 2.0
+# A running job is leased to one process, which renews the lease every
+# HEARTBEAT_SECONDS; other processes only take it over once it has gone
+# LEASE_SECONDS without a heartbeat (its owner died)
+LEASE_SECONDS = 90.0
+HEARTBEAT_SECONDS = 15.0
+# Prescription chunks added to the QA contexts for a patient's question
+PATIENT_TOP_K = 1
+# Cosine similarity a prescription chunk needs to the question to be used at
+# all; below it an unrelated prescription could supply the extractive answer
+PATIENT_MIN_SIMILARITY = float(os.environ.get("RAG_PATIENT_MIN_SIMILARITY", "0.35"))
+IMAGE_MIMES = ("image/png", "image/jpeg")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS extraction_jobs (
+    upload_id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL DEFAULT 0,
+    owner TEXT,
+    heartbeat_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_extraction_jobs_queue ON extraction_jobs(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_extraction_jobs_patient ON extraction_jobs(patient_id);
+CREATE TABLE IF NOT EXISTS patient_chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    upload_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    vector BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_patient_chunks_patient ON patient_chunks(patient_id, id);
+CREATE INDEX IF NOT EXISTS idx_patient_chunks_upload ON patient_chunks(upload_id);
+"""
+
+# Columns added after the first release; existing databases get them via ALTER TABLE
+ADDED_COLUMNS = {"owner": "TEXT", "heartbeat_at": "REAL NOT NULL DEFAULT 0"}
+
+log = logging.getLogger("rag.prescriptions")
+_init_lock = threading.Lock()
+_initialized = False
+# Per-patient side indexes, rebuilt when that patient's chunks change
+_side_indexes = VersionedCache("patient_chunks", max_entries=256)
+# Lease owner for jobs claimed by this process; unique even if a PID is reused
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class ExtractionUnavailable(Exception):
+    # No extractor for this file type here (e.g. tesseract missing); not retried
+    pass
+
+
+# Jobs and chunks live next to the uploads in the same SQLite database
+def _connection():
+    global _initialized
+    conn = _uploads_connection()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.executescript(SCHEMA)
+                _add_missing_columns(conn)
+                _initialized = True
+    return conn
+
+
+def _add_missing_columns(conn):
+    existing = {row["name"] for row in conn.execute("PRAGMA table_info(extraction_jobs)")}
+    for column, column_type in ADDED_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE extraction_jobs ADD COLUMN {column} {column_type}")
+
+
+# ------------------- Queue -------------------
+# Queues an upload for extraction. The queue is a table, so jobs survive
+# restarts and are picked up by whichever process runs the workers.
+def enqueue_upload(upload: Dict):
+    _connection().execute(
+        "INSERT OR IGNORE INTO extraction_jobs (upload_id, patient_id, updated_at) VALUES (?, ?, ?)",
+        (upload["id"], str(upload["patient_id"]), time.time()),
+    )
+    _wake.set()
+
+
+# Queues uploads saved before the pipeline existed (or by older code)
+def enqueue_missing() -> int:
+    return _connection().execute(
+        "INSERT OR IGNORE INTO extraction_jobs (upload_id, patient_id, updated_at) "
+        "SELECT id, patient_id, ? FROM uploads WHERE id NOT IN (SELECT upload_id FROM extraction_jobs)",
+        (time.time(),),
+    ).rowcount
+
+
+# Extraction state per upload for the UI: {upload id: job row}
+def job_status(patient_id: str) -> Dict[int, Dict]:
+    rows = _connection().execute(
+        "SELECT upload_id, status, attempts, chunks, error FROM extraction_jobs WHERE patient_id = ?",
+        (str(patient_id),),
+    )
+    return {row["upload_id"]: dict(row) for row in rows}
+
+
+# Uploads, and so their jobs and chunks, are filed under the appointment ID
+# they were made for; a login owns the appointments it booked
+def owned_upload_keys(login_id: str) -> List[str]:
+    return [str(appointment_id) for appointment_id in appointment_ids_for(login_id)]
+
+
+def patient_chunk_count(upload_keys: Sequence[str]) -> int:
+    keys = [str(key) for key in upload_keys]
+    if not keys:
+        return 0
+    return _connection().execute(
+        f"SELECT COUNT(*) FROM patient_chunks WHERE patient_id IN ({', '.join('?' for _ in keys)})", keys
+    ).fetchone()[0]
+
+
+def queue_counts() -> Dict[str, int]:
+    rows = _connection().execute("SELECT status, COUNT(*) FROM extraction_jobs GROUP BY status")
+    return {status: count for status, count in rows}
+
+
+# A job another worker may take: queued and due, or running under a lease
+# whose owner stopped renewing it
+CLAIMABLE = (
+    "((status = 'queued' AND next_attempt_at <= ?) "
+    f"OR (status = 'running' AND heartbeat_at < ? AND attempts < {MAX_ATTEMPTS}))"
+)
+
+
+# Leases one claimable job to this process and returns it; the conditional
+# UPDATE makes the claim safe against workers in other processes
+def _claim() -> Optional[Dict]:
+    conn = _connection()
+    now = time.time()
+    expired = now - LEASE_SECONDS
+    row = conn.execute(
+        f"SELECT upload_id, patient_id, attempts FROM extraction_jobs WHERE {CLAIMABLE} "
+        "ORDER BY next_attempt_at, upload_id LIMIT 1",
+        (now, expired),
+    ).fetchone()
+    if row is None:
+        return None
+    claimed = conn.execute(
+        "UPDATE extraction_jobs SET status = 'running', attempts = attempts + 1, owner = ?, heartbeat_at = ?, "
+        f"updated_at = ? WHERE upload_id = ? AND {CLAIMABLE}",
+        (OWNER, now, now, row["upload_id"], now, expired),
+    ).rowcount
+    return dict(row, attempts=row["attempts"] + 1) if claimed else None
+
+
+# Renews the leases of every job this process is running
+def _heartbeat():
+    _connection().execute(
+        "UPDATE extraction_jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?", (time.time(), OWNER)
+    )
+
+
+# Results only land while this process still holds the lease; a job taken
+# over after a stall belongs to its new owner
+def _finish(upload_id: int, chunks: int):
+    _connection().execute(
+        "UPDATE extraction_jobs SET status = 'done', chunks = ?, error = NULL, updated_at = ? "
+        "WHERE upload_id = ? AND owner = ?",
+        (chunks, time.time(), upload_id, OWNER),
+    )
+
+
+def _fail(job: Dict, error: str, retry: bool):
+    now = time.time()
+    if retry and job["attempts"] < MAX_ATTEMPTS:
+        status, next_attempt = "queued", now + RETRY_BACKOFF * 2 ** (job["attempts"] - 1)
+    else:
+        status, next_attempt = "failed", 0
+    _connection().execute(
+        "UPDATE extraction_jobs SET status = ?, error = ?, next_attempt_at = ?, updated_at = ? "
+        "WHERE upload_id = ? AND owner = ?",
+        (status, error, next_attempt, now, job["upload_id"], OWNER),
+    )
+
+
+# ------------------- Extraction -------------------
+# Returns (page, text) pairs. PDFs use their text layer; images go through
+# tesseract when pytesseract and the tesseract binary are installed.
+def extract_pages(upload: Dict) -> List[Tuple[int, str]]:
+    path = object_path(upload["sha256"])
+    mime = upload.get("mime") or ""
+    if mime == "application/pdf" or upload["file_name"].lower().endswith(".pdf"):
+        from langchain_community.document_loaders import PyPDFLoader
+
+        return [(int(page.metadata.get("page", i)), page.page_content) for i, page in enumerate(PyPDFLoader(path).lazy_load())]
+    if mime in IMAGE_MIMES:
+        try:
+            import pytesseract
+            from PIL import Image
+        except ImportError:
+            raise ExtractionUnavailable("OCR needs pytesseract and Pillow installed")
+        try:
+            with Image.open(path) as image:
+                return [(0, pytesseract.image_to_string(image))]
+        except pytesseract.TesseractNotFoundError:
+            raise ExtractionUnavailable("OCR needs the tesseract binary on PATH")
+    raise ExtractionUnavailable(f"no text extractor for {mime or 'unknown type'}")
+
+
+# Same token-sized chunker as the main corpus
+def split_pages(pages: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    from chunker import get_chunker
+
+    chunker = get_chunker()
+    return [(page, chunk.text) for page, text in pages for chunk in chunker.split_page(text, page)]
+
+
+# Replaces the upload's chunks in one transaction, so a retried job never
+# leaves duplicates and readers never see half an upload
+def store_chunks(upload: Dict, chunks: List[Tuple[int, str]], vectors: np.ndarray):
+    vectors = np.asarray(vectors, dtype="float32")
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM patient_chunks WHERE upload_id = ?", (upload["id"],))
+        conn.executemany(
+            "INSERT INTO patient_chunks (patient_id, upload_id, page, text, vector) VALUES (?, ?, ?, ?, ?)",
+            [(str(upload["patient_id"]), upload["id"], page, text, v.tobytes()) for (page, text), v in zip(chunks, vectors)],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# ------------------- Side index -------------------
+def _load_side_index(patient_id: str) -> Tuple[List[str], np.ndarray]:
+    rows = _connection().execute(
+        "SELECT text, vector FROM patient_chunks WHERE patient_id = ? ORDER BY id", (patient_id,)
+    ).fetchall()
+    if not rows:
+        return [], np.zeros((0, 0), dtype="float32")
+    return [row["text"] for row in rows], np.stack([np.frombuffer(row["vector"], dtype="float32") for row in rows])
+
+
+# A patient's own prescription chunks closest to the query, if any are similar
+# enough to it, across the upload keys (appointments) the patient owns.
+# Patients have a handful of chunks, so each side index is an exact scan over
+# a small matrix.
+def search_patient(upload_keys: Sequence[str], query_embedding: np.ndarray, k: int = PATIENT_TOP_K,
+                   min_similarity: float = PATIENT_MIN_SIMILARITY) -> List[str]:
+    query = np.asarray(query_embedding, dtype="float32").reshape(-1)
+    scored: List[Tuple[float, str]] = []
+    for key in map(str, upload_keys):
+        version = tuple(_connection().execute(
+            "SELECT COALESCE(MAX(id), 0), COUNT(*) FROM patient_chunks WHERE patient_id = ?", (key,)
+        ).fetchone())
+        if not version[1]:
+            continue
+        texts, vectors = _side_indexes.get(key, version, lambda: _load_side_index(key))
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        similarities = (vectors @ query) / np.maximum(norms, 1e-12)
+        scored += zip(similarities.tolist(), texts)
+    scored.sort(key=lambda pair: -pair[0])
+    return [text for similarity, text in scored[:k] if similarity >= min_similarity]
+
+
+# ------------------- Workers -------------------
+_wake = threading.Event()
+
+
+class ExtractionWorkers:
+    # Bounded pool of daemon threads draining the extraction queue off the
+    # request path. The embedder comes from the RAG engine once its retrieval
+    # stage is up, so prescription chunks share the corpus embedding space.
+
+    def __init__(self, embedder: Callable[[], object], workers: int = EXTRACT_WORKERS):
+        self._embedder = embedder
+        self.workers = workers
+        self.processed = 0
+        self.errors = 0
+        self._threads: List[threading.Thread] = []
+
+    # RAG_EXTRACT_WORKERS=0 leaves the queue to another process
+    def start(self):
+        if self.workers <= 0:
+            return
+        # Jobs left running by a process that died are taken over by _claim
+        # once their lease expires; live ones elsewhere are left alone. One
+        # that has already taken down MAX_ATTEMPTS workers is given up on.
+        _connection().execute(
+            "UPDATE extraction_jobs SET status = 'failed', error = 'worker stopped during extraction', updated_at = ? "
+            "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+            (time.time(), time.time() - LEASE_SECONDS, MAX_ATTEMPTS),
+        )
+        enqueue_missing()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"rag-extract-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._renew_leases, name="rag-extract-heartbeat", daemon=True).start()
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                _heartbeat()
+            except Exception as e:
+                log.warning("Renewing extraction leases failed: %s", e)
+
+    def _run(self):
+        while True:
+            job = _claim()
+            if job is None:
+                _wake.wait(POLL_SECONDS)
+                _wake.clear()
+                continue
+            self.process(job)
+
+    def process(self, job: Dict):
+        upload = get_upload(job["upload_id"])
+        if upload is None:
+            _fail(job, "upload no longer exists", retry=False)
+            return
+        try:
+            chunks = split_pages(extract_pages(upload))
+            vectors = self._embedder().encode([text for _, text in chunks]) if chunks else np.zeros((0, 0))
+            store_chunks(upload, chunks, vectors)
+        except ExtractionUnavailable as e:
+            self.errors += 1
+            _fail(job, str(e), retry=False)
+        except Exception as e:
+            self.errors += 1
+            log.warning("Extraction of upload %s failed (attempt %d): %s", job["upload_id"], job["attempts"], e)
+            _fail(job, f"{type(e).__name__}: {e}", retry=True)
+        else:
+            self.processed += 1
+            _finish(job["upload_id"], len(chunks))
+
+    def stats(self) -> Dict:
+        return {"workers": self.workers, "processed": self.processed, "errors": self.errors, "queue": queue_counts()}
+
+
+# Upload list with each file's extraction state, for the portals
+def uploads_with_status(patient_id: str) -> List[Dict]:
+    jobs = job_status(patient_id)
+    return [dict(upload, extraction=jobs.get(upload["id"])) for upload in list_uploads(patient_id)]
@@ -1,7 +1,9 @@
 import os
 import streamlit as st
-from datetime import datetime
 import streamlit as st
+from suggestion_store import suggestions_for
+from prescription_index import enqueue_upload, uploads_with_status
+from upload_store import save_upload
 # Inject background image using inline CSS
 
 
@@ -15,13 +17,21 @@ if os.path.exists("style.css"):
 
 
 
+def describe_extraction(job) -> str:
+    if job is None or job["status"] == "queued" and not job["attempts"]:
+        return "⏳ waiting to be read"
+    if job["status"] == "queued":
+        return f"🔁 retrying (attempt {job['attempts']} failed: {job['error']})"
+    if job["status"] == "running":
+        return "⚙️ reading..."
+    if job["status"] == "done":
+        return f"✅ {job['chunks']} passage(s) available to the chatbot" if job["chunks"] else "✅ no text found"
+    return f"❌ could not be read: {job['error']}"
+
+
 def run_prescription_module(force_patient_id: str = None):
     st.subheader("📄 Upload Prescription & View Suggestions")
 
-    UPLOAD_DIR = "uploads"
-    SUGGESTIONS_FILE = "suggestions.txt"
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-
     # Step 1: Patient ID
     if force_patient_id:
         patient_id = force_patient_id
@@ -39,29 +49,32 @@ def run_prescription_module(force_patient_id: str = None):
 
     if uploaded:
         if st.session_state.last_uploaded != uploaded.name:
-            pid_folder = os.path.join(UPLOAD_DIR, patient_id)
-            os.makedirs(pid_folder, exist_ok=True)
-            filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uploaded.name}"
-            save_path = os.path.join(pid_folder, filename)
-            with open(save_path, "wb") as f:
-                f.write(uploaded.getbuffer())
+            # Streamed into the content-addressed store in chunks
+            record, created = save_upload(patient_id, uploaded, uploaded.name, uploaded.type)
             st.session_state.last_uploaded = uploaded.name
-            st.success(f"✅ Uploaded successfully as `{filename}`")
+            if created:
+                # Text extraction and indexing happen in the background workers
+                enqueue_upload(record)
+                st.success(f"✅ Uploaded successfully as `{record['file_name']}`")
+            else:
+                st.info(f"ℹ️ This file was already uploaded as `{record['file_name']}`")
+
+    # Step 3: Text extraction progress
+    uploads = uploads_with_status(patient_id)
+    if uploads:
+        jobs = [u["extraction"] for u in uploads]
+        finished = sum(1 for job in jobs if job and job["status"] in ("done", "failed"))
+        st.progress(finished / len(uploads), text=f"🔎 Reading prescriptions for the chatbot: {finished}/{len(uploads)}")
+        for upload in uploads:
+            st.caption(f"📄 {upload['file_name']}: {describe_extraction(upload['extraction'])}")
+        if finished < len(uploads):
+            st.button("Refresh status", key=f"extract_refresh_{patient_id}")
 
-    # Step 3: Show existing suggestions
+    # Step 4: Show existing suggestions
     st.markdown("---")
     st.header("🧑‍⚕️ Suggestions from Doctor")
 
-    if os.path.exists(SUGGESTIONS_FILE):
-        with open(SUGGESTIONS_FILE, "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                parts = line.split(",", 3)
-                if len(parts) == 4:
-                    ts, pid, fname, sugg = parts
-                    if pid == patient_id:
-                        st.write(f"**📄 File:** {fname}")
-                        st.write(f"💬 **Suggestion:** {sugg}")
-                        st.caption(f"🕒 Submitted at {ts}")
+    for sugg in suggestions_for(patient_id):
+        st.write(f"**📄 File:** {sugg['file_name']}")
+        st.write(f"💬 **Suggestion:** {sugg['suggestion']}")
+        st.caption(f"🕒 Submitted at {sugg['created_at']}")
@@ -0,0 +1,181 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from chunker import CHAR_END, CHAR_START, MAX_QUESTION_TOKENS, TOKEN_ID, WORD
+
+# ------------------- Configuration -------------------
+MAX_BATCH_SIZE = 16
+MAX_WAIT_MS = 10
+# Longest answer span in tokens (the QA pipeline's default)
+MAX_ANSWER_LEN = 15
+
+
+class PreparedContext(NamedTuple):
+    # A corpus chunk with the token matrix computed at ingest (see chunker.py)
+    text: str
+    tokens: np.ndarray
+
+
+def _context_text(context: Union[str, PreparedContext]) -> str:
+    return context.text if isinstance(context, PreparedContext) else context
+
+
+def _supports_prepared(qa_pipeline) -> bool:
+    tokenizer = getattr(qa_pipeline, "tokenizer", None)
+    return getattr(qa_pipeline, "framework", None) == "pt" and getattr(tokenizer, "is_fast", False)
+
+
+def _to_numpy(tensor) -> np.ndarray:
+    return tensor.detach().cpu().numpy() if hasattr(tensor, "detach") else np.asarray(tensor)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    probs = np.exp(logits - logits.max())
+    return probs / probs.sum()
+
+
+# Best span of one context, scored the way the QA pipeline scores it: softmax
+# over the <s> position and the context positions, <s> (where squad2 models
+# put their no-answer mass) then dropped, best start <= end within
+# MAX_ANSWER_LEN, and the span widened to whole words
+def _decode_span(context: PreparedContext, start_logits: np.ndarray, end_logits: np.ndarray,
+                 null_start: float, null_end: float) -> Dict:
+    start = _softmax(np.concatenate([[null_start], start_logits]))[1:]
+    end = _softmax(np.concatenate([[null_end], end_logits]))[1:]
+    candidates = np.tril(np.triu(np.outer(start, end)), MAX_ANSWER_LEN - 1)
+    s, e = np.unravel_index(np.argmax(candidates), candidates.shape)
+    words = context.tokens[:, WORD]
+    char_start = int(context.tokens[words == words[s], CHAR_START].min())
+    char_end = int(context.tokens[words == words[e], CHAR_END].max())
+    return {"score": float(candidates[s, e]), "start": char_start, "end": char_end, "answer": context.text[char_start:char_end]}
+
+
+# Contexts come pre-tokenized from the chunk store, so only the questions are
+# tokenized here; inputs are assembled from token ids and run as one batch
+def run_prepared_qa_batch(qa_pipeline, questions: List[str], contexts: List[PreparedContext]) -> List[Dict]:
+    import torch
+
+    tokenizer = qa_pipeline.tokenizer
+    question_ids = tokenizer(questions, add_special_tokens=False, truncation=True, max_length=MAX_QUESTION_TOKENS)["input_ids"]
+    sequences, context_starts = [], []
+    for ids, context in zip(question_ids, contexts):
+        context_ids = context.tokens[:, TOKEN_ID].tolist()
+        sequences.append(tokenizer.build_inputs_with_special_tokens(ids, context_ids))
+        # Pair templates end in one separator: <s> q </s></s> c </s>
+        context_starts.append(len(sequences[-1]) - len(context_ids) - 1)
+    inputs = tokenizer.pad({"input_ids": sequences}, return_tensors="pt")
+    with torch.no_grad():
+        outputs = qa_pipeline.model(**inputs)
+    start_logits, end_logits = _to_numpy(outputs.start_logits), _to_numpy(outputs.end_logits)
+    results = []
+    for row, (context, first) in enumerate(zip(contexts, context_starts)):
+        last = first + len(context.tokens)
+        results.append(_decode_span(
+            context, start_logits[row, first:last], end_logits[row, first:last], start_logits[row, 0], end_logits[row, 0]
+        ))
+    return results
+
+
+# Run every (question, context) pair through the QA model as one padded batch.
+# Prepared contexts skip re-tokenization; plain strings (e.g. a patient's own
+# prescription chunks) go through the pipeline.
+def run_qa_batch(qa_pipeline, questions: List[str], contexts: List[Union[str, PreparedContext]]) -> List[Dict]:
+    if not contexts:
+        return []
+    results: List[Optional[Dict]] = [None] * len(contexts)
+    fast = _supports_prepared(qa_pipeline)
+    prepared = [i for i, c in enumerate(contexts) if fast and isinstance(c, PreparedContext) and len(c.tokens)]
+    if prepared:
+        batch = run_prepared_qa_batch(qa_pipeline, [questions[i] for i in prepared], [contexts[i] for i in prepared])
+        for i, result in zip(prepared, batch):
+            results[i] = result
+    plain = [i for i in range(len(contexts)) if results[i] is None]
+    if plain:
+        batch = qa_pipeline(
+            question=[questions[i] for i in plain], context=[_context_text(contexts[i]) for i in plain], batch_size=len(plain)
+        )
+        # The pipeline unwraps single-item batches into a bare dict
+        if isinstance(batch, dict):
+            batch = [batch]
+        for i, result in zip(plain, batch):
+            results[i] = result
+    return results
+
+
+class QABatcher:
+    # Merges QA work from concurrent callers (Streamlit sessions are threads in
+    # one process) into shared forward passes. A batch is flushed when it is
+    # full or MAX_WAIT_MS after its first item arrived, whichever comes first.
+
+    def __init__(self, qa_pipeline, max_batch_size: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_WAIT_MS):
+        self.qa_pipeline = qa_pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="qa-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, question: str, contexts: List[Union[str, PreparedContext]]) -> List[Future]:
+        if self._stopped.is_set():
+            raise RuntimeError("QA batcher is stopped")
+        futures = []
+        for context in contexts:
+            future: Future = Future()
+            self._queue.put((question, context, future))
+            futures.append(future)
+        return futures
+
+    def answer(self, question: str, contexts: List[Union[str, PreparedContext]], timeout: Optional[float] = None) -> List[Dict]:
+        return [future.result(timeout) for future in self.submit(question, contexts)]
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # Drain whatever is already queued, then wait out the window
+                    item = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._stopped.set()
+                    break
+                batch.append(item)
+            self._process(batch)
+
+        # Fail anything still queued so callers do not hang on shutdown
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[2].set_exception(RuntimeError("QA batcher is stopped"))
+
+    def _process(self, batch):
+        questions = [question for question, _, _ in batch]
+        contexts = [context for _, context, _ in batch]
+        try:
+            results = run_qa_batch(self.qa_pipeline, questions, contexts)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
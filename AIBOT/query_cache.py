@@ -0,0 +1,163 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+# ------------------- Configuration -------------------
+MAX_ENTRIES = 1024
+TTL_SECONDS = 6 * 60 * 60
+# Cosine similarity above which a cached answer is reused for a new query
+SIMILARITY_THRESHOLD = 0.95
+# Lookups re-read the corpus version at most this often
+VERSION_CHECK_SECONDS = 5.0
+
+_MISS = object()
+
+
+def normalize_text(text: str) -> str:
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+class QueryCache:
+    # Two tiers in front of answer_with_llm:
+    #   exact    - LRU keyed on the normalized question text
+    #   semantic - reuses an answer whose query embedding is within
+    #              SIMILARITY_THRESHOLD (cosine) of the new query
+    # Both tiers share entries, so size/TTL eviction applies to both. Entries
+    # are tagged with the corpus version and dropped when the index changes;
+    # with a version_source, lookups also notice a re-ingest by another
+    # process (e.g. the rag_index.py CLI) while this one keeps running.
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_seconds: float = TTL_SECONDS,
+                 similarity_threshold: float = SIMILARITY_THRESHOLD,
+                 version_source: Optional[Callable[[], str]] = None,
+                 version_check_seconds: float = VERSION_CHECK_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.version: Optional[str] = None
+        self.version_source = version_source
+        self.version_check_seconds = version_check_seconds
+        self._next_version_check = 0.0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[Optional[str], int, float]]" = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    # ---- lookups ----
+    def get_exact(self, text: str):
+        self._check_version()
+        key = normalize_text(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._evict(key)
+                return _MISS
+            self._entries.move_to_end(key)
+            self._stats["exact_hits"] += 1
+            return entry[0]
+
+    def get_semantic(self, text: str, embedding: np.ndarray):
+        self._check_version()
+        query = self._unit(embedding)
+        with self._lock:
+            if self._vectors is None or not self._valid.any():
+                self._stats["misses"] += 1
+                return _MISS
+            sims = self._vectors @ query
+            sims[~self._valid] = -np.inf
+            slot = int(np.argmax(sims))
+            key = self._slot_keys[slot]
+            entry = self._entries[key]
+            if sims[slot] < self.similarity_threshold or self._expired(entry):
+                if self._expired(entry):
+                    self._evict(key)
+                self._stats["misses"] += 1
+                return _MISS
+            self._entries.move_to_end(key)
+            self._stats["semantic_hits"] += 1
+            answer = entry[0]
+        # Remember this phrasing too so the next identical ask skips the encoder
+        self.put(text, embedding, answer)
+        return answer
+
+    @staticmethod
+    def is_hit(value) -> bool:
+        return value is not _MISS
+
+    # ---- writes ----
+    def put(self, text: str, embedding: np.ndarray, answer: Optional[str]):
+        key = normalize_text(text)
+        vector = self._unit(embedding)
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            while len(self._entries) >= self.max_entries:
+                self._evict(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype="float32")
+            slot = self._free_slots.pop()
+            self._vectors[slot] = vector
+            self._valid[slot] = True
+            self._slot_keys[slot] = key
+            self._entries[key] = (answer, slot, time.monotonic() + self.ttl_seconds)
+
+    def set_version(self, version: str):
+        # Called whenever the RAG index is (re)loaded; answers from an older corpus are dropped
+        with self._lock:
+            if self.version is not None and version != self.version:
+                self._clear()
+                self._stats["invalidations"] += 1
+            self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    # Rate-limited, since version_source reads the index manifest
+    def _check_version(self):
+        if self.version_source is None or time.monotonic() < self._next_version_check:
+            return
+        self._next_version_check = time.monotonic() + self.version_check_seconds
+        version = self.version_source()
+        # "" means no manifest (mid-ingest or removed); keep what is cached
+        if version:
+            self.set_version(version)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    # ---- internals (caller holds the lock) ----
+    def _expired(self, entry) -> bool:
+        return entry[2] < time.monotonic()
+
+    def _evict(self, key: str):
+        _, slot, _ = self._entries.pop(key)
+        self._valid[slot] = False
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+
+    def _clear(self):
+        self._entries.clear()
+        self._valid[:] = False
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,320 @@
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional, Tuple
+
+from metrics import REGISTRY, trace_log
+
+# ------------------- Configuration -------------------
+# Model worker processes; 0 keeps the single in-process engine
+QUERY_WORKERS = int(os.environ.get("RAG_QUERY_WORKERS", "0"))
+# torch/ONNX threads per worker; 0 gives each worker its share of the cores
+WORKER_THREADS = int(os.environ.get("RAG_WORKER_THREADS", "0"))
+# Questions allowed to wait for a free worker before new ones are shed
+ADMISSION_QUEUE = int(os.environ.get("RAG_ADMISSION_QUEUE", "32"))
+# Seconds a question may wait for a worker before it is turned away
+ADMISSION_TIMEOUT = float(os.environ.get("RAG_ADMISSION_TIMEOUT", "20"))
+# Upper bound on a single answer once a worker has it
+REQUEST_TIMEOUT = float(os.environ.get("RAG_REQUEST_TIMEOUT", "120"))
+# A worker that dies or fails to load is restarted after RESTART_BACKOFF
+# seconds, doubling per consecutive failure; after MAX_RESTARTS failures
+# without reaching ready it is given up on
+RESTART_BACKOFF = 1.0
+MAX_RESTARTS = 5
+# How often the collector checks worker processes for exits
+CHECK_SECONDS = 1.0
+
+WAIT_SECONDS = REGISTRY.histogram(
+    "rag_scheduler_wait_seconds", "Time questions spent in the admission queue",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 60.0),
+)
+
+
+class SchedulerBusy(Exception):
+    # Raised instead of queueing when the node is saturated; reason is
+    # "overloaded" (admission queue full), "timeout" (waited too long for a
+    # worker) or "slow answer" (the worker took over REQUEST_TIMEOUT)
+    def __init__(self, reason: str):
+        super().__init__(f"all model workers are busy ({reason}), please retry shortly")
+        self.reason = reason
+
+
+# Splits the cores this process may use into one contiguous group per worker
+def core_groups(workers: int) -> List[List[int]]:
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    if workers > len(cores):
+        return [[] for _ in range(workers)]
+    size = len(cores) // workers
+    return [cores[i * size:(i + 1) * size] for i in range(workers)]
+
+
+# ------------------- Worker process -------------------
+# Every message carries the worker's generation, so anything still in flight
+# from a process that has since been replaced is ignored
+def _worker_main(worker_id: int, generation: int, cores: List[int], threads: int, backend: Optional[str],
+                 tasks: "mp.Queue", results: "mp.Queue", run_extraction: bool):
+    # Pinning and thread counts must be in place before torch/onnxruntime load
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "RAG_INTRA_OP_THREADS"):
+        os.environ[var] = str(threads)
+    # One worker drains the prescription extraction queue; the rest only answer
+    if not run_extraction:
+        os.environ["RAG_EXTRACT_WORKERS"] = "0"
+    try:
+        from rag_engine import RAGEngine
+        engine = RAGEngine(backend)
+    except Exception as e:
+        results.put(("error", worker_id, generation, None, f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", worker_id, generation, None, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, kind, args = task
+        try:
+            value = engine.ask(*args) if kind == "ask" else engine.related_passages(*args)
+            results.put(("result", worker_id, generation, request_id, value))
+        except Exception as e:
+            results.put(("failed", worker_id, generation, request_id, f"{type(e).__name__}: {e}"))
+
+
+# ------------------- Scheduler -------------------
+class QueryScheduler:
+    # Runs questions on a pool of model worker processes, each pinned to its
+    # own cores with a matching torch/ONNX thread count, so concurrent users
+    # stop fighting over one set of models and intra-op threads. Callers wait
+    # in a bounded admission queue for a free worker: past ADMISSION_QUEUE
+    # waiters, or after ADMISSION_TIMEOUT, they get SchedulerBusy right away
+    # instead of slowing everyone down. Same ask() interface as RAGWarmup.
+
+    def __init__(self, workers: int = QUERY_WORKERS or 1, threads: int = WORKER_THREADS,
+                 max_queue: int = ADMISSION_QUEUE, queue_timeout: float = ADMISSION_TIMEOUT,
+                 backend: Optional[str] = None):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backend = backend
+        self._ctx = mp.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._groups = core_groups(workers)
+        self.threads = threads or max(len(self._groups[0]), 1)
+        # (worker id, generation) of each idle worker; a question takes one and
+        # hands it back with its answer. Entries of replaced workers are skipped.
+        self._idle: "queue.Queue[Tuple[int, int]]" = queue.Queue()
+        self._generation = {i: 0 for i in range(workers)}
+        self._tasks: Dict[int, "mp.Queue"] = {}
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._running: Dict[int, int] = {}   # worker id -> request id
+        self._ids = itertools.count()
+        # loading -> ready; restarting while a replacement waits out its
+        # backoff; error once MAX_RESTARTS replacements in a row have failed
+        self.worker_states = {i: "loading" for i in range(workers)}
+        self.worker_errors: Dict[int, str] = {}
+        self._failures = {i: 0 for i in range(workers)}
+        self._respawn_at: Dict[int, float] = {}
+        self.restarts = 0
+        self.waiting = 0
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = {"overloaded": 0, "timeout": 0}
+        self._processes: Dict[int, Optional[mp.Process]] = {i: self._spawn(i) for i in range(workers)}
+        threading.Thread(target=self._collect, name="rag-scheduler", daemon=True).start()
+        REGISTRY.add_collector("query_scheduler", self.collect_metrics)
+        atexit.register(self.close)
+
+    def _spawn(self, worker_id: int) -> mp.Process:
+        # Each worker has its own task queue, so the scheduler always knows
+        # which question a worker holds
+        self._tasks[worker_id] = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main, name=f"rag-worker-{worker_id}", daemon=True,
+            args=(worker_id, self._generation[worker_id], self._groups[worker_id], self.threads, self.backend,
+                  self._tasks[worker_id], self._results, worker_id == 0),
+        )
+        process.start()
+        return process
+
+    # ---- state (mirrors RAGWarmup) ----
+    @property
+    def state(self) -> str:
+        states = set(self.worker_states.values())
+        if "ready" in states:
+            return "ready"
+        return "error" if states == {"error"} else "loading"
+
+    @property
+    def load_error(self) -> Optional[str]:
+        return next(iter(self.worker_errors.values()), None)
+
+    def stages(self) -> Dict[str, str]:
+        return {f"worker {i}": state for i, state in self.worker_states.items()}
+
+    # ---- requests ----
+    def _submit(self, kind: str, args: Tuple) -> Future:
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected["overloaded"] += 1
+                raise SchedulerBusy("overloaded")
+            self.waiting += 1
+        start = time.perf_counter()
+        worker_id = None
+        try:
+            while worker_id is None:
+                remaining = self.queue_timeout - (time.perf_counter() - start)
+                try:
+                    candidate, generation = self._idle.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    break
+                if generation == self._generation[candidate] and self.worker_states[candidate] == "ready":
+                    worker_id = candidate
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        WAIT_SECONDS.observe(time.perf_counter() - start)
+        if worker_id is None:
+            with self._lock:
+                self.rejected["timeout"] += 1
+            raise SchedulerBusy("timeout")
+
+        future: Future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            self._pending[request_id] = future
+            self._running[worker_id] = request_id
+            self.in_flight += 1
+        self._tasks[worker_id].put((request_id, kind, args))
+        return future
+
+    def ask(self, user_input: str, patient_id: Optional[str] = None) -> Optional[str]:
+        return self._result(self._submit("ask", (user_input, patient_id)))
+
+    def related_passages(self, user_input: str) -> List[str]:
+        return self._result(self._submit("passages", (user_input,)))
+
+    # The worker keeps going and is released when it settles; the caller just
+    # stops waiting and gets the same "busy" answer as a shed question
+    @staticmethod
+    def _result(future: Future):
+        try:
+            return future.result(REQUEST_TIMEOUT)
+        except FutureTimeout:
+            raise SchedulerBusy("slow answer") from None
+
+    # ---- result routing ----
+    def _release(self, worker_id: int):
+        self._idle.put((worker_id, self._generation[worker_id]))
+
+    def _settle(self, worker_id: int, request_id: int, value=None, error: Optional[str] = None):
+        with self._lock:
+            self._running.pop(worker_id, None)
+            future = self._pending.pop(request_id, None)
+            if future is None:
+                return
+            self.in_flight -= 1
+            self.served += error is None
+        self._release(worker_id)
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(RuntimeError(error))
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                event, worker_id, generation, request_id, value = self._results.get(timeout=CHECK_SECONDS)
+            except queue.Empty:
+                event = None
+            except (EOFError, OSError):
+                return
+            if event is None or generation != self._generation[worker_id]:
+                pass
+            elif event == "ready":
+                self.worker_states[worker_id] = "ready"
+                self._failures[worker_id] = 0
+                self.worker_errors.pop(worker_id, None)
+                self._release(worker_id)
+            elif event == "error":
+                # The process exits next; _check_workers schedules its replacement
+                self.worker_errors[worker_id] = value
+            else:
+                self._settle(worker_id, request_id, value if event == "result" else None, value if event == "failed" else None)
+            # Checked on a timer, not only when idle, so a busy pool still notices exits
+            if time.monotonic() - last_check >= CHECK_SECONDS:
+                self._check_workers()
+                last_check = time.monotonic()
+
+    # A worker that exits in any state (mid-question, while loading, or after
+    # its load raised) fails its question and is replaced after a backoff; it
+    # takes questions again once the replacement reports ready
+    def _check_workers(self):
+        now = time.monotonic()
+        for worker_id, process in list(self._processes.items()):
+            if process is None:
+                if worker_id in self._respawn_at and now >= self._respawn_at[worker_id]:
+                    del self._respawn_at[worker_id]
+                    self.worker_states[worker_id] = "loading"
+                    self.restarts += 1
+                    self._processes[worker_id] = self._spawn(worker_id)
+                continue
+            if process.is_alive():
+                continue
+            self._generation[worker_id] += 1
+            self._processes[worker_id] = None
+            with self._lock:
+                request_id = self._running.pop(worker_id, None)
+                future = self._pending.pop(request_id, None) if request_id is not None else None
+                self.in_flight -= future is not None
+            if future is not None:
+                future.set_exception(RuntimeError(f"model worker {worker_id} exited (code {process.exitcode})"))
+            self.worker_errors.setdefault(worker_id, f"model worker {worker_id} exited (code {process.exitcode})")
+            self._failures[worker_id] += 1
+            if self._failures[worker_id] > MAX_RESTARTS:
+                self.worker_states[worker_id] = "error"
+                trace_log.error("Model worker %d failed %d times in a row; not restarting it: %s",
+                                worker_id, self._failures[worker_id], self.worker_errors[worker_id])
+                continue
+            self.worker_states[worker_id] = "restarting"
+            self._respawn_at[worker_id] = now + RESTART_BACKOFF * 2 ** (self._failures[worker_id] - 1)
+
+    def close(self):
+        for tasks in self._tasks.values():
+            tasks.put(None)
+        for process in self._processes.values():
+            if process is not None:
+                process.join(timeout=5)
+
+    # ---- reporting ----
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "workers": dict(self.worker_states),
+                "threads_per_worker": self.threads,
+                "queue_depth": self.waiting,
+                "in_flight": self.in_flight,
+                "served": self.served,
+                "rejected": dict(self.rejected),
+                "restarts": self.restarts,
+            }
+
+    def collect_metrics(self) -> List[Tuple[str, str, Dict[str, str], float]]:
+        samples = [
+            ("rag_scheduler_queue_depth", "Questions waiting for a model worker", {}, self.waiting),
+            ("rag_scheduler_in_flight", "Questions being answered by a worker", {}, self.in_flight),
+            ("rag_scheduler_workers_ready", "Model workers able to take questions", {},
+             sum(state == "ready" for state in self.worker_states.values())),
+            ("rag_scheduler_served", "Questions answered by the worker pool", {}, self.served),
+            ("rag_scheduler_restarts", "Model worker processes restarted after exiting", {}, self.restarts),
+        ]
+        for reason, count in self.rejected.items():
+            samples.append(("rag_scheduler_rejected", "Questions shed at admission", {"reason": reason}, count))
+        return samples
@@ -0,0 +1,49 @@
+import json
+import os
+import urllib.error
+import urllib.request
+from typing import Dict, Optional
+
+# Set to e.g. http://127.0.0.1:8765 to use rag_service.py instead of loading models in-process
+SERVICE_URL = os.environ.get("RAG_SERVICE_URL", "")
+REQUEST_TIMEOUT = float(os.environ.get("RAG_CLIENT_TIMEOUT", "60"))
+
+
+class RAGServiceError(Exception):
+    pass
+
+
+class RAGClient:
+    # Same ask() interface as rag_engine.RAGEngine, backed by rag_service.py
+    # The service reports its own loading through 503s on /ask
+    state = "ready"
+
+    def __init__(self, url: str = SERVICE_URL, timeout: float = REQUEST_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path: str, payload: Optional[Dict] = None) -> Dict:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(
+            self.url + path,
+            data=data,
+            headers={"Content-Type": "application/json"},
+            method="POST" if data is not None else "GET",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise RAGServiceError(f"{e.code}: {message}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise RAGServiceError(f"RAG service unreachable at {self.url}: {e}") from e
+
+    def ask(self, user_input: str, patient_id: Optional[str] = None) -> Optional[str]:
+        return self._request("/ask", {"question": user_input, "patient_id": patient_id}).get("answer")
+
+    def health(self) -> Dict:
+        return self._request("/health")
@@ -0,0 +1,275 @@
+import os
+import logging
+import threading
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rag_index import corpus_version, load_or_ingest_index
+from inference_backend import load_embedder, load_qa_pipeline, load_reranker
+from metrics import REGISTRY, span, stage_means_ms, start_trace, timed_load, trace, trace_log
+from prescription_index import (PATIENT_TOP_K, ExtractionWorkers, owned_upload_keys, patient_chunk_count,
+                                search_patient)
+from qa_batcher import PreparedContext, QABatcher
+from query_cache import QueryCache
+from reranker import Reranker
+from sparse_index import load_or_build_sparse_index, rrf_fuse
+
+# Wide, cheap candidate set from hybrid retrieval
+RETRIEVE_K = 50
+# Number of reranked chunks sent to the QA model per query
+QA_TOP_K = 2
+# cross-encoder | off (QA gets the top fused chunks directly)
+RERANK = os.environ.get("RAG_RERANK", "cross-encoder")
+# Answers below this QA confidence are dropped
+MIN_ANSWER_SCORE = 0.1
+# Candidates pulled from each of FAISS and BM25 before reciprocal-rank fusion
+FUSION_CANDIDATES = 20
+LOAD_STAGES = ("embedder", "dense_index", "sparse_index", "reranker", "qa")
+
+
+# Normalize vague or user-friendly questions to structured ones
+def normalize_question(user_input: str) -> str:
+    if "i have" in user_input.lower():
+        # Try to normalize advice-seeking to condition-query
+        symptom = user_input.lower().replace("what can i do if i have ", "").replace("?", "").strip()
+        return f"What are the possible conditions related to {symptom}?"
+    return user_input
+
+
+class RAGEngine:
+    # The retrieval + QA core shared by the Streamlit app (in-process) and
+    # rag_service.py (one copy of the models serving many UI workers).
+
+    def __init__(self, backend: Optional[str] = None, query_cache: Optional[QueryCache] = None, background: bool = False):
+        self.backend = backend
+        self.query_cache = query_cache or QueryCache(version_source=corpus_version)
+        self.embedder = None
+        self.chunks: Dict[int, str] = {}
+        self.corpus_version: Optional[str] = None
+        self.sparse_index = None
+        self.reranker: Optional[Reranker] = None
+        self.qa_batcher: Optional[QABatcher] = None
+        # Turns uploaded prescriptions into per-patient chunks with this engine's embedder
+        self.extraction = ExtractionWorkers(lambda: self.embedder)
+        # Retrieval (embedder + indexes) and the reader (reranker + QA) load
+        # independently, so retrieval-only features work before QA is up
+        self.stages = {stage: "pending" for stage in LOAD_STAGES}
+        self.load_error: Optional[str] = None
+        self.retrieval_ready = threading.Event()
+        self.reader_ready = threading.Event()
+        REGISTRY.add_collector("rag_engine", self.collect_metrics)
+
+        if background:
+            for target in (self.load_retrieval, self.load_reader):
+                threading.Thread(target=self._load_in_background, args=(target,), name=f"rag-{target.__name__}", daemon=True).start()
+        else:
+            self.load_retrieval()
+            self.load_reader()
+
+    def _stage(self, stage: str):
+        self.stages[stage] = "loading"
+        return timed_load(stage)
+
+    def _load_in_background(self, target):
+        try:
+            target()
+        except Exception as e:
+            self.load_error = f"{type(e).__name__}: {e}"
+            for stage, state in self.stages.items():
+                if state == "loading":
+                    self.stages[stage] = "error"
+            trace_log.error("RAG load failed: %s", self.load_error)
+
+    def load_retrieval(self):
+        # Prebuilt index from faiss_index/; only the changed PDFs in data/ get re-embedded
+        # torch, onnx or onnx-int8 depending on RAG_BACKEND; same interface either way
+        with self._stage("embedder"):
+            self.embedder = load_embedder(self.backend)
+        self.stages["embedder"] = "ready"
+        with self._stage("dense_index"):
+            self.chunks, self.index = load_or_ingest_index(self.embedder, backend=self.backend)
+        self.stages["dense_index"] = "ready"
+        version = corpus_version()
+        # BM25 over the same chunks catches exact disease and drug names the embedder blurs
+        with self._stage("sparse_index"):
+            self.sparse_index = load_or_build_sparse_index(self.chunks, version)
+        self.stages["sparse_index"] = "ready"
+        self.corpus_version = version
+        self.query_cache.set_version(version)
+        if self.reranker:
+            self.reranker.set_version(version)
+
+        trace_log.info("Total chunks loaded: %d", len(self.chunks))
+        if trace_log.isEnabledFor(logging.DEBUG):
+            for i, chunk in islice(self.chunks.items(), 5):
+                trace_log.debug("Chunk %s → %s", i, chunk[:300])
+            # Check if 'fever' appears
+            fever_chunks = [c for c in self.chunks.values() if "fever" in c.lower()]
+            trace_log.debug("Fever found in chunks: %d", len(fever_chunks))
+        self.retrieval_ready.set()
+        self.extraction.start()
+
+    def load_reader(self):
+        with self._stage("reranker"):
+            self.reranker = Reranker(load_reranker(self.backend)) if RERANK == "cross-encoder" else None
+            if self.reranker:
+                # The retrieval stage may have loaded the corpus first
+                self.reranker.set_version(self.corpus_version or corpus_version())
+        self.stages["reranker"] = "ready"
+        # Shared across callers so concurrent users' QA work lands in the same forward pass
+        with self._stage("qa"):
+            self.qa_batcher = QABatcher(load_qa_pipeline(self.backend))
+        self.stages["qa"] = "ready"
+        self.reader_ready.set()
+
+    # "loading" -> "retrieval" (search works, QA still loading) -> "ready"; "error" if a stage failed
+    @property
+    def state(self) -> str:
+        if self.load_error:
+            return "error"
+        if self.reader_ready.is_set() and self.retrieval_ready.is_set():
+            return "ready"
+        return "retrieval" if self.retrieval_ready.is_set() else "loading"
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self.retrieval_ready.wait(timeout) and self.reader_ready.wait(timeout)
+
+    def embed(self, question: str) -> np.ndarray:
+        with span("embed"):
+            return self.embedder.encode([question])
+
+    def dense_search(self, question: str, k: int, query_embedding: Optional[np.ndarray] = None) -> List[int]:
+        if query_embedding is None:
+            query_embedding = self.embed(question)
+        with span("dense_search"):
+            D, I = self.index.search(np.asarray(query_embedding, dtype="float32"), k=k)
+        return [int(i) for i in I[0] if i in self.chunks]
+
+    def sparse_search(self, question: str, k: int) -> List[int]:
+        with span("sparse_search"):
+            return [chunk_id for chunk_id, _ in self.sparse_index.search(question, k)]
+
+    # Dense and BM25 rankings fused by reciprocal rank
+    def retrieve_ids(self, question: str, k: int = RETRIEVE_K, query_embedding: Optional[np.ndarray] = None) -> List[int]:
+        candidates = max(k, FUSION_CANDIDATES)
+        return rrf_fuse([
+            self.dense_search(question, candidates, query_embedding),
+            self.sparse_search(question, candidates),
+        ], k)
+
+    def retrieve(self, question: str, k: int = QA_TOP_K, query_embedding: Optional[np.ndarray] = None) -> List[str]:
+        return [self.chunks[i] for i in self.retrieve_ids(question, k, query_embedding)]
+
+    # Retrieve RETRIEVE_K candidates, then keep the k the cross-encoder ranks highest
+    def select_contexts(self, question: str, k: int = QA_TOP_K, query_embedding: Optional[np.ndarray] = None) -> List[Tuple[int, str]]:
+        ids = self.retrieve_ids(question, RETRIEVE_K if self.reranker else k, query_embedding)
+        if self.reranker:
+            with span("rerank"):
+                ids = [i for i, _ in self.reranker.rerank(question, [(i, self.chunks[i]) for i in ids], k)]
+        return [(i, self.chunks[i]) for i in ids[:k]]
+
+    # QA function using Hugging Face + RAG; patient_contexts (chunks of the
+    # patient's own prescriptions) join the corpus contexts
+    def answer_with_llm(self, symptom: str, k: int = QA_TOP_K, query_embedding: Optional[np.ndarray] = None,
+                        patient_contexts: Optional[List[str]] = None) -> Optional[str]:
+        # Corpus chunks carry their ingest-time tokenization, so QA does not re-tokenize them
+        top_chunks = [PreparedContext(text, self.chunks.tokens(i)) for i, text in self.select_contexts(symptom, k, query_embedding)]
+        top_chunks = list(patient_contexts or []) + top_chunks
+        for chunk in top_chunks:
+            trace(logging.DEBUG, "context: %s", getattr(chunk, "text", chunk)[:300])
+
+        answers = []
+        # All top-k contexts go through the model as one padded batch
+        with span("qa"):
+            results = self.qa_batcher.answer(symptom, top_chunks)
+        for result in results:
+            # Raw answers are traced even when they fall below the threshold
+            trace(logging.DEBUG, "qa raw output: %s", result)
+            if result["score"] > MIN_ANSWER_SCORE:  # 🔽 Lowered threshold to allow more answers
+                answers.append((result["answer"], result["score"]))
+
+        if answers:
+            best = max(answers, key=lambda x: x[1])
+            return best[0]
+        return None
+
+    # Exact-text tier, then the embedding-similarity tier, then the full RAG path
+    def cached_answer(self, question: str, query_embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        with span("cache_lookup"):
+            cached = self.query_cache.get_exact(question)
+        if self.query_cache.is_hit(cached):
+            return cached
+
+        if query_embedding is None:
+            query_embedding = self.embed(question)
+        with span("cache_lookup"):
+            cached = self.query_cache.get_semantic(question, query_embedding[0])
+        if self.query_cache.is_hit(cached):
+            return cached
+
+        answer = self.answer_with_llm(question, query_embedding=query_embedding)
+        self.query_cache.put(question, query_embedding[0], answer)
+        return answer
+
+    # Retrieval-only answer for while the QA model is still loading
+    def related_passages(self, user_input: str, k: int = QA_TOP_K) -> List[str]:
+        self.retrieval_ready.wait()
+        return self.retrieve(normalize_question(user_input), k)
+
+    # Full path for raw user input: normalize, then answer (cached). Answers
+    # drawing on a patient's prescriptions are personal and skip the cache;
+    # prescriptions unrelated to the question are not used.
+    def ask(self, user_input: str, patient_id: Optional[str] = None) -> Optional[str]:
+        # Only blocks when the engine was started with background=True
+        self.wait_ready()
+        start_trace()
+        with span("ask"):
+            with span("normalize"):
+                question = normalize_question(user_input)
+            # patient_id is the login; its prescriptions are filed under the
+            # appointments it booked, never under a bare ID it happens to share
+            upload_keys = owned_upload_keys(patient_id) if patient_id else []
+            if not (upload_keys and patient_chunk_count(upload_keys)):
+                return self.cached_answer(question)
+            query_embedding = self.embed(question)
+            with span("patient_search"):
+                own = search_patient(upload_keys, query_embedding[0], PATIENT_TOP_K)
+            if own:
+                return self.answer_with_llm(question, query_embedding=query_embedding, patient_contexts=own)
+            return self.cached_answer(question, query_embedding)
+
+    def stats(self) -> Dict:
+        embed_cache = getattr(self.embedder, "cache", None)
+        return {
+            "state": self.state,
+            "stages": dict(self.stages),
+            "chunks": len(self.chunks),
+            "sparse_terms": len(self.sparse_index.vocab) if self.sparse_index else 0,
+            "cache": self.query_cache.stats(),
+            "rerank": self.reranker.stats() if self.reranker else None,
+            "embedding_cache": embed_cache.stats() if embed_cache else None,
+            "extraction": self.extraction.stats(),
+            "stage_mean_ms": stage_means_ms(),
+        }
+
+    # Cache sizes and hit ratios as gauges for /metrics
+    def collect_metrics(self) -> List[Tuple[str, str, Dict[str, str], float]]:
+        cache = self.query_cache.stats()
+        samples = [
+            ("rag_query_cache_hit_ratio", "Share of questions answered from the query cache", {}, cache["hit_ratio"]),
+            ("rag_query_cache_entries", "Answers held in the query cache", {}, cache["entries"]),
+            ("rag_chunks", "Chunks in the loaded corpus", {}, len(self.chunks)),
+        ]
+        for stage, state in self.stages.items():
+            samples.append(("rag_stage_ready", "1 once a load stage has finished", {"stage": stage}, state == "ready"))
+        for tier in ("exact_hits", "semantic_hits", "misses", "evictions"):
+            samples.append(("rag_query_cache_lookups", "Query cache lookups by outcome", {"outcome": tier}, cache[tier]))
+        if self.reranker:
+            rerank = self.reranker.stats()
+            samples.append(("rag_rerank_cache_hit_ratio", "Share of (question, chunk) scores served from cache", {}, rerank["hit_ratio"]))
+            samples.append(("rag_rerank_cache_entries", "(question, chunk) scores held in the rerank cache", {}, rerank["entries"]))
+        for status, count in self.extraction.stats()["queue"].items():
+            samples.append(("rag_extraction_jobs", "Prescription extraction jobs by status", {"status": status}, count))
+        return samples
@@ -0,0 +1,649 @@
+import os
+import json
+import hashlib
+import logging
+import argparse
+import multiprocessing as mp
+import queue
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from chunk_store import ChunkStore, ChunkStoreWriter, remove_stale_generations
+from chunker import Chunk, chunker_config, get_chunker
+
+# ------------------- Configuration -------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+INDEX_DIR = os.path.join(BASE_DIR, "faiss_index")
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+# Chunk sizing lives in chunker.py (QA-tokenizer tokens, whole symptom records)
+MANIFEST_VERSION = 4
+
+# Index layout; set through the environment so the ingest CLI and the app agree.
+# nlist=0 picks 4*sqrt(n) lists at training time.
+INDEX_CONFIG = {
+    "type": os.environ.get("RAG_INDEX_TYPE", "flat"),
+    "nlist": int(os.environ.get("RAG_NLIST", "0")),
+    "pq_m": int(os.environ.get("RAG_PQ_M", "16")),
+    "pq_nbits": int(os.environ.get("RAG_PQ_NBITS", "8")),
+    "hnsw_m": int(os.environ.get("RAG_HNSW_M", "32")),
+}
+# Query-time knobs; these do not require a rebuild
+SEARCH_PARAMS = {
+    "nprobe": int(os.environ.get("RAG_NPROBE", "8")),
+    "efSearch": int(os.environ.get("RAG_EF_SEARCH", "64")),
+}
+# flat_fp16 / flat_int8 store vectors as float16 / int8 and dequantize while scanning
+INDEX_TYPES = ("flat", "flat_fp16", "flat_int8", "ivf_flat", "ivf_pq", "hnsw")
+SCALAR_SPECS = {"flat_fp16": "SQfp16", "flat_int8": "SQ8"}
+TRAIN_SAMPLE = 50000
+
+# Streaming ingestion: chunks embedded per batch, PDFs parsed in parallel,
+# and a resumable checkpoint written every CHECKPOINT_CHUNKS new chunks
+EMBED_BATCH = int(os.environ.get("RAG_EMBED_BATCH", "256"))
+INGEST_WORKERS = int(os.environ.get("RAG_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+CHECKPOINT_CHUNKS = int(os.environ.get("RAG_CHECKPOINT_CHUNKS", "10000"))
+# Parser processes stream chunks back PAGE_BATCH pages at a time and may run at
+# most PARSE_AHEAD batches ahead of the embedder, so parsed-but-unembedded text
+# is bounded by workers * (PARSE_AHEAD + 1) page batches, not by PDF size
+PAGE_BATCH = int(os.environ.get("RAG_PAGE_BATCH", "16"))
+PARSE_AHEAD = 2
+
+log = logging.getLogger("rag.index")
+
+
+# ------------------- Hashing -------------------
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def list_sources(data_dir: str = DATA_DIR) -> List[str]:
+    if not os.path.isdir(data_dir):
+        return []
+    return sorted(
+        os.path.join(data_dir, name)
+        for name in os.listdir(data_dir)
+        if name.lower().endswith(".pdf")
+    )
+
+
+def source_key(path: str) -> str:
+    return os.path.relpath(path, BASE_DIR).replace(os.sep, "/")
+
+
+# ------------------- Index factory -------------------
+def factory_string(config: Dict, n_train: int) -> str:
+    kind = config["type"]
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}; expected one of {INDEX_TYPES}")
+    if kind == "hnsw":
+        return f"HNSW{config['hnsw_m']}"
+    if kind == "flat":
+        return "Flat"
+    if kind in SCALAR_SPECS:
+        return SCALAR_SPECS[kind]
+
+    nlist = ivf_nlist(config, n_train)
+    if nlist < 1:
+        log.warning("Only %d training vectors; falling back to a Flat index for %s", n_train, kind)
+        return "Flat"
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    return f"IVF{nlist},PQ{config['pq_m']}x{config['pq_nbits']}"
+
+
+def ivf_nlist(config: Dict, n_train: int) -> int:
+    nlist = config["nlist"] or int(4 * np.sqrt(n_train))
+    # k-means wants ~39 points per centroid; shrink nlist for small corpora
+    nlist = min(nlist, n_train // 39)
+    if config["type"] == "ivf_pq" and n_train < 2 ** config["pq_nbits"]:
+        nlist = 0
+    return nlist
+
+
+# An IVF index first built on too few vectors is a Flat fallback; once the
+# corpus can train the configured index it is rebuilt as that type
+def fallback_outgrown(manifest: Dict, n_vectors: int, config: Dict = INDEX_CONFIG) -> bool:
+    return (manifest.get("index_spec") == "Flat" and config["type"] in ("ivf_flat", "ivf_pq")
+            and ivf_nlist(config, n_vectors) >= 1)
+
+
+def train_sample(vectors: np.ndarray, size: int = TRAIN_SAMPLE) -> np.ndarray:
+    if len(vectors) <= size:
+        return vectors
+    rng = np.random.default_rng(0)
+    return vectors[rng.choice(len(vectors), size, replace=False)]
+
+
+def make_index(dim: int, train_vectors: np.ndarray, config: Dict = INDEX_CONFIG) -> Tuple[faiss.Index, str]:
+    spec = factory_string(config, len(train_vectors))
+    index = faiss.index_factory(dim, spec)
+    if not index.is_trained:
+        index.train(train_sample(train_vectors))
+    # IVF indexes store ids in their inverted lists and remove them in place;
+    # an IndexIDMap around one falls out of step with the lists on removal
+    if isinstance(index, faiss.IndexIVF):
+        return index, spec
+    return faiss.IndexIDMap(index), spec
+
+
+def apply_search_params(index: faiss.Index, params: Dict = SEARCH_PARAMS):
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = params["nprobe"]
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = params["efSearch"]
+
+
+# Ids and (reconstructed) vectors of every entry, for either index layout
+def stored_vectors(index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    if isinstance(index, faiss.IndexIDMap):
+        inner = faiss.downcast_index(index.index)
+        return faiss.vector_to_array(index.id_map), inner.reconstruct_n(0, inner.ntotal)
+    invlists = index.invlists
+    ids = [faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+           for l in range(index.nlist) if invlists.list_size(l)]
+    ids = np.concatenate(ids) if ids else np.empty(0, dtype="int64")
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    try:
+        vectors = index.reconstruct_batch(ids)
+    finally:
+        index.set_direct_map_type(faiss.DirectMap.NoMap)
+    return ids, vectors
+
+
+# Retrains the configured index type on the vectors stored in a Flat index
+def rebuild_index(index: faiss.Index, config: Dict = INDEX_CONFIG) -> Tuple[faiss.Index, str]:
+    ids, vectors = stored_vectors(index)
+    rebuilt, spec = make_index(index.d, vectors, config)
+    rebuilt.add_with_ids(vectors, ids)
+    return rebuilt, spec
+
+
+def remove_from_index(index: faiss.Index, ids: List[int], spec: str) -> faiss.Index:
+    ids = np.array(ids, dtype="int64")
+    try:
+        index.remove_ids(ids)
+        return index
+    except RuntimeError:
+        pass
+    # HNSW graphs cannot delete in place; rebuild from the stored vectors
+    all_ids, vectors = stored_vectors(index)
+    keep = ~np.isin(all_ids, ids)
+    rebuilt = faiss.IndexIDMap(faiss.index_factory(index.d, spec))
+    rebuilt.add_with_ids(vectors[keep], all_ids[keep])
+    return rebuilt
+
+
+# ------------------- Manifest -------------------
+# Model and backend the index vectors came from; onnx-int8 vectors differ
+# enough from torch ones that an index is never shared between them
+def index_embedder(backend: Optional[str] = None) -> str:
+    from inference_backend import BACKEND, embedder_key
+
+    return embedder_key(backend or BACKEND)
+
+
+def empty_manifest(backend: Optional[str] = None) -> Dict:
+    return {
+        "version": MANIFEST_VERSION,
+        "embedder": index_embedder(backend),
+        "chunker": chunker_config(),
+        "index": dict(INDEX_CONFIG),
+        "index_spec": None,
+        "chunk_store": None,
+        "next_id": 0,
+        "dim": None,
+        "sources": {},
+    }
+
+
+def config_matches(manifest: Dict, backend: Optional[str] = None) -> bool:
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("embedder") != index_embedder(backend):
+        return False
+    if manifest.get("index") != INDEX_CONFIG:
+        return False
+    return manifest.get("chunker") == chunker_config()
+
+
+def source_unchanged(path: str, entry: Optional[Dict]) -> bool:
+    if entry is None or not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    # Cheap stat check first; only re-hash when size/mtime moved
+    if stat.st_size == entry.get("size") and stat.st_mtime == entry.get("mtime"):
+        return True
+    return stat.st_size == entry.get("size") and file_sha256(path) == entry.get("sha256")
+
+
+def sources_match(manifest: Dict, sources: List[str]) -> bool:
+    recorded = manifest.get("sources", {})
+    # An interrupted ingest left work to finish
+    if manifest.get("pending_removal"):
+        return False
+    if set(recorded) != {source_key(p) for p in sources}:
+        return False
+    return all(source_unchanged(p, recorded[source_key(p)]) for p in sources)
+
+
+# ------------------- Persistence -------------------
+def load_state(index_dir: str = INDEX_DIR, mmap: bool = True,
+               backend: Optional[str] = None) -> Optional[Tuple[Dict, ChunkStore, faiss.Index]]:
+    manifest_path = os.path.join(index_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if not config_matches(manifest, backend):
+            return None
+        index_path = os.path.join(index_dir, manifest.get("index_file", "index.faiss"))
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP if mmap else 0)
+        except RuntimeError:
+            # Not every index type can be memory-mapped
+            index = faiss.read_index(index_path)
+        chunks = ChunkStore(index_dir, manifest["chunk_store"])
+    except (OSError, ValueError, RuntimeError, KeyError, TypeError):
+        return None
+
+    # Older builds wrapped IVF indexes in IndexIDMap, whose ids go wrong after
+    # a removal; rebuild those rather than trust them
+    if isinstance(index, faiss.IndexIDMap) and faiss.try_extract_index_ivf(index) is not None:
+        return None
+    if index.ntotal != len(chunks):
+        return None
+    return manifest, chunks, index
+
+
+def save_state(manifest: Dict, chunks: ChunkStoreWriter, index: faiss.Index, index_dir: str = INDEX_DIR):
+    os.makedirs(index_dir, exist_ok=True)
+    # The chunk index and vector index go to new files; replacing the manifest
+    # that names them is the only commit point, so a crash at any step leaves
+    # the previous manifest with every file it refers to intact
+    manifest["chunk_store"] = chunks.commit()
+    store = manifest["chunk_store"]
+    manifest["index_file"] = f"index-{store['generation']}-{store['revision']}.faiss"
+    faiss.write_index(index, os.path.join(index_dir, manifest["index_file"]))
+    with open(os.path.join(index_dir, "manifest.json.tmp"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(index_dir, "manifest.json.tmp"), os.path.join(index_dir, "manifest.json"))
+    remove_stale_generations(index_dir, keep=store)
+    for name in os.listdir(index_dir):
+        # Older vector indexes, and the pre-chunk-store layout
+        if (name.endswith(".faiss") and name != manifest["index_file"]) or name == "chunks.json":
+            try:
+                os.remove(os.path.join(index_dir, name))
+            except OSError:
+                pass
+
+
+# ------------------- Ingestion -------------------
+# Serializes ingests of one index directory across processes (app, service,
+# model workers, CLI), so two of them never write the same files at once
+@contextmanager
+def ingest_lock(index_dir: str = INDEX_DIR):
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, ".ingest.lock"), "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10s; keep waiting for the other ingest
+                    time.sleep(1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Yields the token-sized chunks (with their tokenization and entity tags) of
+# each page in turn
+def iter_page_chunks(path: str) -> Iterator[List[Chunk]]:
+    # Heavy langchain imports stay off the fast load path
+    from langchain_community.document_loaders import PyPDFLoader
+
+    chunker = get_chunker()
+    # One page in memory at a time; records never span pages in our PDFs
+    for page in PyPDFLoader(path).lazy_load():
+        yield chunker.split_page(page.page_content, int(page.metadata.get("page", -1)))
+
+
+def iter_source_chunks(path: str) -> Iterator[Chunk]:
+    for page_chunks in iter_page_chunks(path):
+        yield from page_chunks
+
+
+# Each in-flight source owns one bounded queue ("slot") that its parser
+# process writes page batches into; the queues reach the pool's processes
+# through the initializer because multiprocessing queues cannot be submitted
+_parse_slots: List = []
+
+
+def _init_parser(slots: List):
+    global _parse_slots
+    _parse_slots = slots
+    # Unread batches of an abandoned ingest must not stop the process exiting
+    for slot in slots:
+        slot.cancel_join_thread()
+
+
+# Runs in a parser process: page batches, then None, or the error that stopped it
+def _parse_into_slot(path: str, slot: int, page_batch: int):
+    out = _parse_slots[slot]
+    try:
+        batch: List[Chunk] = []
+        for pages, page_chunks in enumerate(iter_page_chunks(path), 1):
+            batch.extend(page_chunks)
+            if pages % page_batch == 0:
+                out.put(batch)
+                batch = []
+        out.put(batch)
+        out.put(None)
+    except Exception as e:
+        out.put(RuntimeError(f"parsing {path} failed: {type(e).__name__}: {e}"))
+
+
+def _read_slot(slot: "mp.Queue", future: Future) -> Iterator[Chunk]:
+    while True:
+        try:
+            item = slot.get(timeout=1.0)
+        except queue.Empty:
+            # A parser killed outright (OOM, segfault) breaks the pool instead of reporting
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+            continue
+        if item is None:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield from item
+
+
+# Empties a slot whose source will not be read, so its parser can finish
+def _discard_slot(slot: "mp.Queue", future: Future):
+    while not future.done():
+        try:
+            slot.get(timeout=0.1)
+        except queue.Empty:
+            pass
+
+
+# Yields (path, chunks) in order. With several workers, PDFs are parsed in a
+# process pool with at most `workers` sources in flight ahead of the consumer,
+# each streaming its chunks back in page batches through a bounded queue.
+def parsed_sources(paths: List[str], workers: int = INGEST_WORKERS,
+                   page_batch: int = PAGE_BATCH) -> Iterator[Tuple[str, Iterable[Chunk]]]:
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, iter_source_chunks(path)
+        return
+
+    ctx = mp.get_context()
+    slots = [ctx.Queue(maxsize=PARSE_AHEAD) for _ in range(workers)]
+    free = list(range(workers))
+    remaining = iter(paths)
+    pending: "deque[Tuple[str, int, Future]]" = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_parser, initargs=(slots,)) as pool:
+
+        def submit():
+            path = next(remaining, None)
+            if path is not None:
+                slot = free.pop()
+                pending.append((path, slot, pool.submit(_parse_into_slot, path, slot, page_batch)))
+
+        for _ in range(workers):
+            submit()
+        try:
+            while pending:
+                path, slot, future = pending[0]
+                reader = _read_slot(slots[slot], future)
+                yield path, reader
+                # Whatever the consumer left unread must leave the slot before reuse
+                for _ in reader:
+                    pass
+                pending.popleft()
+                free.append(slot)
+                submit()
+        finally:
+            for _, slot, future in pending:
+                _discard_slot(slots[slot], future)
+
+
+class IndexAppender:
+    # Embeds new chunks in fixed-size batches and appends them to the index, so
+    # only one batch of vectors is in memory at a time. A first build of an
+    # IVF/PQ index holds up to TRAIN_SAMPLE vectors back to train the quantizer.
+
+    def __init__(self, embedder, manifest: Dict, chunks: ChunkStoreWriter, index: Optional[faiss.Index], batch_size: int = EMBED_BATCH):
+        self.embedder = embedder
+        self.manifest = manifest
+        self.chunks = chunks
+        self.index = index
+        self.batch_size = batch_size
+        self.train_target = TRAIN_SAMPLE if INDEX_CONFIG["type"] in ("ivf_flat", "ivf_pq", "flat_int8") else 1
+        self._ids: List[int] = []
+        self._chunks: List[Chunk] = []
+        self._sources: List[str] = []
+        self._held: List[Tuple[np.ndarray, List[int], List[Chunk], List[str]]] = []
+        self.added = 0
+
+    def add(self, chunk_id: int, chunk: Chunk, source: str):
+        self._ids.append(chunk_id)
+        self._chunks.append(chunk)
+        self._sources.append(source)
+        if len(self._ids) >= self.batch_size:
+            self.flush()
+
+    def flush(self, final: bool = False):
+        if self._ids:
+            vectors = np.asarray(self.embedder.encode([c.text for c in self._chunks], batch_size=self.batch_size), dtype="float32")
+            self._held.append((vectors, self._ids, self._chunks, self._sources))
+            self._ids, self._chunks, self._sources = [], [], []
+        if not self._held:
+            return
+        if self.index is None:
+            if sum(len(held[1]) for held in self._held) < self.train_target and not final:
+                return
+            # First ingest trains IVF/PQ/SQ8 quantizers on a sample of the corpus
+            train = np.concatenate([held[0] for held in self._held])
+            self.manifest["dim"] = int(train.shape[1])
+            self.index, self.manifest["index_spec"] = make_index(self.manifest["dim"], train)
+            del train
+        for vectors, ids, chunks, sources in self._held:
+            self.index.add_with_ids(vectors, np.array(ids, dtype="int64"))
+            for chunk_id, chunk, source in zip(ids, chunks, sources):
+                self.chunks.add(chunk_id, chunk.text, source, chunk.page, chunk.start, chunk.tokens, chunk.tags)
+            self.added += len(ids)
+        self._held = []
+
+
+def ingest(embedder, data_dir: str = DATA_DIR, index_dir: str = INDEX_DIR, full: bool = False,
+           workers: int = INGEST_WORKERS, batch_size: int = EMBED_BATCH,
+           checkpoint_every: int = CHECKPOINT_CHUNKS,
+           backend: Optional[str] = None) -> Tuple[ChunkStore, faiss.Index, Dict[str, int]]:
+    with ingest_lock(index_dir):
+        return _ingest(embedder, data_dir, index_dir, full, workers, batch_size, checkpoint_every, backend)
+
+
+# ingest() with the index directory already locked
+def _ingest(embedder, data_dir: str, index_dir: str, full: bool, workers: int, batch_size: int,
+            checkpoint_every: int, backend: Optional[str]) -> Tuple[ChunkStore, faiss.Index, Dict[str, int]]:
+    sources = list_sources(data_dir)
+    state = None if full else load_state(index_dir, mmap=False, backend=backend)
+    if state is None:
+        manifest, store, index = empty_manifest(backend), None, None
+    else:
+        manifest, store, index = state
+    # Kept chunk texts stay on disk; only new ones are appended
+    chunks = ChunkStoreWriter(index_dir, store)
+
+    stats = {"sources_scanned": len(sources), "sources_changed": 0, "added": 0, "removed": 0, "kept": 0, "resumed": 0,
+             "retrained": 0}
+    recorded = manifest["sources"]
+    # Vectors an interrupted run had already scheduled for removal
+    stale_ids: List[int] = manifest.pop("pending_removal", [])
+
+    # Sources that disappeared from data/ drop all of their vectors
+    live_keys = {source_key(p) for p in sources}
+    for key in [k for k in recorded if k not in live_keys]:
+        stale_ids.extend(recorded.pop(key)["chunks"].values())
+        stats["sources_changed"] += 1
+
+    changed = []
+    for path in sources:
+        entry = recorded.get(source_key(path))
+        if source_unchanged(path, entry):
+            stats["kept"] += len(entry["chunks"])
+        else:
+            changed.append(path)
+            stats["resumed"] += bool(entry and entry.get("partial"))
+    stats["sources_changed"] += len(changed)
+
+    appender = IndexAppender(embedder, manifest, chunks, index, batch_size)
+    since_checkpoint = 0
+
+    def checkpoint(key: str, current: Dict[str, int], unseen: List[int]):
+        # A first IVF/PQ/SQ8 build has no index until TRAIN_SAMPLE chunks are
+        # held back for training; there is nothing to save before that
+        if appender.index is None:
+            return
+        # Records the source as partial: a resumed run reuses its embedded chunks
+        appender.flush()
+        recorded[key] = {"sha256": None, "size": None, "mtime": None, "partial": True, "chunks": dict(current)}
+        manifest["pending_removal"] = stale_ids + unseen
+        save_state(manifest, chunks, appender.index, index_dir)
+
+    for path, source_chunks in parsed_sources(changed, workers):
+        key = source_key(path)
+        entry = recorded.get(key)
+        old_chunks = entry["chunks"] if entry else {}
+        current: Dict[str, int] = {}
+        for chunk in source_chunks:
+            h = chunk_hash(chunk.text)
+            if h in current:
+                continue
+            if h in old_chunks:
+                current[h] = old_chunks[h]
+                stats["kept"] += 1
+                continue
+            current[h] = manifest["next_id"]
+            manifest["next_id"] += 1
+            appender.add(current[h], chunk, key)
+            since_checkpoint += 1
+            if since_checkpoint >= checkpoint_every:
+                unseen = [i for h2, i in old_chunks.items() if h2 not in current]
+                checkpoint(key, current, unseen)
+                since_checkpoint = 0
+        stale_ids.extend(i for h, i in old_chunks.items() if h not in current)
+
+        stat = os.stat(path)
+        recorded[key] = {"sha256": file_sha256(path), "size": stat.st_size, "mtime": stat.st_mtime, "chunks": current}
+
+    appender.flush(final=True)
+    index = appender.index
+    stats["added"] = appender.added
+
+    if stale_ids:
+        index = remove_from_index(index, stale_ids, manifest["index_spec"])
+        chunks.remove(stale_ids)
+        stats["removed"] = len(stale_ids)
+
+    if index is None:
+        # Nothing ingested yet; keep an empty index so callers get a valid object
+        manifest["dim"] = embedder.get_sentence_embedding_dimension()
+        manifest["index_spec"] = "Flat"
+        index = faiss.IndexIDMap(faiss.IndexFlatL2(manifest["dim"]))
+    elif fallback_outgrown(manifest, index.ntotal):
+        index, manifest["index_spec"] = rebuild_index(index)
+        stats["retrained"] = 1
+
+    # Checkpoints recorded removals still to do; they are done now
+    manifest.pop("pending_removal", None)
+    if stats["sources_changed"] or state is None or stale_ids or stats["retrained"]:
+        save_state(manifest, chunks, index, index_dir)
+        store = ChunkStore(index_dir, manifest["chunk_store"])
+    chunks.close()
+    return store, index, stats
+
+
+# ------------------- Load -------------------
+# Changes whenever an ingest rewrites the index; used to invalidate answer caches
+def corpus_version(index_dir: str = INDEX_DIR) -> str:
+    try:
+        with open(os.path.join(index_dir, "manifest.json"), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    except OSError:
+        return ""
+
+
+# backend must be the one the embedder was loaded with (None for the default)
+def load_or_ingest_index(embedder, data_dir: str = DATA_DIR, index_dir: str = INDEX_DIR,
+                         backend: Optional[str] = None) -> Tuple[ChunkStore, faiss.Index]:
+    state = load_state(index_dir, backend=backend)
+    if state is not None and sources_match(state[0], list_sources(data_dir)):
+        _, chunks, index = state
+    else:
+        with ingest_lock(index_dir):
+            # Another process may have brought the index up to date while this one waited
+            state = load_state(index_dir, backend=backend)
+            if state is not None and sources_match(state[0], list_sources(data_dir)):
+                _, chunks, index = state
+            else:
+                chunks, index, _ = _ingest(
+                    embedder, data_dir, index_dir, False, INGEST_WORKERS, EMBED_BATCH, CHECKPOINT_CHUNKS, backend
+                )
+    apply_search_params(index)
+    return chunks, index
+
+
+if __name__ == "__main__":
+    from inference_backend import load_embedder
+
+    parser = argparse.ArgumentParser(description="Ingest data/ PDFs into the persistent FAISS index")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--full", action="store_true", help="ignore the existing index and re-embed everything")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="processes parsing PDFs in parallel")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH, help="chunks embedded per batch")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_CHUNKS, help="new chunks between checkpoints")
+    parser.add_argument("--backend", default=None, help="embedding backend (default: RAG_BACKEND)")
+    args = parser.parse_args()
+
+    chunks, index, stats = ingest(
+        load_embedder(args.backend), args.data_dir, args.index_dir, full=args.full,
+        workers=args.workers, batch_size=args.batch_size, checkpoint_every=args.checkpoint_every,
+        backend=args.backend,
+    )
+    print(f"Index now holds {index.ntotal} vectors")
+    print(", ".join(f"{k}={v}" for k, v in stats.items()))
@@ -0,0 +1,213 @@
+# Local HTTP service exposing the RAG engine, so one copy of the embedder,
+# index and QA model serves every Streamlit worker.
+#
+#   python rag_service.py --port 8765
+#   RAG_SERVICE_URL=http://127.0.0.1:8765 streamlit run web.py
+#
+# Endpoints:
+#   GET  /health  -> 200 {"status": "ok", ...} once models are loaded, 503 while loading
+#   POST /ask     -> {"question": "...", "patient_id": "..." (optional)} => {"answer": "..." | null}
+#   GET  /metrics -> Prometheus text: stage latency histograms, cache ratios, load times, queue
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from metrics import REGISTRY
+from query_scheduler import QUERY_WORKERS, QueryScheduler, SchedulerBusy
+from rag_engine import RAGEngine
+
+# ------------------- Configuration -------------------
+HOST = os.environ.get("RAG_SERVICE_HOST", "127.0.0.1")
+PORT = int(os.environ.get("RAG_SERVICE_PORT", "8765"))
+# Requests executing at once; the QA batcher merges their forward passes
+MAX_CONCURRENCY = int(os.environ.get("RAG_MAX_CONCURRENCY", "8"))
+# Requests allowed to wait for a slot before new ones are turned away
+MAX_QUEUE = int(os.environ.get("RAG_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.environ.get("RAG_QUEUE_TIMEOUT", "30"))
+MAX_BODY_BYTES = 64 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def wait_for_workers(scheduler: QueryScheduler, poll: float = 0.5) -> QueryScheduler:
+    while scheduler.state == "loading":
+        time.sleep(poll)
+    if scheduler.state == "error":
+        raise RuntimeError(scheduler.load_error)
+    return scheduler
+
+
+class RAGService:
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT):
+        self.engine: Optional[RAGEngine] = None
+        self.load_error: Optional[str] = None
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.started = time.time()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="rag")
+        self.waiting = 0
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        REGISTRY.add_collector("rag_service", self.collect_metrics)
+
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        try:
+            if QUERY_WORKERS:
+                # Questions run on pinned worker processes instead of one shared engine
+                self.engine = await loop.run_in_executor(self._executor, wait_for_workers, QueryScheduler())
+            else:
+                self.engine = await loop.run_in_executor(self._executor, RAGEngine)
+        except Exception as e:
+            # Keep serving so /health can report why the models are missing
+            self.load_error = f"{type(e).__name__}: {e}"
+
+    # ---- handlers ----
+    def health(self) -> Tuple[int, Dict]:
+        body = {
+            "status": "ok" if self.engine else ("error" if self.load_error else "loading"),
+            "uptime_s": round(time.time() - self.started, 1),
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "served": self.served,
+            "rejected": self.rejected,
+        }
+        if self.load_error:
+            body["error"] = self.load_error
+        if self.engine:
+            body.update(self.engine.stats())
+        return (200 if self.engine else 503), body
+
+    def collect_metrics(self) -> List[Tuple[str, str, Dict[str, str], float]]:
+        return [
+            ("rag_service_ready", "1 once the models are loaded", {}, 1 if self.engine else 0),
+            ("rag_service_in_flight", "Requests currently executing", {}, self.in_flight),
+            ("rag_service_waiting", "Requests waiting for a worker slot", {}, self.waiting),
+            ("rag_service_requests", "Requests by outcome", {"outcome": "served"}, self.served),
+            ("rag_service_requests", "Requests by outcome", {"outcome": "rejected"}, self.rejected),
+        ]
+
+    async def ask(self, payload: Dict) -> Tuple[int, Dict]:
+        question = payload.get("question")
+        if not isinstance(question, str) or not question.strip():
+            return 400, {"error": "'question' must be a non-empty string"}
+        patient_id = payload.get("patient_id")
+        if patient_id is not None and not isinstance(patient_id, str):
+            return 400, {"error": "'patient_id' must be a string"}
+        if self.engine is None:
+            return 503, {"error": "models are still loading"}
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            return 503, {"error": "service overloaded, retry later"}
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return 503, {"error": "timed out waiting for a free worker"}
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            answer = await loop.run_in_executor(self._executor, self.engine.ask, question, patient_id)
+            self.served += 1
+            return 200, {"answer": answer}
+        except SchedulerBusy as e:
+            self.rejected += 1
+            return 503, {"error": str(e)}
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    # ---- HTTP plumbing ----
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, body = await self._dispatch(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            status, body = 500, {"error": str(e)}
+
+        # Plain-text bodies are the metrics exposition; everything else is JSON
+        if isinstance(body, str):
+            data, content_type = body.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(body).encode("utf-8"), "application/json"
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode("ascii") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _dispatch(self, reader: asyncio.StreamReader) -> Tuple[int, Union[Dict, str]]:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        parts = request_line.split()
+        if len(parts) != 3:
+            return 400, {"error": "malformed request line"}
+        method, path = parts[0], parts[1].split("?", 1)[0]
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY_BYTES:
+            return 413, {"error": "request body too large"}
+        raw = await reader.readexactly(length) if length else b""
+
+        if path == "/health":
+            return self.health() if method == "GET" else (405, {"error": "use GET"})
+        if path == "/metrics":
+            return (200, REGISTRY.render()) if method == "GET" else (405, {"error": "use GET"})
+        if path == "/ask":
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            try:
+                payload = json.loads(raw or b"{}")
+            except ValueError:
+                return 400, {"error": "body must be JSON"}
+            if not isinstance(payload, dict):
+                return 400, {"error": "body must be a JSON object"}
+            return await self.ask(payload)
+        return 404, {"error": f"no route for {path}"}
+
+
+async def serve(host: str = HOST, port: int = PORT):
+    service = RAGService()
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"RAG service listening on http://{host}:{port} (loading models...)")
+    # Health answers "loading" while the models come up
+    await service.load()
+    print(f"RAG service failed to load: {service.load_error}" if service.load_error else "RAG service ready")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the RAG engine over local HTTP")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
@@ -0,0 +1,45 @@
+import threading
+from typing import Dict, List, Optional
+
+
+class RAGWarmup:
+    # Owns the in-process RAGEngine for the Streamlit server and builds it off
+    # the request path. Importing this module is cheap: rag_engine (numpy,
+    # faiss, and the model loaders behind it) is imported by the warm-up
+    # thread, so the login, sign-up and password pages never wait on it.
+
+    def __init__(self, backend: Optional[str] = None):
+        self.backend = backend
+        self.engine = None
+        self.error: Optional[str] = None
+        self._thread = threading.Thread(target=self._start, name="rag-warmup", daemon=True)
+        self._thread.start()
+
+    def _start(self):
+        try:
+            from rag_engine import RAGEngine
+            self.engine = RAGEngine(self.backend, background=True)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    # loading | retrieval | ready | error (see RAGEngine.state)
+    @property
+    def state(self) -> str:
+        if self.error:
+            return "error"
+        return self.engine.state if self.engine else "loading"
+
+    @property
+    def load_error(self) -> Optional[str]:
+        return self.error or (self.engine.load_error if self.engine else None)
+
+    def stages(self) -> Dict[str, str]:
+        return dict(self.engine.stages) if self.engine else {}
+
+    def related_passages(self, user_input: str) -> List[str]:
+        self._thread.join()
+        return self.engine.related_passages(user_input)
+
+    def ask(self, user_input: str, patient_id: Optional[str] = None) -> Optional[str]:
+        self._thread.join()
+        return self.engine.ask(user_input, patient_id)
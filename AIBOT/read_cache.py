@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Tuple
+
+from metrics import REGISTRY
+
+MAX_ENTRIES = 512
+
+
+class VersionedCache:
+    # Process-wide memo of store reads. Each entry remembers the store version
+    # it was read at; a lookup first asks the store for its current version
+    # (one indexed MAX() query, about the cost of a stat()) and only re-runs
+    # the read when it moved. Writers in this process also call invalidate(),
+    # while other processes' writes are caught by the version check.
+
+    def __init__(self, name: str, max_entries: int = MAX_ENTRIES):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        _caches.append(self)
+
+    def get(self, key: Hashable, version: Hashable, loader: Callable[[], object]):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+_caches: List[VersionedCache] = []
+
+
+def _collect() -> List[Tuple[str, str, Dict[str, str], float]]:
+    samples = []
+    for cache in _caches:
+        stats = cache.stats()
+        samples.append(("store_read_cache_hit_ratio", "Share of store reads served from the process cache", {"store": cache.name}, stats["hit_ratio"]))
+        for outcome in ("hits", "misses", "invalidations"):
+            samples.append(("store_read_cache_events", "Store read cache lookups and invalidations", {"store": cache.name, "event": outcome}, stats[outcome]))
+    return samples
+
+
+REGISTRY.add_collector("read_cache", _collect)
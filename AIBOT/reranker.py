@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# ------------------- Configuration -------------------
+RERANK_BATCH_SIZE = 32
+CACHE_ENTRIES = 20000
+
+
+class Reranker:
+    # Scores (question, chunk) pairs with a cross-encoder and keeps the best.
+    # Scores are cached per (question, chunk id), so a repeated or re-phrased
+    # query that retrieves overlapping candidates only pays for the new pairs,
+    # and all uncached pairs of a query go through the model as one batch.
+    # Chunk ids are only stable within one corpus version, so the cache is
+    # tagged with it and dropped when it changes; within a version it is an
+    # LRU of max_entries pairs.
+
+    def __init__(self, model, batch_size: int = RERANK_BATCH_SIZE, max_entries: int = CACHE_ENTRIES):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self._scores: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.invalidations = 0
+
+    def score(self, question: str, candidates: List[Tuple[int, str]]) -> List[float]:
+        scores: Dict[int, float] = {}
+        with self._lock:
+            for chunk_id, _ in candidates:
+                key = (question, chunk_id)
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[chunk_id] = self._scores[key]
+            self.hits += len(scores)
+
+        missing = [(chunk_id, text) for chunk_id, text in candidates if chunk_id not in scores]
+        if missing:
+            predicted = self.model.predict(
+                [(question, text) for _, text in missing],
+                batch_size=self.batch_size, show_progress_bar=False,
+            )
+            with self._lock:
+                self.misses += len(missing)
+                self.batches += 1
+                for (chunk_id, _), value in zip(missing, predicted):
+                    scores[chunk_id] = float(value)
+                    self._scores[(question, chunk_id)] = float(value)
+                while len(self._scores) > self.max_entries:
+                    self._scores.popitem(last=False)
+        return [scores[chunk_id] for chunk_id, _ in candidates]
+
+    # Best top_n candidates as (chunk id, score), highest first
+    def rerank(self, question: str, candidates: List[Tuple[int, str]], top_n: int) -> List[Tuple[int, float]]:
+        if not candidates:
+            return []
+        scored = zip((chunk_id for chunk_id, _ in candidates), self.score(question, candidates))
+        return sorted(scored, key=lambda pair: -pair[1])[:top_n]
+
+    # Called whenever the RAG index is (re)loaded; scores for an older corpus are dropped
+    def set_version(self, version: str):
+        with self._lock:
+            if self.version is not None and version != self.version:
+                self._scores.clear()
+                self.invalidations += 1
+            self.version = version
+
+    # Drop cached scores, e.g. after the corpus was re-ingested
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "pair_hits": self.hits,
+                "pair_misses": self.misses,
+                "batches": self.batches,
+                "entries": len(self._scores),
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
@@ -0,0 +1,149 @@
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rag_index import INDEX_DIR
+
+# ------------------- Configuration -------------------
+SPARSE_FILE = "bm25.npz"
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Constant from the original RRF paper; dampens the weight of the very top ranks
+RRF_K = 60
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have i if in is it its my of on or "
+    "that the their there these this to was what when which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower().replace("’", "'")) if t not in STOPWORDS]
+
+
+class BM25Index:
+    # Inverted index over the chunk list in CSR form: the postings of term t are
+    # doc_pos[offsets[t]:offsets[t+1]] with their BM25 weights precomputed, so a
+    # query is a few array slices and one bincount.
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, doc_pos: np.ndarray,
+                 weights: np.ndarray, doc_ids: np.ndarray, version: str = ""):
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.doc_pos = doc_pos
+        self.weights = weights
+        self.doc_ids = doc_ids
+        self.version = version
+
+    @classmethod
+    def build(cls, chunks: Dict[int, str], version: str = "", k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        doc_ids = np.array(sorted(chunks), dtype="int64")
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = np.zeros(len(doc_ids), dtype="float32")
+        for pos, chunk_id in enumerate(doc_ids):
+            tokens = tokenize(chunks[int(chunk_id)])
+            lengths[pos] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((pos, tf))
+
+        n = len(doc_ids)
+        avgdl = float(lengths.mean()) if n else 0.0
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        doc_pos, weights = [], []
+        for t, term in enumerate(terms):
+            entries = postings[term]
+            idf = np.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            pos = np.array([p for p, _ in entries], dtype="int32")
+            tf = np.array([f for _, f in entries], dtype="float32")
+            norm = k1 * (1 - b + b * lengths[pos] / avgdl)
+            doc_pos.append(pos)
+            weights.append((idf * tf * (k1 + 1) / (tf + norm)).astype("float32"))
+            offsets[t + 1] = offsets[t] + len(entries)
+
+        empty_i, empty_f = np.zeros(0, dtype="int32"), np.zeros(0, dtype="float32")
+        return cls(
+            terms, offsets,
+            np.concatenate(doc_pos) if doc_pos else empty_i,
+            np.concatenate(weights) if weights else empty_f,
+            doc_ids, version,
+        )
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        rows = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not rows:
+            return []
+        pos = np.concatenate([self.doc_pos[self.offsets[r]:self.offsets[r + 1]] for r in rows])
+        wts = np.concatenate([self.weights[self.offsets[r]:self.offsets[r + 1]] for r in rows])
+        scores = np.bincount(pos, weights=wts, minlength=len(self.doc_ids))
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(self.doc_ids[p]), float(scores[p])) for p in hits]
+
+    def save(self, index_dir: str = INDEX_DIR):
+        os.makedirs(index_dir, exist_ok=True)
+        terms = sorted(self.vocab, key=self.vocab.get)
+        # np.savez appends .npz unless the name already ends with it
+        tmp = os.path.join(index_dir, SPARSE_FILE + ".tmp.npz")
+        np.savez(tmp, terms=np.array(terms, dtype=str), offsets=self.offsets, doc_pos=self.doc_pos,
+                 weights=self.weights, doc_ids=self.doc_ids, version=np.array(self.version))
+        os.replace(tmp, os.path.join(index_dir, SPARSE_FILE))
+
+    @classmethod
+    def load(cls, index_dir: str = INDEX_DIR) -> Optional["BM25Index"]:
+        path = os.path.join(index_dir, SPARSE_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data["terms"].tolist(), data["offsets"], data["doc_pos"],
+                       data["weights"], data["doc_ids"], str(data["version"]))
+
+
+# Loads the persisted BM25 index, rebuilding it when the chunk list has moved on
+def load_or_build_sparse_index(chunks: Dict[int, str], version: str, index_dir: str = INDEX_DIR) -> BM25Index:
+    index = BM25Index.load(index_dir)
+    if index is not None and version and index.version == version:
+        return index
+    index = BM25Index.build(chunks, version)
+    index.save(index_dir)
+    return index
+
+
+# Reciprocal-rank fusion: each list contributes 1 / (RRF_K + rank) per id
+def rrf_fuse(rankings: List[List[int]], k: int, rrf_k: int = RRF_K) -> List[int]:
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=lambda d: -scores[d])[:k]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from rag_index import corpus_version, load_state
+
+    parser = argparse.ArgumentParser(description="Build the BM25 index for the ingested chunks and try a query")
+    parser.add_argument("query", nargs="?", default="fever")
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    state = load_state(args.index_dir)
+    if state is None:
+        raise SystemExit("No ingested index; run rag_index.py first")
+    _, chunks, _ = state
+    index = load_or_build_sparse_index(chunks, corpus_version(args.index_dir), args.index_dir)
+    start = time.perf_counter()
+    hits = index.search(args.query, args.k)
+    print(f"{len(index.vocab)} terms over {len(index.doc_ids)} chunks; query took "
+          f"{(time.perf_counter() - start) * 1000:.3f} ms")
+    for chunk_id, score in hits:
+        print(f"{chunk_id:>6} {score:6.2f}  {chunks[chunk_id][:100]!r}")
@@ -0,0 +1,135 @@
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from appointment_store import BASE_DIR, DB_FILE, _open, create_schema, get_connection, migration_count
+from read_cache import VersionedCache
+
+# ------------------- Configuration -------------------
+LEGACY_TEXT_FILE = os.path.join(BASE_DIR, "suggestions.txt")
+# SQLite caps bound parameters per statement; bulk lookups are split into batches
+MAX_PARAMS = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suggestions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    file_name TEXT,
+    suggestion TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_suggestions_patient ON suggestions(patient_id, id);
+"""
+
+_init_lock = threading.Lock()
+_initialized = False
+# Suggestions are append-only, so the highest id is the store version
+_read_cache = VersionedCache("suggestions")
+
+
+# Suggestions live next to the appointments in the same SQLite database
+def _connection():
+    global _initialized
+    conn = get_connection()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.executescript(SCHEMA)
+                if os.path.exists(LEGACY_TEXT_FILE):
+                    migrate_from_text(LEGACY_TEXT_FILE, conn)
+                _initialized = True
+    return conn
+
+
+# ------------------- Migration -------------------
+def migrate_from_text(path: str = LEGACY_TEXT_FILE, conn=None) -> int:
+    conn = conn or _connection()
+    rows = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            # Legacy format: "<timestamp>,<patient id>,<file name>,<suggestion>"
+            parts = line.split(",", 3)
+            if len(parts) == 4:
+                ts, pid, fname, sugg = parts
+                rows.append((pid, fname, sugg, ts))
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Checked under the write lock, so concurrent first starts import once
+        if migration_count(conn, "suggestions_migrated") is not None:
+            conn.execute("ROLLBACK")
+            return 0
+        conn.executemany(
+            "INSERT INTO suggestions (patient_id, file_name, suggestion, created_at) VALUES (?, ?, ?, ?)", rows
+        )
+        conn.execute("INSERT INTO meta (key, value) VALUES ('suggestions_migrated', ?)", (str(len(rows)),))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _read_cache.invalidate()
+    return len(rows)
+
+
+# ------------------- Suggestions -------------------
+# A single INSERT, so concurrent doctors never interleave or clobber entries
+def add_suggestion(patient_id: str, file_name: str, suggestion: str) -> int:
+    cursor = _connection().execute(
+        "INSERT INTO suggestions (patient_id, file_name, suggestion, created_at) VALUES (?, ?, ?, ?)",
+        (str(patient_id), file_name, suggestion, str(datetime.now())),
+    )
+    _read_cache.invalidate()
+    return cursor.lastrowid
+
+
+def suggestions_for(patient_id: str) -> List[Dict]:
+    return suggestions_for_many([patient_id]).get(str(patient_id), [])
+
+
+# One indexed lookup for a whole page of appointments
+def suggestions_for_many(patient_ids: Iterable[str]) -> Dict[str, List[Dict]]:
+    ids = list(dict.fromkeys(str(pid) for pid in patient_ids))
+    conn = _connection()
+
+    def load():
+        result: Dict[str, List[Dict]] = {pid: [] for pid in ids}
+        for start in range(0, len(ids), MAX_PARAMS):
+            batch = ids[start:start + MAX_PARAMS]
+            placeholders = ", ".join("?" for _ in batch)
+            rows = conn.execute(
+                f"SELECT patient_id, file_name, suggestion, created_at FROM suggestions "
+                f"WHERE patient_id IN ({placeholders}) ORDER BY id",
+                batch,
+            )
+            for row in rows:
+                result[row["patient_id"]].append(dict(row))
+        return result
+
+    version = conn.execute("SELECT COALESCE(MAX(id), 0) FROM suggestions").fetchone()[0]
+    result = _read_cache.get(("many", tuple(ids)), version, load)
+    return {pid: [dict(s) for s in entries] for pid, entries in result.items()}
+
+
+def cache_stats() -> Dict:
+    return _read_cache.stats()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import suggestions.txt into the SQLite store")
+    parser.add_argument("text_file", nargs="?", default=LEGACY_TEXT_FILE)
+    args = parser.parse_args()
+    # A plain connection: _connection() would auto-import the default file first
+    conn = _open(DB_FILE)
+    create_schema(conn)
+    conn.executescript(SCHEMA)
+    previous = migration_count(conn, "suggestions_migrated")
+    if previous is not None:
+        print(f"{DB_FILE} already holds {previous} imported suggestion(s); nothing to do")
+    else:
+        print(f"Migrated {migrate_from_text(args.text_file, conn)} suggestion(s)")
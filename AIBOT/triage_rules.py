@@ -0,0 +1,166 @@
+import os
+import re
+import json
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+# ------------------- Configuration -------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RULES_FILE = os.path.join(BASE_DIR, "triage_rules.json")
+# Endings a keyword may carry and still count: "coughing", "feverish",
+# "severely", "stressed", "nauseated", "painful", "stomachache". The substring scans this
+# replaced matched all of these; "fluid" for "flu" is still excluded.
+INFLECTIONS = ("s", "es", "d", "ed", "ted", "ing", "ful", "ish", "ly", "y", "ness", "ache", "aches")
+
+
+class Match(NamedTuple):
+    keyword: str
+    kind: str    # "urgency" | "specialist" | "modifier"
+    label: str   # urgency level, specialist name or modifier keyword
+    start: int
+
+
+# Builds a prefix-factored regex from a keyword list ("fever|flu" -> "f(?:ever|lu)").
+# sre tries alternatives one by one, so sharing prefixes keeps the scan fast.
+def trie_pattern(keywords: List[str]) -> str:
+    trie: Dict = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        group = branches[0] if len(branches) == 1 and "" not in node else "(?:" + "|".join(branches) + ")"
+        # Optional groups are greedy, so the longest keyword at a position wins
+        return group + "?" if "" in node else group
+
+    return build(trie)
+
+
+class RuleEngine:
+    # Compiles every triage, modifier and specialist keyword into one regex.
+    # A lookahead over a prefix-factored alternation finds the longest keyword
+    # at every position in a single scan; keywords nested inside a longer match
+    # ("headache" in "severe headache") are added from a table precomputed at
+    # compile time, so every keyword occurrence is reported with its categories.
+
+    def __init__(self, rules: Dict):
+        self.rules = rules
+        self.urgency_rules = rules["urgency"]
+        self.default = rules["default"]
+        self.modifiers = rules.get("modifiers", [])
+        self.min_score, self.max_score = rules.get("score_range", [1, 10])
+        self.specialists = list(rules["specialists"])
+        self.fallback_specialist = rules.get("fallback_specialist", "General Practitioner")
+
+        self.categories: Dict[str, List[Tuple[str, str]]] = {}
+        for rule in self.urgency_rules:
+            for keyword in rule["keywords"]:
+                self._add(keyword, "urgency", rule["level"])
+        for modifier in self.modifiers:
+            self._add(modifier["keyword"], "modifier", modifier["keyword"])
+        for specialist, keywords in rules["specialists"].items():
+            for keyword in keywords:
+                self._add(keyword, "specialist", specialist)
+
+        keywords = sorted(self.categories, key=len, reverse=True)
+        # Inflected forms ("headaches", "coughing") still count, but "flu" no longer matches "fluid"
+        suffixes = trie_pattern(list(INFLECTIONS))
+        self.pattern = re.compile(rf"(?=\b({trie_pattern(keywords)})(?:{suffixes})?\b)") if keywords else None
+        self.nested: Dict[str, List[Tuple[str, int]]] = {}
+        for keyword in keywords:
+            self.nested[keyword] = [
+                (other, m.start())
+                for other in keywords if other != keyword
+                for m in re.finditer(rf"\b{re.escape(other)}\b", keyword)
+            ]
+        # keyword -> itself plus everything nested in it, for the set-only fast path
+        self.closure = {k: frozenset([k] + [other for other, _ in self.nested[k]]) for k in keywords}
+        self.by_kind: Dict[str, Dict[str, List[str]]] = {"urgency": {}, "specialist": {}, "modifier": {}}
+        for keyword, entries in self.categories.items():
+            for kind, label in entries:
+                self.by_kind[kind].setdefault(keyword, []).append(label)
+
+    def _add(self, keyword: str, kind: str, label: str):
+        entries = self.categories.setdefault(keyword.lower(), [])
+        if (kind, label) not in entries:
+            entries.append((kind, label))
+
+    @staticmethod
+    def _prepare(text: str) -> str:
+        return text.lower().replace("’", "'")
+
+    # Every keyword occurrence with its category, in one pass over the text
+    def match(self, text: str) -> List[Match]:
+        if self.pattern is None:
+            return []
+        found = []
+        seen = set()
+        for m in self.pattern.finditer(self._prepare(text)):
+            keyword, start = m.group(1), m.start()
+            for kw, offset in [(keyword, 0)] + self.nested[keyword]:
+                if (kw, start + offset) in seen:
+                    continue
+                seen.add((kw, start + offset))
+                for kind, label in self.categories[kw]:
+                    found.append(Match(kw, kind, label, start + offset))
+        return found
+
+    # Distinct keywords present in the text; the regex scan and set building
+    # both stay in C, which is all triage() and specialist() need
+    def keywords_in(self, text: str) -> FrozenSet[str]:
+        if self.pattern is None:
+            return frozenset()
+        found = set(self.pattern.findall(self._prepare(text)))
+        return frozenset().union(*(self.closure[k] for k in found))
+
+    def _labels(self, kind: str, keywords: FrozenSet[str]) -> List[str]:
+        table = self.by_kind[kind]
+        return [label for k in keywords if k in table for label in table[k]]
+
+    # Same result shape as the original analyze_symptoms_offline()
+    def triage(self, symptoms: str, keywords: Optional[FrozenSet[str]] = None) -> Dict[str, str]:
+        if keywords is None:
+            keywords = self.keywords_in(symptoms)
+        levels = set(self._labels("urgency", keywords))
+        modifiers = set(self._labels("modifier", keywords))
+
+        rule = next((r for r in self.urgency_rules if r["level"] in levels), self.default)
+        urgency_score = rule["score"]
+        for modifier in self.modifiers:
+            if modifier["keyword"] in modifiers:
+                urgency_score = min(max(urgency_score + modifier["adjust"], self.min_score), self.max_score)
+
+        key_symptoms = symptoms[:50] + "..." if len(symptoms) > 50 else symptoms
+        return {
+            "urgency_score": str(urgency_score),
+            "time_recommendation": rule["time_recommendation"],
+            "key_symptoms": key_symptoms,
+            "notes": f"{rule['notes']} (AI-powered assessment)",
+        }
+
+    # Specialist with the most distinct keyword hits; ties go to the earlier rule
+    def specialist(self, symptoms: str, keywords: Optional[FrozenSet[str]] = None) -> str:
+        if keywords is None:
+            keywords = self.keywords_in(symptoms)
+        hits = Counter(self._labels("specialist", keywords))
+        if not hits:
+            return self.fallback_specialist
+        best = max(self.specialists, key=lambda s: hits[s])
+        return best.capitalize()
+
+
+def load_rules(path: str = RULES_FILE) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Compiled once per process; call get_rule_engine.cache_clear() after editing the rules file
+@lru_cache(maxsize=None)
+def get_rule_engine(path: str = RULES_FILE) -> RuleEngine:
+    return RuleEngine(load_rules(path))
@@ -0,0 +1,168 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from appointment_store import BASE_DIR, get_connection
+from read_cache import VersionedCache
+
+# ------------------- Configuration -------------------
+# Legacy layout: uploads/<patient id>/<timestamp>_<name>, one full copy per upload
+UPLOAD_DIR = os.environ.get("RAG_UPLOAD_DIR", os.path.join(BASE_DIR, "uploads"))
+# Content-addressed bodies: uploads/.objects/<sha256[:2]>/<sha256>
+OBJECT_DIR = os.path.join(UPLOAD_DIR, ".objects")
+# Uploads and downloads move through memory this many bytes at a time
+CHUNK_BYTES = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mime TEXT,
+    uploaded_at TEXT NOT NULL,
+    UNIQUE (patient_id, sha256)
+);
+CREATE INDEX IF NOT EXISTS idx_uploads_patient ON uploads(patient_id, id);
+"""
+
+_init_lock = threading.Lock()
+_initialized = False
+# Upload rows are only ever inserted, so the highest id is the store version
+_read_cache = VersionedCache("uploads")
+
+
+# Upload metadata lives next to the appointments in the same SQLite database
+def _connection():
+    global _initialized
+    conn = get_connection()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.executescript(SCHEMA)
+                migrate_legacy_folders(conn=conn)
+                _initialized = True
+    return conn
+
+
+def object_path(sha256: str) -> str:
+    return os.path.join(OBJECT_DIR, sha256[:2], sha256)
+
+
+# ------------------- Writing -------------------
+# Streams a file object into the object store while hashing it. The body lands
+# in a temp file first and is renamed into place, so a reader never sees a
+# partial object; if the content is already stored the temp file is dropped.
+def _store_object(stream: BinaryIO) -> Tuple[str, int]:
+    os.makedirs(OBJECT_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=OBJECT_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for block in iter(lambda: stream.read(CHUNK_BYTES), b""):
+                digest.update(block)
+                out.write(block)
+                size += len(block)
+        sha256 = digest.hexdigest()
+        path = object_path(sha256)
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return sha256, size
+
+
+def _insert(conn, patient_id: str, file_name: str, sha256: str, size: int, mime: Optional[str], uploaded_at: str) -> Tuple[Dict, bool]:
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO uploads (patient_id, file_name, sha256, size, mime, uploaded_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (str(patient_id), file_name, sha256, size, mime, uploaded_at),
+    )
+    row = conn.execute(
+        "SELECT * FROM uploads WHERE patient_id = ? AND sha256 = ?", (str(patient_id), sha256)
+    ).fetchone()
+    return dict(row), cursor.rowcount == 1
+
+
+# Saves an upload for a patient. Returns the upload record and whether it is
+# new; re-uploading a file the patient already has returns the existing record.
+def save_upload(patient_id: str, stream: BinaryIO, name: str, mime: Optional[str] = None) -> Tuple[Dict, bool]:
+    if hasattr(stream, "seek"):
+        stream.seek(0)
+    sha256, size = _store_object(stream)
+    file_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{name}"
+    mime = mime or mimetypes.guess_type(name)[0]
+    record, created = _insert(_connection(), patient_id, file_name, sha256, size, mime, str(datetime.now()))
+    if created:
+        _read_cache.invalidate()
+    return record, created
+
+
+# ------------------- Reading -------------------
+# Metadata only; listing a patient's files never opens their bodies
+def list_uploads(patient_id: str) -> List[Dict]:
+    conn = _connection()
+
+    def load():
+        rows = conn.execute("SELECT * FROM uploads WHERE patient_id = ? ORDER BY id", (str(patient_id),))
+        return [dict(row) for row in rows]
+
+    version = conn.execute("SELECT COALESCE(MAX(id), 0) FROM uploads").fetchone()[0]
+    return [dict(row) for row in _read_cache.get(("list", str(patient_id)), version, load)]
+
+
+def get_upload(upload_id: int) -> Optional[Dict]:
+    row = _connection().execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def open_upload(upload: Dict) -> BinaryIO:
+    return open(object_path(upload["sha256"]), "rb")
+
+
+def iter_upload(upload: Dict, chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    with open_upload(upload) as f:
+        yield from iter(lambda: f.read(chunk_bytes), b"")
+
+
+# ------------------- Migration -------------------
+# Moves files from the per-patient folders into the object store. Files keep
+# their stored names, which is what existing suggestions refer to.
+def migrate_legacy_folders(upload_dir: str = UPLOAD_DIR, conn=None) -> int:
+    conn = conn or _connection()
+    if not os.path.isdir(upload_dir):
+        return 0
+    migrated = 0
+    for patient_id in sorted(os.listdir(upload_dir)):
+        folder = os.path.join(upload_dir, patient_id)
+        if patient_id.startswith(".") or not os.path.isdir(folder):
+            continue
+        for file_name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, file_name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                sha256, size = _store_object(f)
+            uploaded_at = str(datetime.fromtimestamp(os.path.getmtime(path)))
+            _, created = _insert(conn, patient_id, file_name, sha256, size, mimetypes.guess_type(file_name)[0], uploaded_at)
+            migrated += created
+            os.remove(path)
+        if not os.listdir(folder):
+            os.rmdir(folder)
+    if migrated:
+        _read_cache.invalidate()
+    return migrated
+
+
+def cache_stats() -> Dict:
+    return _read_cache.stats()
@@ -3,15 +3,12 @@ import os
 import re
 import json
 import difflib
-import faiss
-import pickle
-import numpy as np
-from transformers import pipeline
-from sentence_transformers import SentenceTransformer
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from util import validate_login, register_user, change_password
+from rag_client import SERVICE_URL, RAGClient, RAGServiceError
+from metrics import span, start_metrics_server
+from rag_warmup import RAGWarmup
+from query_scheduler import QUERY_WORKERS, QueryScheduler, SchedulerBusy
 
 # Load style
 if os.path.exists("style.css"):
@@ -27,67 +24,28 @@ if "logged_in" not in st.session_state:
 if "patient_id" not in st.session_state:
     st.session_state.patient_id = ""
 
-# Load RAG components
+# RAG core: the shared rag_service.py when RAG_SERVICE_URL is set, a pool of pinned
+# model worker processes when RAG_QUERY_WORKERS is set, else an in-process engine
+# warming up in the background from the first page load of the server
 @st.cache_resource
 def load_rag():
-    loader = PyPDFLoader("data/Symptom_Disease_Specialist_Summary.pdf")
-    documents = loader.load()
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = splitter.split_documents(documents)
-    texts = [chunk.page_content for chunk in chunks]
-
-    # Debug print
-    print(f"Total chunks loaded: {len(texts)}")
-    for i, chunk in enumerate(texts[:5]):
-        print(f"Chunk {i} →", chunk[:300])
-
-    # Check if 'fever' appears
-    fever_chunks = [c for c in texts if "fever" in c.lower()]
-    print("Fever found in chunks:", len(fever_chunks))
-    if fever_chunks:
-        print(fever_chunks[0][:300])
-
-    embedder = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = embedder.encode(texts)
-    index = faiss.IndexFlatL2(embeddings[0].shape[0])
-    index.add(embeddings)
-
-    qa_pipeline = pipeline("question-answering", model="deepset/roberta-base-squad2")
-    return texts, index, embedder, qa_pipeline
-
-chunks, index, embedder, qa_pipeline = load_rag()
-
-# Normalize vague or user-friendly questions to structured ones
-def normalize_question(user_input):
-    if "i have" in user_input.lower():
-        # Try to normalize advice-seeking to condition-query
-        symptom = user_input.lower().replace("what can i do if i have ", "").replace("?", "").strip()
-        return f"What are the possible conditions related to {symptom}?"
-    return user_input
-
-# QA function using Hugging Face + RAG
-# QA function using Hugging Face + RAG
-def answer_with_llm(symptom):
-    query_embedding = embedder.encode([symptom])
-    D, I = index.search(np.array(query_embedding), k=3)
-    top_chunks = [chunks[i] for i in I[0]]
-
-    print("Top chunks returned by FAISS:")
-    for chunk in top_chunks:
-        print(chunk[:300])
-    
-    answers = []
-    for context in top_chunks:
-        result = qa_pipeline(question=symptom, context=context)
-        print("LLM Raw Output:", result)  # 🧠 See the raw answer even if it's filtered
-
-        if result["score"] > 0.1:  # 🔽 Lowered threshold to allow more answers
-            answers.append((result["answer"], result["score"]))
-
-    if answers:
-        best = max(answers, key=lambda x: x[1])
-        return best[0]
-    return None
+    # No-op unless RAG_METRICS_PORT is set
+    start_metrics_server()
+    if SERVICE_URL:
+        return RAGClient(SERVICE_URL)
+    if QUERY_WORKERS:
+        return QueryScheduler()
+    return RAGWarmup()
+
+rag = load_rag()
+
+LOADING_LABELS = {
+    "embedder": "embedding model",
+    "dense_index": "vector index",
+    "sparse_index": "keyword index",
+    "reranker": "reranker",
+    "qa": "answer model",
+}
 
 # Login UI
 if not st.session_state.logged_in:
@@ -148,16 +106,45 @@ else:
         st.session_state.patient_id = ""
         st.rerun()
 
+    if rag.state == "error":
+        st.error(f"❌ Chatbot failed to load: {rag.load_error}")
+        st.stop()
+    if rag.state != "ready":
+        stages = rag.stages()
+        done = sum(state == "ready" for state in stages.values())
+        pending = [LOADING_LABELS.get(stage, stage) for stage, state in stages.items() if state != "ready"]
+        st.progress(done / max(len(stages), 1), text="⏳ Loading medical knowledge base: " + (", ".join(pending) or "starting"))
+        st.button("Refresh status")
+
     user_input = st.text_input("Enter your symptom or question:")
 
-    if user_input:
+    if user_input and rag.state == "retrieval":
+        # Search works before the answer model is up; show the closest passages meanwhile
+        st.info("The answer model is still loading. Most relevant passages so far:")
+        try:
+            passages = rag.related_passages(user_input)
+        except SchedulerBusy as e:
+            st.warning(f"⏳ {e}")
+            st.stop()
+        for passage in passages:
+            st.markdown(f"> {passage[:500]}")
+    elif user_input and rag.state == "loading":
+        st.info("Still loading, please try again in a moment.")
+    elif user_input:
         with st.spinner("Analyzing with LLM..."):
-            question = normalize_question(user_input)
-            response = answer_with_llm(question)
-            if response:
-                st.success(f"💡 LLM Suggestion: {response}")
-                if st.button("Book Appointment"):
-                    st.session_state.symptom_to_forward = user_input
-                    st.switch_page("pages/main.py")
-            else:
-                st.warning("No relevant information found.")
+            try:
+                response = rag.ask(user_input, st.session_state.patient_id)
+            except RAGServiceError as e:
+                st.error(f"❌ Chatbot service unavailable: {e}")
+                st.stop()
+            except SchedulerBusy as e:
+                st.warning(f"⏳ {e}")
+                st.stop()
+            with span("render"):
+                if response:
+                    st.success(f"💡 LLM Suggestion: {response}")
+                    if st.button("Book Appointment"):
+                        st.session_state.symptom_to_forward = user_input
+                        st.switch_page("pages/main.py")
+                else:
+                    st.warning("No relevant information found.")